@@ -13,9 +13,9 @@ class AIDialog(AIProvider):
     _model: str
     messages: List[Message]
 
-    def __init__(self, model):
+    def __init__(self, model, cached: bool = False):
         self._model = model
-        self._provider = get_ai_provider(model)
+        self._provider = get_ai_provider(model, cached=cached)
 
     async def prompt(self, context: str, role='user', *args, **kwargs) -> AIResponse:
         message = Message(role=role, content=context)
@@ -38,9 +38,22 @@ class AIDialog(AIProvider):
     def context_size(self) -> int:
         return self._provider.context_size
 
+    @property
+    def max_output_tokens(self) -> int:
+        return self._provider.max_output_tokens
+
     def calculate_tokens(self, text: str) -> int:
         return self._provider.calculate_tokens(text)
 
+    def calculate_tokens_batch(self, texts: List[str]) -> List[int]:
+        return self._provider.calculate_tokens_batch(texts)
+
+    async def accept_response(self, response: AIResponse):
+        await self._provider.accept_response(response)
+
+    async def reject_response(self, response: AIResponse):
+        await self._provider.reject_response(response)
+
     async def get_response(self, messages: List[Message], max_tokens=1024, json_format: bool = False) -> AIResponse:
         return await self._provider.get_response(messages, max_tokens, json_format)
 
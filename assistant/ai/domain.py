@@ -1,5 +1,6 @@
+from contextlib import aclosing
 from dataclasses import dataclass
-from typing import Union, Dict, TypedDict
+from typing import Union, Dict, TypedDict, AsyncGenerator
 
 
 @dataclass
@@ -13,6 +14,34 @@ class AIResponse:
         return self.usage['model'] if self.usage else None
 
 
+@dataclass
+class AIResponseDelta:
+    """
+    Part of a streamed text response. The last delta of a stream has `done` set
+    and carries the usage of the whole response.
+    """
+    text: str = ''
+    usage: Dict = None
+    length_limited: bool = False
+    done: bool = False
+
+
+async def collect_response(stream: AsyncGenerator[AIResponseDelta, None]) -> AIResponse:
+    """
+    Join the streamed deltas into the complete response.
+    The stream is closed on failure or cancellation, releasing the provider's concurrency slot.
+    """
+    parts = []
+    usage = None
+    length_limited = False
+    async with aclosing(stream):
+        async for delta in stream:
+            parts.append(delta.text)
+            usage = delta.usage or usage
+            length_limited = length_limited or delta.length_limited
+    return AIResponse(result=''.join(parts).strip(), usage=usage, length_limited=length_limited)
+
+
 class Message(TypedDict):
     role: str
     content: str
@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import os
+import threading
+from typing import List, Tuple, Dict, Optional, Set
+
+from django.conf import settings
+
+from assistant.ai.providers.base import AIEmbedder
+
+logger = logging.getLogger(__name__)
+
+
+class BatchingEmbedder(AIEmbedder):
+    """
+    Coalesces the concurrent embedding requests: the texts requested within `max_delay` seconds
+    (up to `max_batch_size` of them) are embedded by one call of the underlying embedder,
+    and every caller gets its own embeddings. Must be used from one event loop.
+    """
+
+    def __init__(self, embedder: AIEmbedder, max_delay: float = 0.005, max_batch_size: int = 64):
+        self._embedder = embedder
+        self._max_delay = max_delay
+        self._max_batch_size = max_batch_size
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def embeddings(self, input: List[str]) -> List[List[float]]:
+        if not input:
+            return []
+        loop = asyncio.get_running_loop()
+        futures = []
+        for text in input:
+            future = loop.create_future()
+            self._pending.append((text, future))
+            futures.append(future)
+
+        if len(self._pending) >= self._max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self._max_delay, self._flush)
+        return list(await asyncio.gather(*futures))
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        while self._pending:
+            batch = self._pending[:self._max_batch_size]
+            self._pending = self._pending[self._max_batch_size:]
+            task = asyncio.ensure_future(self._embed_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _embed_batch(self, batch: List[Tuple[str, asyncio.Future]]):
+        batch = [(text, future) for text, future in batch if not future.done()]
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        if not texts:
+            return
+        logger.debug(f'Embedding batch of {len(texts)} texts for {len(batch)} requests')
+        try:
+            embeddings = await self._embedder.embeddings(texts)
+            if len(embeddings) != len(texts):
+                raise ValueError(f'Embedder returned {len(embeddings)} embeddings for {len(texts)} texts')
+            embeddings_by_text = dict(zip(texts, embeddings))
+            for text, future in batch:
+                if not future.done():
+                    future.set_result(embeddings_by_text[text])
+        except Exception as e:
+            # The callers wait for their futures, none of them may be left pending
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        except BaseException:
+            for _, future in batch:
+                future.cancel()
+            raise
+
+
+class ThreadedBatchingEmbedder(AIEmbedder):
+    """
+    Hands the requests of any event loop over to the `BatchingEmbedder` of the model running in `loop`,
+    so the requests of the short-lived loops (e.g. one per Celery task run by `async_to_sync`) are coalesced too.
+    """
+
+    def __init__(self, model: str, loop: asyncio.AbstractEventLoop):
+        self._model = model
+        self._loop = loop
+
+    async def embeddings(self, input: List[str]) -> List[List[float]]:
+        if not input:
+            return []
+        # Cancelling the caller cancels the request in the batching loop as well
+        future = asyncio.run_coroutine_threadsafe(self._embed(input), self._loop)
+        return await asyncio.wrap_future(future)
+
+    async def _embed(self, input: List[str]) -> List[List[float]]:
+        from assistant.ai.services.ai_service import get_ai_embdedder
+
+        # Only the batching loop thread gets here, and the embedder's API client is bound to that loop
+        embedder = _batching_embedders.get(self._model)
+        if embedder is None:
+            embedder = _batching_embedders[self._model] = BatchingEmbedder(
+                get_ai_embdedder(self._model),
+                max_delay=getattr(settings, 'EMBEDDING_BATCH_DELAY_MS', 5) / 1000,
+                max_batch_size=getattr(settings, 'EMBEDDING_BATCH_MAX_SIZE', 64),
+            )
+        return await embedder.embeddings(input)
+
+
+_batching_embedders: Dict[str, BatchingEmbedder] = {}
+_batching_loop: Optional[asyncio.AbstractEventLoop] = None
+_batching_loop_pid: Optional[int] = None
+_lock = threading.Lock()
+
+
+def get_batching_loop() -> asyncio.AbstractEventLoop:
+    """
+    Get the event loop of the process running the batching embedders in a daemon thread.
+    """
+    global _batching_loop, _batching_loop_pid
+    with _lock:
+        # A forked worker inherits the loop but not its thread
+        if _batching_loop is None or _batching_loop_pid != os.getpid():
+            _batching_embedders.clear()
+            _batching_loop = asyncio.new_event_loop()
+            _batching_loop_pid = os.getpid()
+            threading.Thread(target=_batching_loop.run_forever, name='embeddings-batching', daemon=True).start()
+    return _batching_loop
+
+
+def get_batching_embedder(model: str) -> AIEmbedder:
+    """
+    Get the batching embedder of the model shared by all the event loops of the process
+    (`EMBEDDING_BATCH_DELAY_MS` and `EMBEDDING_BATCH_MAX_SIZE` settings).
+    """
+    return ThreadedBatchingEmbedder(model, get_batching_loop())
@@ -0,0 +1,93 @@
+import hashlib
+import logging
+from functools import lru_cache
+from typing import List, Callable, Optional
+
+import numpy as np
+from django.conf import settings
+
+from assistant.ai.providers.base import AIEmbedder
+from assistant.utils.cache import TieredCache, get_shared_store
+
+logger = logging.getLogger(__name__)
+
+
+def _dumps_embedding(embedding: List[float]) -> bytes:
+    return np.asarray(embedding, dtype=np.float32).tobytes()
+
+
+def _loads_embedding(data: bytes) -> List[float]:
+    return np.frombuffer(data, dtype=np.float32).tolist()
+
+
+@lru_cache
+def get_embedding_cache() -> TieredCache:
+    """
+    Get the process-wide embeddings cache configured by the `EMBEDDING_CACHE_*` settings.
+    """
+    return TieredCache(
+        namespace='embedding',
+        maxsize=getattr(settings, 'EMBEDDING_CACHE_SIZE', 10000),
+        ttl=getattr(settings, 'EMBEDDING_CACHE_TTL', 24 * 60 * 60),
+        shared_store=get_shared_store(getattr(settings, 'EMBEDDING_CACHE_URL', None)),
+        dumps=_dumps_embedding,
+        loads=_loads_embedding,
+    )
+
+
+class CachedEmbedder(AIEmbedder):
+    """
+    Memoizes the embeddings of a model by the normalized text.
+    The underlying embedder is only created and called for the texts missing in the cache.
+    """
+
+    def __init__(
+            self,
+            model: str,
+            cache: TieredCache = None,
+            embedder_factory: Callable[[str], AIEmbedder] = None,
+    ):
+        self._model = model
+        self._cache = cache or get_embedding_cache()
+        if embedder_factory is None:
+            from assistant.ai.services.ai_service import get_ai_embdedder
+            embedder_factory = get_ai_embdedder
+        self._embedder_factory = embedder_factory
+        self._embedder: Optional[AIEmbedder] = None
+
+    @property
+    def stats(self):
+        return self._cache.stats
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return ' '.join(text.split()).lower()
+
+    def cache_key(self, text: str) -> str:
+        digest = hashlib.sha1(self.normalize(text).encode('utf-8')).hexdigest()
+        return f'{self._model}:{digest}'
+
+    async def embeddings(self, input: List[str]) -> List[List[float]]:
+        keys = [self.cache_key(text) for text in input]
+        result = [await self._cache.get(key) for key in keys]
+
+        missing = {}
+        for key, text, embedding in zip(keys, input, result):
+            if embedding is None and key not in missing:
+                missing[key] = text
+
+        if missing:
+            if self._embedder is None:
+                self._embedder = self._embedder_factory(self._model)
+            embeddings = await self._embedder.embeddings(list(missing.values()))
+            computed = dict(zip(missing.keys(), embeddings))
+            for key, embedding in computed.items():
+                await self._cache.set(key, embedding)
+            result = [
+                embedding if embedding is not None else computed[key]
+                for key, embedding in zip(keys, result)
+            ]
+
+        logger.debug(f'Embeddings cache: {len(input) - len(missing)} hits, {len(missing)} misses, '
+                     f'total {self._cache.stats.to_dict()}')
+        return result
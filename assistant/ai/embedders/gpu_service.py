@@ -1,8 +1,8 @@
 from typing import List
 
-import aiohttp
-
 from assistant.ai.providers.base import AIEmbedder
+from assistant.ai.utils.http import get_http_session
+from assistant.utils.bulkhead import get_bulkhead
 
 
 class GPUServiceEmbedder(AIEmbedder):
@@ -12,22 +12,17 @@ class GPUServiceEmbedder(AIEmbedder):
         self._model = model
 
     async def embeddings(self, input: List[str]) -> List[List[float]]:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{self._base_url}/embeddings/",
-                json={
-                    "model": self._model,
-                    "texts": input
-                },
-            ) as response:
-                if response.status != 200:
-                    raise Exception(f"Failed to get embeddings. "
-                                    f"Got status code {response.status} from GPU Service with message {await response.text()}")
-                response_data = await response.json()
-                embeddings = response_data['embeddings']
-                return embeddings
-
-
-
-
-
+        session = get_http_session()
+        async with get_bulkhead('gpu_service', self._base_url), session.post(
+            f"{self._base_url}/embeddings/",
+            json={
+                "model": self._model,
+                "texts": input
+            },
+        ) as response:
+            if response.status != 200:
+                raise Exception(f"Failed to get embeddings. "
+                                f"Got status code {response.status} from GPU Service with message {await response.text()}")
+            response_data = await response.json()
+            embeddings = response_data['embeddings']
+            return embeddings
@@ -1,22 +1,93 @@
-from typing import List
+import asyncio
+import logging
+from typing import List, Awaitable, Callable, TypeVar
 
-from ollama import AsyncClient
+import httpx
+from django.conf import settings
+from ollama import AsyncClient, ResponseError
 
 from assistant.ai.providers.base import AIEmbedder
+from assistant.utils.bulkhead import get_bulkhead
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
 
 
 class OllamaEmbedder(AIEmbedder):
+    """
+    Embeds the texts by chunks of `OLLAMA_EMBED_BATCH_SIZE` with the batch `/api/embed` endpoint,
+    at most `OLLAMA_EMBED_CONCURRENCY` requests at once. Servers without the batch endpoint (before 0.3)
+    are called once per text instead. Failed requests are retried `OLLAMA_EMBED_RETRIES` times.
+    """
 
-    def __init__(self, host: str, model: str):
+    def __init__(
+            self,
+            host: str,
+            model: str,
+            batch_size: int = None,
+            concurrency: int = None,
+            retries: int = None,
+            client: AsyncClient = None,
+    ):
         self._model = model
-        self._client = AsyncClient(
+        self._host = host
+        self._client = client or AsyncClient(
             host=host
         )
+        self._batch_size = batch_size or getattr(settings, 'OLLAMA_EMBED_BATCH_SIZE', 32)
+        self._concurrency = concurrency or getattr(settings, 'OLLAMA_EMBED_CONCURRENCY', 4)
+        self._retries = retries if retries is not None else getattr(settings, 'OLLAMA_EMBED_RETRIES', 2)
+        self._batch_supported = True
 
     async def embeddings(self, input: List[str]) -> List[List[float]]:
-        result = []
-        for text in input:
-            response = await self._client.embeddings(model=self._model, prompt=text)
-            embeding = response['embedding']
-            result.append(embeding)
-        return result
+        if not input:
+            return []
+        semaphore = asyncio.Semaphore(self._concurrency)
+        chunks = [input[i:i + self._batch_size] for i in range(0, len(input), self._batch_size)]
+        results = await asyncio.gather(*[self._embed_chunk(chunk, semaphore) for chunk in chunks])
+        return [embedding for result in results for embedding in result]
+
+    async def _embed_chunk(self, texts: List[str], semaphore: asyncio.Semaphore) -> List[List[float]]:
+        if self._batch_supported:
+            try:
+                async with semaphore, get_bulkhead('ollama', self._host):
+                    response = await self._with_retries(lambda: self._client.embed(model=self._model, input=texts))
+                return response['embeddings']
+            except ResponseError as e:
+                if e.status_code != 404:
+                    raise
+                # Either the server has no batch endpoint or the model is missing, the single text endpoint tells
+                result = await self._embed_one_by_one(texts, semaphore)
+                if self._batch_supported:
+                    logger.warning(f'Ollama server has no batch embed endpoint, embedding one text per request')
+                    self._batch_supported = False
+                return result
+        return await self._embed_one_by_one(texts, semaphore)
+
+    async def _embed_one_by_one(self, texts: List[str], semaphore: asyncio.Semaphore) -> List[List[float]]:
+        async def embed(text: str) -> List[float]:
+            async with semaphore, get_bulkhead('ollama', self._host):
+                response = await self._with_retries(lambda: self._client.embeddings(model=self._model, prompt=text))
+            return response['embedding']
+
+        return list(await asyncio.gather(*[embed(text) for text in texts]))
+
+    async def _with_retries(self, call: Callable[[], Awaitable[T]]) -> T:
+        attempt = 0
+        while True:
+            try:
+                return await call()
+            except (ResponseError, httpx.TransportError) as e:
+                if attempt >= self._retries or not _is_retryable(e):
+                    raise
+                attempt += 1
+                delay = 0.5 * 2 ** (attempt - 1)
+                logger.warning(f'Ollama embed request failed ({e}), retry {attempt} in {delay} s')
+                await asyncio.sleep(delay)
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, ResponseError):
+        return error.status_code >= 500 or error.status_code == 429
+    return True
@@ -7,9 +7,9 @@ from assistant.ai.providers.base import AIEmbedder
 
 class ChatGPTEmbedder(AIEmbedder):
 
-    def __init__(self, model: str, api_key: str):
+    def __init__(self, model: str, api_key: str, client: AsyncOpenAI = None):
         self._model = model
-        self._client = AsyncOpenAI(
+        self._client = client or AsyncOpenAI(
             api_key=api_key
         )
 
@@ -1,29 +1,70 @@
+import logging
+import os
+
 import torch
 from typing import List
 from transformers import AutoTokenizer, AutoModel
 from assistant.ai.providers.base import AIEmbedder
 from assistant.ai.utils.transformers import get_torch_device
 
+logger = logging.getLogger(__name__)
+
 
 class TransformersEmbedder(AIEmbedder):
-    def __init__(self, model_name: str, local_files_only: bool = True):
+    """
+    Mean pooled embeddings of a Hugging Face encoder, computed by batches.
+
+    The texts are sorted by their token length, so every batch is padded to the length of similar texts,
+    and the padding positions are excluded from the pooling with the attention mask.
+    The batch size and the number of the CPU threads come from the `TRANSFORMERS_EMBED_BATCH_SIZE`
+    and `TRANSFORMERS_NUM_THREADS` environment variables unless given.
+    """
+
+    def __init__(
+            self,
+            model_name: str,
+            local_files_only: bool = True,
+            batch_size: int = None,
+            num_threads: int = None,
+    ):
         self._model_name = model_name
         self._tokenizer = AutoTokenizer.from_pretrained(model_name, local_files_only=local_files_only)
         self._device = get_torch_device()
         self._model = AutoModel.from_pretrained(model_name, local_files_only=local_files_only).to(self._device)
+        self._model.eval()
+        self._batch_size = batch_size or int(os.getenv('TRANSFORMERS_EMBED_BATCH_SIZE', 32))
+
+        num_threads = num_threads or int(os.getenv('TRANSFORMERS_NUM_THREADS', 0))
+        if num_threads:
+            # Process-wide, affects the CPU inference only
+            torch.set_num_threads(num_threads)
+            logger.info(f'Torch uses {num_threads} CPU threads')
 
     async def embeddings(self, input: List[str]) -> List[List[float]]:
-        result = []
-        for text in input:
-            inputs = self._tokenizer(text, return_tensors="pt").to(self._device)
+        if not input:
+            return []
+
+        encoded = self._tokenizer(list(input), truncation=True)
+        order = sorted(range(len(input)), key=lambda i: len(encoded['input_ids'][i]))
 
-            # Get embeddings
-            with torch.no_grad():
-                outputs = self._model(**inputs)
+        result = [None] * len(input)
+        for start in range(0, len(order), self._batch_size):
+            batch_indices = order[start:start + self._batch_size]
+            batch = self._tokenizer.pad(
+                {key: [encoded[key][i] for i in batch_indices] for key in encoded.keys()},
+                return_tensors="pt",
+            ).to(self._device)
 
-            # Extract the embeddings and average them
-            embeddings = outputs.last_hidden_state.mean(dim=1).squeeze().tolist()
+            with torch.inference_mode():
+                outputs = self._model(**batch)
+                embeddings = self._mean_pooling(outputs.last_hidden_state, batch['attention_mask'])
 
-            result.append(embeddings)
+            for i, embedding in zip(batch_indices, embeddings.float().cpu().tolist()):
+                result[i] = embedding
 
         return result
+
+    @staticmethod
+    def _mean_pooling(last_hidden_state: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+        mask = attention_mask.unsqueeze(-1).to(last_hidden_state.dtype)
+        return (last_hidden_state * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
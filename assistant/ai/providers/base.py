@@ -1,7 +1,7 @@
 from abc import ABC, abstractmethod
-from typing import List
+from typing import List, AsyncIterator
 
-from assistant.ai.domain import AIResponse, Message
+from assistant.ai.domain import AIResponse, AIResponseDelta, Message
 from assistant.utils.debug import TimeDebugger
 
 
@@ -15,6 +15,13 @@ class AIProvider(ABC):
         """
         pass
 
+    @property
+    def max_output_tokens(self) -> int:
+        """
+        Get the maximum number of tokens the AI model can generate.
+        """
+        return 4096
+
     @abstractmethod
     def calculate_tokens(self, text: str) -> int:
         """
@@ -22,6 +29,24 @@ class AIProvider(ABC):
         """
         pass
 
+    def calculate_tokens_batch(self, texts: List[str]) -> List[int]:
+        """
+        Calculate the number of tokens in each of the given texts.
+        """
+        return [self.calculate_tokens(text) for text in texts]
+
+    async def accept_response(self, response: AIResponse):
+        """
+        Called when the response passed the caller's validation.
+        """
+        pass
+
+    async def reject_response(self, response: AIResponse):
+        """
+        Called when the response failed the caller's validation.
+        """
+        pass
+
     @abstractmethod
     async def get_response(
             self,
@@ -34,6 +59,23 @@ class AIProvider(ABC):
         """
         pass
 
+    async def get_response_stream(
+            self,
+            messages: List[Message],
+            max_tokens=1024,
+    ) -> AsyncIterator[AIResponseDelta]:
+        """
+        Stream the text response for the given messages by deltas.
+        Providers without streaming support yield the complete response as a single delta.
+        """
+        response = await self.get_response(messages, max_tokens=max_tokens)
+        yield AIResponseDelta(
+            text=response.result,
+            usage=response.usage,
+            length_limited=response.length_limited,
+            done=True,
+        )
+
 
 class AIEmbedder(ABC):
 
@@ -0,0 +1,149 @@
+import copy
+import dataclasses
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+from contextlib import aclosing
+from functools import lru_cache
+from typing import List, AsyncIterator, Tuple
+
+from django.conf import settings
+
+from assistant.ai.domain import Message, AIResponse, AIResponseDelta
+from assistant.ai.providers.base import AIProvider
+from assistant.utils.cache import TieredCache, get_shared_store
+
+logger = logging.getLogger(__name__)
+
+
+def _dumps_response(response: AIResponse) -> bytes:
+    return json.dumps(dataclasses.asdict(response), ensure_ascii=False).encode('utf-8')
+
+
+def _loads_response(data: bytes) -> AIResponse:
+    return AIResponse(**json.loads(data))
+
+
+@lru_cache
+def get_response_cache() -> TieredCache:
+    """
+    Get the process-wide AI responses cache configured by the `AI_RESPONSE_CACHE_*` settings.
+    """
+    return TieredCache(
+        namespace='ai_response',
+        maxsize=getattr(settings, 'AI_RESPONSE_CACHE_SIZE', 1000),
+        ttl=getattr(settings, 'AI_RESPONSE_CACHE_TTL', 7 * 24 * 60 * 60),
+        shared_store=get_shared_store(getattr(settings, 'AI_RESPONSE_CACHE_URL', None)),
+        dumps=_dumps_response,
+        loads=_loads_response,
+    )
+
+
+def response_cache_enabled(name: str, default: bool = False) -> bool:
+    """
+    Whether the responses of the AI calls of the step are cached: `AI_RESPONSE_CACHE_ENABLED` turns the cache on,
+    `AI_RESPONSE_CACHE_STEPS` overrides the defaults of the steps by their class names.
+    """
+    if not getattr(settings, 'AI_RESPONSE_CACHE_ENABLED', False):
+        return False
+    return getattr(settings, 'AI_RESPONSE_CACHE_STEPS', {}).get(name, default)
+
+
+class CachedAIProvider(AIProvider):
+    """
+    Memoizes the responses of the provider by the model, the messages, `max_tokens` and `json_format`.
+    A response is only stored once the caller accepts it (see `repeat_until`), a rejected cached response is dropped.
+    For the prompts of the pipeline steps which repeat over the users and the re-runs, not for the dialog answers.
+    """
+
+    _max_pending = 100
+
+    def __init__(self, provider: AIProvider, model: str, cache: TieredCache = None):
+        self._provider = provider
+        self._model = model
+        self._cache = cache or get_response_cache()
+        # Responses waiting for the caller's validation, by their ids
+        self._pending: 'OrderedDict[int, Tuple[AIResponse, str, bool]]' = OrderedDict()
+
+    @property
+    def stats(self):
+        return self._cache.stats
+
+    @property
+    def calls_attempts(self):
+        return self._provider.calls_attempts
+
+    @calls_attempts.setter
+    def calls_attempts(self, value):
+        self._provider.calls_attempts = value
+
+    @property
+    def context_size(self) -> int:
+        return self._provider.context_size
+
+    @property
+    def max_output_tokens(self) -> int:
+        return self._provider.max_output_tokens
+
+    def calculate_tokens(self, text: str) -> int:
+        return self._provider.calculate_tokens(text)
+
+    def calculate_tokens_batch(self, texts: List[str]) -> List[int]:
+        return self._provider.calculate_tokens_batch(texts)
+
+    def cache_key(self, messages: List[Message], max_tokens: int, json_format: bool) -> str:
+        data = json.dumps(
+            [self._model, [dict(m) for m in messages], max_tokens, json_format],
+            ensure_ascii=False, sort_keys=True,
+        )
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    async def get_response(
+            self,
+            messages: List[Message],
+            max_tokens=1024,
+            json_format: bool = False
+    ) -> AIResponse:
+        key = self.cache_key(messages, max_tokens, json_format)
+        response = await self._cache.get(key)
+        hit = response is not None
+        if hit:
+            logger.debug(f'AI response cache hit of {self._model}: {key}')
+            # The callers may change the parsed result
+            response = copy.deepcopy(response)
+            if response.usage:
+                response.usage['cached'] = True
+        else:
+            response = await self._provider.get_response(messages, max_tokens=max_tokens, json_format=json_format)
+
+        self._pending[id(response)] = (response, key, hit)
+        while len(self._pending) > self._max_pending:
+            self._pending.popitem(last=False)
+        return response
+
+    async def get_response_stream(
+            self,
+            messages: List[Message],
+            max_tokens=1024,
+    ) -> AsyncIterator[AIResponseDelta]:
+        async with aclosing(self._provider.get_response_stream(messages, max_tokens=max_tokens)) as stream:
+            async for delta in stream:
+                yield delta
+
+    async def accept_response(self, response: AIResponse):
+        pending = self._pending.pop(id(response), None)
+        if pending is None or pending[0] is not response:
+            return
+        _, key, hit = pending
+        if not hit:
+            await self._cache.set(key, copy.deepcopy(response))
+
+    async def reject_response(self, response: AIResponse):
+        pending = self._pending.pop(id(response), None)
+        if pending is None or pending[0] is not response:
+            return
+        _, key, hit = pending
+        if hit:
+            logger.warning(f'Cached AI response of {self._model} is rejected, dropping it')
+            await self._cache.delete(key)
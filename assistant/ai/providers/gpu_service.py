@@ -1,9 +1,11 @@
-from typing import List
+import json
+from typing import List, AsyncIterator
 
-import aiohttp
-
-from assistant.ai.domain import Message, AIResponse
+from assistant.ai.domain import Message, AIResponse, AIResponseDelta
 from assistant.ai.providers.base import AIProvider
+from assistant.ai.services.token_service import get_model_limits, count_tokens, count_tokens_batch
+from assistant.ai.utils.http import get_http_session
+from assistant.utils.bulkhead import get_bulkhead
 
 
 class GPUServiceProvider(AIProvider):
@@ -14,10 +16,17 @@ class GPUServiceProvider(AIProvider):
 
     @property
     def context_size(self) -> int:
-        return 8000  # TODO: get by model
+        return get_model_limits(self._model).context_size
+
+    @property
+    def max_output_tokens(self) -> int:
+        return get_model_limits(self._model).max_output_tokens
 
     def calculate_tokens(self, text: str) -> int:
-        return len(text.split()) // 2
+        return count_tokens(self._model, text)
+
+    def calculate_tokens_batch(self, texts: List[str]) -> List[int]:
+        return count_tokens_batch(self._model, texts)
 
     async def get_response(
             self,
@@ -25,22 +34,39 @@ class GPUServiceProvider(AIProvider):
             max_tokens=1024,
             json_format: bool = False
     ) -> AIResponse:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{self._base_url}/dialog/",
-                json={
-                    "model": self._model,
-                    "messages": messages,
-                },
-            ) as response:
-                if response.status != 200:
-                    raise Exception(f"Failed to get response. "
-                                    f"Got status code {response.status} from GPU Service with message {await response.text()}")
-                response_data = await response.json()
-                response = AIResponse(**response_data['response'])
-                return response
-
-
-
-
+        session = get_http_session()
+        async with get_bulkhead('gpu_service', self._base_url), session.post(
+            f"{self._base_url}/dialog/",
+            json={
+                "model": self._model,
+                "messages": messages,
+            },
+        ) as response:
+            if response.status != 200:
+                raise Exception(f"Failed to get response. "
+                                f"Got status code {response.status} from GPU Service with message {await response.text()}")
+            response_data = await response.json()
+            response = AIResponse(**response_data['response'])
+            return response
 
+    async def get_response_stream(
+            self,
+            messages: List[Message],
+            max_tokens=1024,
+    ) -> AsyncIterator[AIResponseDelta]:
+        session = get_http_session()
+        async with get_bulkhead('gpu_service', self._base_url), session.post(
+            f"{self._base_url}/dialog/stream/",
+            json={
+                "model": self._model,
+                "messages": messages,
+                "max_tokens": max_tokens,
+            },
+        ) as response:
+            if response.status != 200:
+                raise Exception(f"Failed to get response stream. "
+                                f"Got status code {response.status} from GPU Service with message {await response.text()}")
+            # One JSON encoded delta per line
+            async for line in response.content:
+                if line.strip():
+                    yield AIResponseDelta(**json.loads(line))
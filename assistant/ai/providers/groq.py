@@ -4,13 +4,14 @@ import logging
 import groq
 import time
 from json import JSONDecodeError
-from typing import List
+from typing import List, AsyncIterator
 
-from assistant.ai.domain import Message, AIResponse
+from assistant.ai.domain import Message, AIResponse, AIResponseDelta
 from assistant.ai.providers.base import AIProvider
+from assistant.ai.services.token_service import get_model_limits, count_tokens, count_tokens_batch
 from groq import AsyncGroq
 
-from assistant.utils.throttle import Throttle
+from assistant.utils.rate_limit import get_rate_limiter
 
 logger = logging.getLogger(__name__)
 
@@ -21,23 +22,36 @@ class GroqAIProvider(AIProvider):
     """
 
     calls_attempts: List[int] = None
-    _throttle = Throttle(2)  # https://console.groq.com/settings/limits
 
-    def __init__(self, model: str, api_key: str, debug=False):
+    def __init__(self, model: str, api_key: str, debug=False, client: AsyncGroq = None):
         self._model = model
-        self._client = AsyncGroq(
+        self._client = client or AsyncGroq(
             api_key=api_key,
         )
+        # https://console.groq.com/settings/limits
+        self._rate_limiter = get_rate_limiter(f'groq:{model}')
         if debug:
             self.calls_attempts = []
 
 
     @property
     def context_size(self) -> int:
-        return 8000  # TODO: get by model
+        return get_model_limits(self._model).context_size
+
+    @property
+    def max_output_tokens(self) -> int:
+        return get_model_limits(self._model).max_output_tokens
 
     def calculate_tokens(self, text: str) -> int:
-        return len(text.split()) // 2  # TODO: get by model
+        return count_tokens(self._model, text)
+
+    def calculate_tokens_batch(self, texts: List[str]) -> List[int]:
+        return count_tokens_batch(self._model, texts)
+
+    def _estimate_tokens(self, messages: List[Message], max_tokens: int) -> int:
+        if not self._rate_limiter.tpm:
+            return 0
+        return sum(self.calculate_tokens_batch([m.get('content') or '' for m in messages])) + max_tokens
 
     async def get_response(
             self,
@@ -54,8 +68,6 @@ class GroqAIProvider(AIProvider):
         while call_attempts < 5:
             try:
                 call_attempts += 1
-                await self._throttle()
-
 
                 converted_messages = [self.convert_message(m) for m in messages]
                 for m in converted_messages:
@@ -66,12 +78,14 @@ class GroqAIProvider(AIProvider):
                         ]
                         break
 
-                chat_response = await self._client.chat.completions.create(
-                    model=self._model,
-                    messages=converted_messages,
-                    max_tokens=max_tokens,
-                    **kwargs
-                )
+                async with self._rate_limiter.limit(self._estimate_tokens(messages, max_tokens)) as rate_limit_usage:
+                    chat_response = await self._client.chat.completions.create(
+                        model=self._model,
+                        messages=converted_messages,
+                        max_tokens=max_tokens,
+                        **kwargs
+                    )
+                    rate_limit_usage.tokens = chat_response.usage.total_tokens
                 end_ts = time.time()
 
                 logger.debug(f'Raw GPT response ({end_ts - start_ts} s): {chat_response}')
@@ -105,6 +119,36 @@ class GroqAIProvider(AIProvider):
 
         return ai_response
 
+    async def get_response_stream(
+            self,
+            messages: List[Message],
+            max_tokens=1024,
+    ) -> AsyncIterator[AIResponseDelta]:
+        async with self._rate_limiter.limit(self._estimate_tokens(messages, max_tokens)) as rate_limit_usage:
+            stream = await self._client.chat.completions.create(
+                model=self._model,
+                messages=[self.convert_message(m) for m in messages],
+                max_tokens=max_tokens,
+                stream=True,
+            )
+            async for chunk in stream:
+                choice = chunk.choices[0] if chunk.choices else None
+                if choice and choice.delta.content:
+                    yield AIResponseDelta(text=choice.delta.content)
+                # Groq reports the usage of the whole response in the last chunk
+                x_groq = getattr(chunk, 'x_groq', None)
+                if x_groq is not None and getattr(x_groq, 'usage', None):
+                    rate_limit_usage.tokens = x_groq.usage.total_tokens
+                    yield AIResponseDelta(
+                        usage={
+                            'model': chunk.model,
+                            'prompt_tokens': x_groq.usage.prompt_tokens,
+                            'completion_tokens': x_groq.usage.completion_tokens,
+                        },
+                        length_limited=bool(choice and choice.finish_reason == 'length'),
+                        done=True,
+                    )
+
     def convert_message(self, message: Message) -> dict:
         content = []
         if message.get('images'):
@@ -2,13 +2,16 @@ import json
 import logging
 import time
 from json import JSONDecodeError
-from typing import List
+from typing import List, AsyncIterator
 
+from django.conf import settings
 from ollama import AsyncClient, Options
 
 from assistant.ai.providers.base import AIProvider
+from assistant.ai.services.token_service import get_model_limits, count_tokens, count_tokens_batch
 
-from assistant.ai.domain import Message, AIResponse
+from assistant.ai.domain import Message, AIResponse, AIResponseDelta
+from assistant.utils.bulkhead import get_bulkhead
 
 logger = logging.getLogger(__name__)
 
@@ -17,9 +20,10 @@ class OllamaAIProvider(AIProvider):
 
     calls_attempts: List[int] = None
 
-    def __init__(self, model: str, host: str, debug=False):
+    def __init__(self, model: str, host: str, debug=False, client: AsyncClient = None):
         self._model = model
-        self._client = AsyncClient(
+        self._host = host
+        self._client = client or AsyncClient(
             host=host
         )
         if debug:
@@ -27,10 +31,19 @@ class OllamaAIProvider(AIProvider):
 
     @property
     def context_size(self) -> int:
-        return 8000  # TODO: get by model
+        # Sent as `num_ctx`: the server default is much smaller than the model limits,
+        # and the full ones take too much memory for the KV cache
+        return min(get_model_limits(self._model).context_size, getattr(settings, 'OLLAMA_NUM_CTX', 8192))
+
+    @property
+    def max_output_tokens(self) -> int:
+        return get_model_limits(self._model).max_output_tokens
 
     def calculate_tokens(self, text: str) -> int:
-        return len(text.split()) // 2
+        return count_tokens(self._model, text)
+
+    def calculate_tokens_batch(self, texts: List[str]) -> List[int]:
+        return count_tokens_batch(self._model, texts)
 
     async def get_response(
             self,
@@ -51,12 +64,13 @@ class OllamaAIProvider(AIProvider):
                 call_attempts += 1
                 logger.debug(f'Getting Ollama response for messages: {messages}')
 
-                chat_response = await self._client.chat(
-                    model=self._model,
-                    messages=[dict(m) for m in messages],
-                    options=Options(num_predict=max_tokens),
-                    **kwargs
-                )
+                async with get_bulkhead('ollama', self._host):
+                    chat_response = await self._client.chat(
+                        model=self._model,
+                        messages=[dict(m) for m in messages],
+                        options=Options(num_predict=max_tokens, num_ctx=self.context_size),
+                        **kwargs
+                    )
                 end_ts = time.time()
 
                 logger.debug(f'Raw Ollama response ({end_ts - start_ts} s): {chat_response}')
@@ -99,6 +113,41 @@ class OllamaAIProvider(AIProvider):
 
         return ai_response
 
+    async def get_response_stream(
+            self,
+            messages: List[Message],
+            max_tokens=1024,
+    ) -> AsyncIterator[AIResponseDelta]:
+        self._check_roles(messages)
+        # The shared slot of the stream is leased for the stream timeout, the longer streams are cut off
+        stream_timeout = getattr(settings, 'AI_STREAM_TIMEOUT', 600)
+        async with get_bulkhead('ollama', self._host):
+            deadline = time.monotonic() + stream_timeout
+            stream = await self._client.chat(
+                model=self._model,
+                messages=[dict(m) for m in messages],
+                options=Options(num_predict=max_tokens, num_ctx=self.context_size),
+                stream=True,
+            )
+            async for chunk in stream:
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f'Ollama response stream exceeded {stream_timeout} s')
+                text = chunk['message']['content'] or ''
+                if not chunk['done']:
+                    if text:
+                        yield AIResponseDelta(text=text)
+                    continue
+                yield AIResponseDelta(
+                    text=text,
+                    usage={
+                        'model': chunk['model'],
+                        'prompt_tokens': chunk.get('prompt_eval_count', 0),
+                        'completion_tokens': chunk.get('eval_count', 0),
+                    },
+                    length_limited=chunk.get('done_reason') == 'length',
+                    done=True,
+                )
+
     @staticmethod
     def _check_roles(messages: List[Message]):
         for i in range(1, len(messages)):
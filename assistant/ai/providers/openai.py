@@ -1,29 +1,44 @@
 import json
 import logging
 import time
-from typing import List
+from typing import List, AsyncIterator
 
 from openai import AsyncOpenAI
-from assistant.ai.domain import Message, AIResponse
+from assistant.ai.domain import Message, AIResponse, AIResponseDelta
 from assistant.ai.providers.base import AIProvider
+from assistant.utils.rate_limit import get_rate_limiter
+from assistant.ai.services.token_service import get_model_limits, count_tokens, count_tokens_batch
 
 logger = logging.getLogger(__name__)
 
 
 class ChatGPTAIProvider(AIProvider):
 
-    def __init__(self, model: str, api_key: str):
+    def __init__(self, model: str, api_key: str, client: AsyncOpenAI = None):
         self._model = model
-        self._client = AsyncOpenAI(
+        self._client = client or AsyncOpenAI(
             api_key=api_key
         )
+        self._rate_limiter = get_rate_limiter(f'openai:{model}')
 
     @property
     def context_size(self) -> int:
-        return 8000  # TODO: get by model
+        return get_model_limits(self._model).context_size
+
+    @property
+    def max_output_tokens(self) -> int:
+        return get_model_limits(self._model).max_output_tokens
 
     def calculate_tokens(self, text: str) -> int:
-        return len(text.split()) // 2
+        return count_tokens(self._model, text)
+
+    def calculate_tokens_batch(self, texts: List[str]) -> List[int]:
+        return count_tokens_batch(self._model, texts)
+
+    def _estimate_tokens(self, messages: List[Message], max_tokens: int) -> int:
+        if not self._rate_limiter.tpm:
+            return 0
+        return sum(self.calculate_tokens_batch([m.get('content') or '' for m in messages])) + max_tokens
 
     async def get_response(
             self,
@@ -36,12 +51,14 @@ class ChatGPTAIProvider(AIProvider):
         if json_format:
             kwargs['response_format'] = {"type": "json_object"}
 
-        chat_response = await self._client.chat.completions.create(
-            model=self._model,
-            messages=[dict(m) for m in messages],
-            max_tokens=max_tokens,
-            **kwargs
-        )
+        async with self._rate_limiter.limit(self._estimate_tokens(messages, max_tokens)) as rate_limit_usage:
+            chat_response = await self._client.chat.completions.create(
+                model=self._model,
+                messages=[dict(m) for m in messages],
+                max_tokens=max_tokens,
+                **kwargs
+            )
+            rate_limit_usage.tokens = chat_response.usage.total_tokens
         end_ts = time.time()
 
         logger.debug(f'Raw GPT response ({end_ts - start_ts} s): {chat_response}')
@@ -62,4 +79,37 @@ class ChatGPTAIProvider(AIProvider):
         )
         return ai_response
 
-
+    async def get_response_stream(
+            self,
+            messages: List[Message],
+            max_tokens=1024,
+    ) -> AsyncIterator[AIResponseDelta]:
+        async with self._rate_limiter.limit(self._estimate_tokens(messages, max_tokens)) as rate_limit_usage:
+            stream = await self._client.chat.completions.create(
+                model=self._model,
+                messages=[dict(m) for m in messages],
+                max_tokens=max_tokens,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+            model = self._model
+            finish_reason = None
+            async for chunk in stream:
+                model = chunk.model or model
+                if chunk.choices:
+                    choice = chunk.choices[0]
+                    finish_reason = choice.finish_reason or finish_reason
+                    if choice.delta.content:
+                        yield AIResponseDelta(text=choice.delta.content)
+                if chunk.usage:
+                    # The last chunk has no choices, only the usage of the whole response
+                    rate_limit_usage.tokens = chunk.usage.total_tokens
+                    yield AIResponseDelta(
+                        usage={
+                            'model': model,
+                            'prompt_tokens': chunk.usage.prompt_tokens,
+                            'completion_tokens': chunk.usage.completion_tokens,
+                        },
+                        length_limited=finish_reason == 'length',
+                        done=True,
+                    )
@@ -0,0 +1,270 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import aclosing
+from typing import List, AsyncIterator, Dict, Optional, Set
+
+from django.conf import settings
+
+from assistant.ai.domain import Message, AIResponse, AIResponseDelta
+from assistant.ai.providers.base import AIProvider
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests to a model after `failure_threshold` consecutive failures.
+    After `reset_timeout` seconds one trial request is let through, its success closes the circuit.
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                # Half-open: a trial request, the next one waits for the timeout again
+                self._opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """
+    Latencies of the last successful responses of a model.
+    """
+
+    def __init__(self, window: int = 100):
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._latencies)
+
+    def record(self, latency: float):
+        with self._lock:
+            self._latencies.append(latency)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+
+class ModelRoute:
+    """
+    Health of a model shared by the routing providers of the process.
+    """
+
+    min_samples = 20
+    hedge_percentile = 0.95
+
+    def __init__(self, model: str):
+        self.model = model
+        self.latency = LatencyTracker()
+        self.circuit_breaker = CircuitBreaker(
+            failure_threshold=getattr(settings, 'AI_ROUTING_FAILURE_THRESHOLD', 3),
+            reset_timeout=getattr(settings, 'AI_ROUTING_RESET_TIMEOUT', 30),
+        )
+
+    @property
+    def hedge_delay(self) -> float:
+        """
+        Time to wait for the response before sending a hedge request to the next model.
+        """
+        if len(self.latency) < self.min_samples:
+            return getattr(settings, 'AI_ROUTING_HEDGE_DELAY', 10)
+        return self.latency.percentile(self.hedge_percentile)
+
+
+_routes: Dict[str, ModelRoute] = {}
+_routes_lock = threading.Lock()
+
+
+def get_model_route(model: str) -> ModelRoute:
+    with _routes_lock:
+        route = _routes.get(model)
+        if route is None:
+            route = _routes[model] = ModelRoute(model)
+    return route
+
+
+class RoutingAIProvider(AIProvider):
+    """
+    Sends the request to the first of the models with a closed circuit. If it does not respond within
+    its usual (p95) latency, the same request is sent to the next model, the first response wins
+    and the other request is cancelled. A failed request is retried with the next model at once.
+    Configured as `route:<model>,<model>,...`.
+    """
+
+    calls_attempts: List[int] = None
+
+    def __init__(self, models: List[str], hedging: bool = None, providers: Dict[str, AIProvider] = None):
+        from assistant.ai.services.ai_service import get_ai_provider
+
+        self._models = models
+        self._model = models[0]
+        self._providers = providers or {model: get_ai_provider(model) for model in models}
+        self._hedging = hedging if hedging is not None else getattr(settings, 'AI_ROUTING_HEDGING_ENABLED', True)
+
+    @property
+    def _primary(self) -> AIProvider:
+        return self._providers[self._models[0]]
+
+    @property
+    def context_size(self) -> int:
+        return min(provider.context_size for provider in self._providers.values())
+
+    @property
+    def max_output_tokens(self) -> int:
+        return min(provider.max_output_tokens for provider in self._providers.values())
+
+    def calculate_tokens(self, text: str) -> int:
+        return self._primary.calculate_tokens(text)
+
+    def calculate_tokens_batch(self, texts: List[str]) -> List[int]:
+        return self._primary.calculate_tokens_batch(texts)
+
+    @staticmethod
+    def _next_model(remaining: List[str], force: bool = False) -> Optional[str]:
+        """
+        Take the next of the remaining models with a closed circuit. Called right before the dispatch,
+        as `allow` takes the trial request of a half-open circuit. With `force` the first model is taken
+        if all the circuits are open.
+        """
+        for i, model in enumerate(remaining):
+            if get_model_route(model).circuit_breaker.allow():
+                return remaining.pop(i)
+        if force and remaining:
+            return remaining.pop(0)
+        return None
+
+    async def _call(self, model: str, messages: List[Message], max_tokens: int, json_format: bool) -> AIResponse:
+        route = get_model_route(model)
+        start_ts = time.monotonic()
+        try:
+            response = await self._providers[model].get_response(
+                messages, max_tokens=max_tokens, json_format=json_format
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f'AI model {model} failed: {e}')
+            route.circuit_breaker.record_failure()
+            raise
+        route.latency.record(time.monotonic() - start_ts)
+        route.circuit_breaker.record_success()
+        return response
+
+    async def get_response(
+            self,
+            messages: List[Message],
+            max_tokens=1024,
+            json_format: bool = False
+    ) -> AIResponse:
+        remaining = list(self._models)
+        tasks: Dict[asyncio.Task, str] = {}
+        pending: Set[asyncio.Task] = set()
+        error = None
+
+        def start(model: str):
+            task = asyncio.create_task(self._call(model, messages, max_tokens, json_format))
+            tasks[task] = model
+            pending.add(task)
+
+        hedging = self._hedging
+        last_model = self._next_model(remaining)
+        # All the circuits are open, try the models anyway rather than fail
+        force = last_model is None
+        if force:
+            last_model = remaining.pop(0)
+        start(last_model)
+        try:
+            while pending:
+                timeout = get_model_route(last_model).hedge_delay if hedging and remaining else None
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    model = self._next_model(remaining, force=force)
+                    if model is None:
+                        # The circuits of the rest are open, just wait
+                        hedging = False
+                        continue
+                    logger.info(f'AI model {last_model} is slower than {timeout:.2f} s, hedging with {model}')
+                    last_model = model
+                    start(model)
+                    continue
+                for task in done:
+                    if task.exception() is None:
+                        self._model = tasks[task]
+                        return task.result()
+                    error = task.exception()
+                if not pending and (model := self._next_model(remaining, force=force)) is not None:
+                    logger.info(f'Failing over to AI model {model}')
+                    last_model = model
+                    start(model)
+        finally:
+            for task in pending:
+                task.cancel()
+            if self.calls_attempts is not None:
+                self.calls_attempts.append(len(tasks))
+        raise error
+
+    async def get_response_stream(
+            self,
+            messages: List[Message],
+            max_tokens=1024,
+    ) -> AsyncIterator[AIResponseDelta]:
+        # Fail over until the first delta, the streams are not hedged
+        remaining = list(self._models)
+        model = self._next_model(remaining)
+        force = model is None
+        if force:
+            model = remaining.pop(0)
+        while True:
+            route = get_model_route(model)
+            started = False
+            start_ts = time.monotonic()
+            try:
+                stream = self._providers[model].get_response_stream(messages, max_tokens=max_tokens)
+                async with aclosing(stream):
+                    async for delta in stream:
+                        started = True
+                        self._model = model
+                        yield delta
+            except Exception as e:
+                route.circuit_breaker.record_failure()
+                next_model = None if started else self._next_model(remaining, force=force)
+                if next_model is None:
+                    raise
+                logger.warning(f'AI model {model} failed: {e}, failing over to {next_model}')
+                model = next_model
+                continue
+            route.latency.record(time.monotonic() - start_ts)
+            route.circuit_breaker.record_success()
+            return
@@ -1,8 +1,11 @@
+import asyncio
+import threading
+
 import torch
-from typing import List
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from typing import List, AsyncIterator
+from transformers import AutoTokenizer, AutoModelForCausalLM, TextIteratorStreamer
 from assistant.ai.providers.base import AIProvider
-from assistant.ai.domain import Message, AIResponse
+from assistant.ai.domain import Message, AIResponse, AIResponseDelta
 from assistant.ai.utils.transformers import get_torch_device
 
 
@@ -21,7 +24,7 @@ class TransformersProvider(AIProvider):
 
     @property
     def context_size(self) -> int:
-        return 8000  # TODO: get by model
+        return getattr(self._model.config, 'max_position_embeddings', None) or 8000
 
     def calculate_tokens(self, text: str) -> int:
         """
@@ -32,6 +35,11 @@ class TransformersProvider(AIProvider):
         """
         return len(self._tokenizer.tokenize(text))
 
+    def calculate_tokens_batch(self, texts: List[str]) -> List[int]:
+        if not texts:
+            return []
+        return [len(ids) for ids in self._tokenizer(list(texts), add_special_tokens=False)['input_ids']]
+
     async def get_response(
             self,
             messages: List[Message],
@@ -92,3 +100,52 @@ class TransformersProvider(AIProvider):
         )
 
         return ai_response
+
+    async def get_response_stream(
+            self,
+            messages: List[Message],
+            max_tokens=1024,
+    ) -> AsyncIterator[AIResponseDelta]:
+        """
+        Streams the generated text: the generation runs in a thread feeding the text streamer.
+        """
+        prompt = "\n".join([f"{msg['role']}: {msg['content']}" for msg in messages])
+        inputs = self._tokenizer(prompt, return_tensors="pt", truncation=True)
+        input_ids = inputs.input_ids.to(self._device)
+        streamer = TextIteratorStreamer(self._tokenizer, skip_prompt=True, skip_special_tokens=True)
+
+        def generate():
+            with torch.no_grad():
+                self._model.generate(
+                    input_ids,
+                    attention_mask=inputs["attention_mask"].to(self._device),
+                    max_length=max_tokens,
+                    do_sample=True,
+                    top_p=0.95,
+                    top_k=50,
+                    pad_token_id=self._tokenizer.eos_token_id,
+                    streamer=streamer,
+                )
+
+        thread = threading.Thread(target=generate, daemon=True)
+        thread.start()
+
+        finished = object()
+        parts = []
+        while (text := await asyncio.to_thread(next, streamer, finished)) is not finished:
+            if text:
+                parts.append(text)
+                yield AIResponseDelta(text=text)
+        await asyncio.to_thread(thread.join)
+
+        prompt_tokens = len(inputs["input_ids"][0])
+        completion_tokens = len(self._tokenizer("".join(parts)).input_ids)
+        yield AIResponseDelta(
+            usage={
+                'model': self._model_name,
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+            },
+            length_limited=prompt_tokens + completion_tokens >= max_tokens,
+            done=True,
+        )
@@ -7,21 +7,36 @@ from django.conf import settings
 
 from assistant.ai.providers.base import AIProvider, AIEmbedder
 from assistant.ai.providers.gpu_service import GPUServiceProvider
+from assistant.ai.utils.http import get_loop_client
 
 logger = logging.getLogger(__name__)
 
 
-def get_ai_provider(model: str) -> AIProvider:
+def get_ai_provider(model: str, cached: bool = False) -> AIProvider:
+    """
+    Get the provider of the model. The providers are cheap and keep their own debugging state,
+    while their API clients are shared by the event loop (see `get_loop_client`), i.e. by one Celery task.
+    With `cached` the validated responses are memoized (see `CachedAIProvider`).
+    """
+    if cached:
+        from assistant.ai.providers.cached import CachedAIProvider
+        return CachedAIProvider(get_ai_provider(model), model)
+
     logger.debug(f'Getting AI provider for model: {model}')
-    if model.startswith('groq:'):
+    if model.startswith('route:'):
+        from assistant.ai.providers.routing import RoutingAIProvider
+        provider = RoutingAIProvider(
+            models=[m.strip() for m in model[len('route:'):].split(',') if m.strip()],
+        )
+    elif model.startswith('groq:'):
         from assistant.ai.providers.groq import GroqAIProvider
         provider = GroqAIProvider(
             model=model[len('groq:'):],
             api_key=settings.GROQ_API_KEY,
+            client=_groq_client(settings.GROQ_API_KEY),
         )
     elif model.startswith('gpu_service:'):
         model = model[len('gpu_service:'):]
-        from assistant.ai.embedders.gpu_service import GPUServiceEmbedder
         provider = GPUServiceProvider(
             base_url=settings.GPU_SERVICE_ENDPOINT,
             model=model
@@ -30,20 +45,23 @@ def get_ai_provider(model: str) -> AIProvider:
         from assistant.ai.providers.ollama import OllamaAIProvider
         provider = OllamaAIProvider(
             model=model,
-            host=settings.OLLAMA_ENDPOINT
+            host=settings.OLLAMA_ENDPOINT,
+            client=_ollama_client(settings.OLLAMA_ENDPOINT),
         )
     elif model.startswith('ollama:'):
         model = model[len('ollama:'):]
         from assistant.ai.providers.ollama import OllamaAIProvider
         provider = OllamaAIProvider(
             model=model,
-            host=settings.OLLAMA_ENDPOINT
+            host=settings.OLLAMA_ENDPOINT,
+            client=_ollama_client(settings.OLLAMA_ENDPOINT),
         )
     else:
         from assistant.ai.providers.openai import ChatGPTAIProvider
         provider = ChatGPTAIProvider(
             model=model,
             api_key=settings.OPENAI_API_KEY,
+            client=_openai_client(settings.OPENAI_API_KEY),
         )
     return provider
 
@@ -57,6 +75,7 @@ def get_ai_embdedder(model: str = None) -> AIEmbedder:
         embedder = ChatGPTEmbedder(
             model=model,
             api_key=settings.OPENAI_API_KEY,
+            client=_openai_client(settings.OPENAI_API_KEY),
         )
     elif model.startswith('gpu_service:'):
         model = model[len('gpu_service:'):]
@@ -70,10 +89,26 @@ def get_ai_embdedder(model: str = None) -> AIEmbedder:
         embedder = OllamaEmbedder(
             model=model,
             host=settings.OLLAMA_ENDPOINT,
+            client=_ollama_client(settings.OLLAMA_ENDPOINT),
         )
     return embedder
 
 
+def _openai_client(api_key: str):
+    from openai import AsyncOpenAI
+    return get_loop_client(('openai', api_key), lambda: AsyncOpenAI(api_key=api_key))
+
+
+def _groq_client(api_key: str):
+    from groq import AsyncGroq
+    return get_loop_client(('groq', api_key), lambda: AsyncGroq(api_key=api_key))
+
+
+def _ollama_client(host: str):
+    from ollama import AsyncClient
+    return get_loop_client(('ollama', host), lambda: AsyncClient(host=host))
+
+
 def extract_tagged_text(text):
     # Adjusting the regex pattern to handle tags at the beginning and in the middle of the text
     pattern = r'#(\w+)\s?(.*?)(?=\s#|$)'
@@ -0,0 +1,177 @@
+import dataclasses
+import logging
+import os
+import re
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import List, Dict, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass(frozen=True)
+class ModelLimits:
+    context_size: int
+    max_output_tokens: int
+
+
+DEFAULT_MODEL_LIMITS = ModelLimits(context_size=8000, max_output_tokens=4096)
+
+# By the model name prefix, the longest matching prefix wins. Extended or overridden by `AI_MODEL_LIMITS`.
+MODEL_LIMITS: Dict[str, ModelLimits] = {
+    'gpt-4o': ModelLimits(128000, 16384),
+    'gpt-4-turbo': ModelLimits(128000, 4096),
+    'gpt-4': ModelLimits(8192, 4096),
+    'gpt-3.5-turbo': ModelLimits(16385, 4096),
+    'o1': ModelLimits(128000, 32768),
+    'llama3.1': ModelLimits(131072, 8192),
+    'llama3.2': ModelLimits(131072, 8192),
+    'llama3.3': ModelLimits(131072, 8192),
+    'llama3': ModelLimits(8192, 4096),
+    'llama-3.1': ModelLimits(131072, 8192),
+    'llama-3.2': ModelLimits(131072, 8192),
+    'llama-3.3': ModelLimits(131072, 32768),
+    'llama3-': ModelLimits(8192, 8192),
+    'mixtral-8x7b': ModelLimits(32768, 4096),
+    'gemma2': ModelLimits(8192, 4096),
+    'qwen2.5': ModelLimits(32768, 8192),
+}
+
+_PROVIDER_PREFIXES = ('groq:', 'ollama:', 'gpu_service:')
+
+# tiktoken cache (the files are named by the SHA-1 of their download URL) with the encodings of the OpenAI models,
+# cl100k_base and o200k_base, so they are counted offline
+BUNDLED_TIKTOKEN_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'encodings', 'tiktoken')
+
+
+def _model_name(model: str) -> str:
+    model = model.lower()
+    for prefix in _PROVIDER_PREFIXES:
+        if model.startswith(prefix):
+            return model[len(prefix):]
+    return model
+
+
+def _match_prefix(model: str, table: Dict[str, object]) -> Optional[object]:
+    model = _model_name(model)
+    prefixes = [prefix for prefix in table if model.startswith(prefix.lower())]
+    return table[max(prefixes, key=len)] if prefixes else None
+
+
+@lru_cache
+def get_model_limits_table() -> Dict[str, ModelLimits]:
+    table = dict(MODEL_LIMITS)
+    for prefix, limits in getattr(settings, 'AI_MODEL_LIMITS', {}).items():
+        table[prefix] = ModelLimits(*limits)
+    return table
+
+
+def get_model_limits(model: str) -> ModelLimits:
+    """
+    Get the context size and the output limit of the model. `AI_MODEL_LIMITS` setting maps
+    the model name prefixes to `(context_size, max_output_tokens)` pairs.
+    """
+    return _match_prefix(model, get_model_limits_table()) or DEFAULT_MODEL_LIMITS
+
+
+class TokenCounter(ABC):
+
+    @abstractmethod
+    def count_batch(self, texts: List[str]) -> List[int]:
+        pass
+
+    def count(self, text: str) -> int:
+        return self.count_batch([text])[0]
+
+
+class TiktokenCounter(TokenCounter):
+    """
+    BPE encodings of the OpenAI models. The encoding files are taken from `TIKTOKEN_CACHE_DIR`,
+    the bundled ones by default (see `BUNDLED_TIKTOKEN_CACHE_DIR`).
+    """
+
+    def __init__(self, encoding_name: str = None, model: str = None):
+        import tiktoken
+        self._encoding = tiktoken.get_encoding(encoding_name) if encoding_name else \
+            tiktoken.encoding_for_model(model)
+
+    def count_batch(self, texts: List[str]) -> List[int]:
+        return [len(tokens) for tokens in self._encoding.encode_ordinary_batch(texts)]
+
+
+class HFTokenCounter(TokenCounter):
+    """
+    Hugging Face tokenizer loaded from a `tokenizer.json` file or by the hub model name.
+    """
+
+    def __init__(self, name_or_path: str):
+        from tokenizers import Tokenizer
+        if os.path.isfile(name_or_path):
+            self._tokenizer = Tokenizer.from_file(name_or_path)
+        else:
+            self._tokenizer = Tokenizer.from_pretrained(name_or_path)
+
+    def count_batch(self, texts: List[str]) -> List[int]:
+        return [len(encoding.ids) for encoding in self._tokenizer.encode_batch(texts, add_special_tokens=False)]
+
+
+class EstimatingTokenCounter(TokenCounter):
+    """
+    Estimation for the models without a known tokenizer. Latin words take about 4 characters per token,
+    while the words of other scripts (e.g. Cyrillic) are split to much shorter tokens. Overestimates rather than not.
+    """
+
+    _WORD_RE = re.compile(r'[^\W_]+|\S')
+
+    def __init__(self, ascii_chars_per_token: int = 4, other_chars_per_token: int = 3):
+        self._ascii_chars_per_token = ascii_chars_per_token
+        self._other_chars_per_token = other_chars_per_token
+
+    def count(self, text: str) -> int:
+        n = 0
+        for word in self._WORD_RE.findall(text):
+            chars_per_token = self._ascii_chars_per_token if word.isascii() else self._other_chars_per_token
+            n += -(-len(word) // chars_per_token)
+        return n
+
+    def count_batch(self, texts: List[str]) -> List[int]:
+        return [self.count(text) for text in texts]
+
+
+@lru_cache
+def get_token_counter(model: str) -> TokenCounter:
+    """
+    Get the token counter of the model. `AI_MODEL_TOKENIZERS` setting maps the model name prefixes
+    to `tiktoken:<encoding>` or `hf:<tokenizer.json path or hub name>`, the OpenAI models use tiktoken
+    by default. Falls back to the estimation if the tokenizer library (the `tokenizers` extra)
+    or its files are not available.
+    """
+    os.environ.setdefault(
+        'TIKTOKEN_CACHE_DIR', getattr(settings, 'TIKTOKEN_CACHE_DIR', None) or BUNDLED_TIKTOKEN_CACHE_DIR
+    )
+
+    spec = _match_prefix(model, getattr(settings, 'AI_MODEL_TOKENIZERS', {}))
+    try:
+        if spec and spec.startswith('tiktoken:'):
+            return TiktokenCounter(encoding_name=spec[len('tiktoken:'):])
+        if spec and spec.startswith('hf:'):
+            return HFTokenCounter(spec[len('hf:'):])
+        if spec:
+            raise ValueError(f'Unknown tokenizer {spec}')
+        if _model_name(model).startswith(('gpt-', 'o1', 'text-embedding-')):
+            return TiktokenCounter(model=_model_name(model))
+    except Exception as e:
+        logger.warning(f'Failed to load tokenizer of {model}, estimating the tokens: {e}')
+    return EstimatingTokenCounter()
+
+
+def count_tokens(model: str, text: str) -> int:
+    return get_token_counter(model).count(text)
+
+
+def count_tokens_batch(model: str, texts: List[str]) -> List[int]:
+    if not texts:
+        return []
+    return get_token_counter(model).count_batch(list(texts))
@@ -0,0 +1,132 @@
+import asyncio
+import functools
+import logging
+import threading
+import weakref
+from typing import Dict, Callable, Awaitable, TypeVar, Hashable, Any
+
+import aiohttp
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# The clients are bound to the event loop they are created in
+_clients: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Hashable, Any]]' = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def get_loop_client(key: Hashable, factory: Callable[[], T]) -> T:
+    """
+    Get the HTTP client (an API SDK client or a session) of the running event loop by its key,
+    created by the factory on the first call. Outside of an event loop a new client is returned every time.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return factory()
+    with _lock:
+        loop_clients = _clients.setdefault(loop, {})
+        client = loop_clients.get(key)
+        if client is None or getattr(client, 'closed', False):
+            client = loop_clients[key] = factory()
+    return client
+
+
+def get_http_session(name: str = 'default') -> aiohttp.ClientSession:
+    """
+    Get the keep-alive session shared by the HTTP clients of the running event loop. The connections are
+    only reused while the loop lives, i.e. within one Celery task run by `async_to_sync`.
+    The connector limits and the timeouts come from the `HTTP_*` settings.
+    """
+    return get_loop_client(('aiohttp', name), _create_session)
+
+
+def _create_session() -> aiohttp.ClientSession:
+    connector = aiohttp.TCPConnector(
+        limit=getattr(settings, 'HTTP_POOL_LIMIT', 100),
+        limit_per_host=getattr(settings, 'HTTP_POOL_LIMIT_PER_HOST', 0),
+        keepalive_timeout=getattr(settings, 'HTTP_KEEPALIVE_TIMEOUT', 60),
+        ttl_dns_cache=getattr(settings, 'HTTP_DNS_CACHE_TTL', 300),
+    )
+    timeout = aiohttp.ClientTimeout(
+        total=getattr(settings, 'HTTP_TIMEOUT', 300),
+        connect=getattr(settings, 'HTTP_CONNECT_TIMEOUT', 10),
+    )
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+async def _close_client(client: Any):
+    try:
+        if hasattr(client, 'close'):
+            # aiohttp sessions and the OpenAI-compatible SDK clients
+            await client.close()
+        elif hasattr(getattr(client, '_client', None), 'aclose'):
+            # ollama clients wrap an httpx client
+            await client._client.aclose()
+    except Exception as e:
+        logger.warning(f'Failed to close HTTP client {client}: {e}')
+
+
+async def close_http_sessions():
+    """
+    Close the sessions and the clients of the running event loop.
+    """
+    with _lock:
+        loop_clients = _clients.pop(asyncio.get_running_loop(), {})
+    for client in loop_clients.values():
+        await _close_client(client)
+
+
+def close_all_http_sessions():
+    """
+    Close the sessions and the clients of all the event loops which are not running (e.g. on a worker shutdown).
+    The clients of the closed loops are dropped, their connections are already gone.
+    """
+    with _lock:
+        items = list(_clients.items())
+        _clients.clear()
+    for loop, loop_clients in items:
+        if loop.is_closed() or loop.is_running():
+            continue
+        for client in loop_clients.values():
+            loop.run_until_complete(_close_client(client))
+
+
+def closing_http_sessions(func: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+    """
+    Close the sessions and the clients created by the coroutine function when it is done. For the coroutines run
+    in a temporary event loop (`async_to_sync`, `asyncio.run`), which would leave the sessions unclosed.
+    """
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            await close_http_sessions()
+
+    return wrapper
+
+
+class HTTPSessionsLifespan:
+    """
+    ASGI wrapper closing the shared HTTP sessions on the lifespan shutdown of the server.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'lifespan':
+            return await self.app(scope, receive, send)
+
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await close_http_sessions()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
@@ -14,7 +14,7 @@ from assistant.ai.dialog import AIDialog
 from assistant.ai.domain import AIResponse, Message as GPTMessage
 from assistant.ai.services.ai_service import extract_tagged_text, get_ai_provider
 from assistant.bot.domain import Bot, Update, Answer, MultiPartAnswer, NoMessageFound, SingleAnswer, \
-    Button, User, BotPlatform, Photo
+    Button, User, BotPlatform, Photo, AnswerStream
 
 from assistant.bot.models import Instance, Dialog, Message, BotUser, Bot as BotModel
 from assistant.bot.platforms.telegram.format import TelegramMarkdownV2FormattedText
@@ -40,6 +40,8 @@ class AssistantBot(Bot):
     bot_user: BotUser
     resource_manager: ResourceManager
     allowed_commands: Optional[List[str]] = None  # Allowed command prefixes
+    chat_id: Optional[str] = None
+    answer_stream: Optional[AnswerStream] = None
 
     DEFAULT_LANGUAGE = 'ru'
     SERVICE_TAG_REGEXP = re.compile(r'#service', re.I)
@@ -91,6 +93,7 @@ class AssistantBot(Bot):
 
         logger.info('Instance %s text: %s', self.instance, update.text)
 
+        self.chat_id = update.chat_id
         answer_task = asyncio.create_task(self._get_answer(self.dialog, update))
         typing_task = asyncio.create_task(self.delayed_typing(update.chat_id, answer_task))
 
@@ -99,6 +102,8 @@ class AssistantBot(Bot):
         answer = answer_task.result()
 
         if answer is None:
+            if self.answer_stream is not None:
+                await self.answer_stream.cancel()
             return None
 
         if answer.state:
@@ -248,12 +253,32 @@ class AssistantBot(Bot):
             strong_ai_model=self._get_strong_ai_model(),
             resource_manager=self.resource_manager,
         )
+        on_delta = None
+        if self.answer_streaming_enabled and self.chat_id is not None:
+            self.answer_stream = self.platform.answer_stream(self.chat_id)
+            if self.answer_stream is not None:
+                on_delta = self._show_answer_draft
         ai_answer = await chat_completion.generate_answer(
-            messages, debug_info=debug_info, do_interrupt=do_interrupt
+            messages, debug_info=debug_info, do_interrupt=do_interrupt, on_delta=on_delta
         )
         answer = self._ai_response_to_answer(ai_answer)
         return answer
 
+    @property
+    def answer_streaming_enabled(self) -> bool:
+        return getattr(settings, 'ANSWER_STREAMING_ENABLED', True)
+
+    async def _show_answer_draft(self, text: str):
+        if '<think>' in text and '</think>' not in text:
+            # Still thinking
+            return
+        text = self._clean_thinking(text).strip()
+        if text.startswith('#'):
+            # Tagged answer, only the text tag is shown
+            text = extract_tagged_text(text).get('text', '')
+        if text:
+            await self.answer_stream.update(text)
+
     def _extract_thinking_tag(self, text: str) -> Optional[str]:
         # Extract content between <think> and </think>
         match = re.search(r'<think>(.*?)</think>', text, flags=re.DOTALL)
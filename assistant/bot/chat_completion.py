@@ -1,8 +1,9 @@
 import logging
-from typing import Optional
+from contextlib import aclosing
+from typing import Optional, Callable, Awaitable, List
 
-from assistant.ai.domain import AIResponse
-from assistant.ai.providers.base import AIDebugger
+from assistant.ai.domain import AIResponse, Message, collect_response
+from assistant.ai.providers.base import AIDebugger, AIProvider
 from assistant.ai.services.ai_service import get_ai_provider, extract_tagged_text
 from assistant.bot.domain import Answer, SingleAnswer, Button, NoResourceFound
 from assistant.bot.models import Bot
@@ -21,7 +22,17 @@ class ChatCompletion:
         self.strong_ai_model = strong_ai_model
         self.resource_manager = resource_manager
 
-    async def generate_answer(self, messages: list, debug_info: dict = None, do_interrupt=None) -> AIResponse:
+    async def generate_answer(
+            self,
+            messages: list,
+            debug_info: dict = None,
+            do_interrupt=None,
+            on_delta: Callable[[str], Awaitable] = None,
+    ) -> AIResponse:
+        """
+        Generate the answer to the dialog. If `on_delta` is given, the answer is streamed
+        and `on_delta` is called with the text generated so far.
+        """
 
         if messages:
             debug_info['query'] = messages[-1]['content']
@@ -40,6 +51,28 @@ class ChatCompletion:
         strong_ai = get_ai_provider(self.strong_ai_model)
 
         with AIDebugger(strong_ai, debug_info, 'final'):
-            ai_response = await strong_ai.get_response(enriched_messages)
+            if on_delta is None:
+                ai_response = await strong_ai.get_response(enriched_messages)
+            else:
+                ai_response = await self._stream_response(strong_ai, enriched_messages, on_delta)
 
         return ai_response
+
+    @staticmethod
+    async def _stream_response(
+            ai: AIProvider,
+            messages: List[Message],
+            on_delta: Callable[[str], Awaitable],
+    ) -> AIResponse:
+        text = ''
+
+        async def deltas():
+            nonlocal text
+            async with aclosing(ai.get_response_stream(messages)) as stream:
+                async for delta in stream:
+                    if delta.text:
+                        text += delta.text
+                        await on_delta(text)
+                    yield delta
+
+        return await collect_response(deltas())
@@ -278,6 +278,30 @@ def answer_from_dict(data: Dict) -> Answer:
         return SingleAnswer.from_dict(data)
 
 
+class AnswerStream(ABC):
+    """
+    Draft of the answer shown to the user while the answer is being generated.
+    """
+
+    @abstractmethod
+    async def update(self, text: str):
+        """Show the text generated so far. Must not block the generation for long."""
+        pass
+
+    @abstractmethod
+    async def finish(self, answer: SingleAnswer) -> bool:
+        """
+        Replace the draft with the final answer.
+        Returns False if the answer has to be posted as usual (the draft is removed then).
+        """
+        pass
+
+    @abstractmethod
+    async def cancel(self):
+        """Remove the draft, the answer is not going to be posted."""
+        pass
+
+
 class BotPlatform(ABC):
 
     @property
@@ -298,6 +322,13 @@ class BotPlatform(ABC):
     async def action_typing(self, chat_id):
         pass
 
+    def answer_stream(self, chat_id: str) -> Optional[AnswerStream]:
+        """
+        Start a draft of the answer to the chat, finished by the next `post_answer` to the chat.
+        Platforms which can't edit the sent messages don't stream the answers.
+        """
+        return None
+
 
 class Bot(ABC):
 
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.13 on 2026-10-17 01:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assistant_bot', '0006_botuser_phone_number_instance_is_unavailable'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bot',
+            name='corpus_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -19,6 +19,9 @@ class Bot(models.Model):
     is_whitelist_enabled = models.BooleanField(default=False)
     telegram_whitelist = models.TextField(null=True, blank=True)
 
+    # Bumped every time a processing of the bot documents is completed (the retrieval cache key part)
+    corpus_version = models.PositiveIntegerField(default=0, editable=False)
+
     @property
     def callback_url(self):
         base_callback_url = getattr(settings, 'TELEGRAM_BASE_CALLBACK_URL', None)
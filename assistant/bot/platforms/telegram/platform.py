@@ -1,11 +1,14 @@
 import logging
+from typing import Dict, Optional
+
 import telegram
 from telegram import Update as TelegramUpdate, Bot, ReplyKeyboardRemove
 from rest_framework.request import Request
 
-from assistant.bot.domain import BotPlatform, Update, User, SingleAnswer, Photo, UnknownUpdate
+from assistant.bot.domain import BotPlatform, Update, User, SingleAnswer, Photo, UnknownUpdate, AnswerStream
 from assistant.bot.exceptions import UserUnavailableError
 from assistant.bot.platforms.telegram.format import TelegramMarkdownV2FormattedText
+from assistant.bot.platforms.telegram.stream import TelegramAnswerStream, inline_keyboard_markup
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +21,7 @@ class TelegramBotPlatform(BotPlatform):
 
     def __init__(self, token: str):
         self.bot = Bot(token=token)
+        self._answer_streams: Dict[str, TelegramAnswerStream] = {}
 
     async def convert_telegram_update(self, telegram_update: TelegramUpdate) -> Update:
         """Convert a Telegram update to our Update object."""
@@ -80,21 +84,19 @@ class TelegramBotPlatform(BotPlatform):
         telegram_update = TelegramUpdate.de_json(request.data, self.bot)
         return await self.convert_telegram_update(telegram_update)
 
+    def answer_stream(self, chat_id: str) -> Optional[AnswerStream]:
+        stream = self._answer_streams[str(chat_id)] = TelegramAnswerStream(self.bot, str(chat_id))
+        return stream
+
     async def post_answer(self, chat_id: str, answer: SingleAnswer):
         logger.info(f"Answer Text: {answer.text}, Audio Present: {answer.audio is not None}")
 
+        stream = self._answer_streams.pop(str(chat_id), None)
+        if stream is not None and await stream.finish(answer):
+            return
+
         if answer.buttons:
-            reply_markup = telegram.InlineKeyboardMarkup(
-                [
-                    [
-                        telegram.InlineKeyboardButton(
-                            button.text, callback_data=button.callback_data, url=button.url,
-                        )
-                        for button in button_row
-                    ]
-                    for button_row in answer.buttons
-                ]
-            )
+            reply_markup = inline_keyboard_markup(answer.buttons)
         elif answer.reply_keyboard:
             all_buttons = [button for button_row in answer.reply_keyboard for button in button_row]
             request_contact = any(button.request_contact for button in all_buttons)
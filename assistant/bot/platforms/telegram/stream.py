@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import time
+from datetime import timedelta
+from typing import Optional
+
+import telegram
+from django.conf import settings
+from telegram import Bot, ReplyKeyboardRemove
+
+from assistant.bot.domain import AnswerStream, SingleAnswer
+from assistant.bot.platforms.telegram.format import TelegramMarkdownV2FormattedText
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_MAX_LENGTH = 4096
+
+
+class TelegramAnswerStream(AnswerStream):
+    """
+    Sends the first generated text as a plain message and edits it as the generation goes,
+    at most once per `TELEGRAM_STREAM_EDIT_INTERVAL` seconds (Telegram limits the edits of a chat).
+    The final answer replaces the draft with the formatted text and the buttons.
+    """
+
+    def __init__(self, bot: Bot, chat_id: str, edit_interval: float = None, min_length: int = None):
+        self.bot = bot
+        self.chat_id = chat_id
+        self._edit_interval = edit_interval if edit_interval is not None else \
+            getattr(settings, 'TELEGRAM_STREAM_EDIT_INTERVAL', 1.5)
+        self._min_length = min_length if min_length is not None else \
+            getattr(settings, 'TELEGRAM_STREAM_MIN_LENGTH', 20)
+        self._text = ''
+        self._shown_text = ''
+        self._message_id: Optional[int] = None
+        self._next_edit_at = 0.
+        self._task: Optional[asyncio.Task] = None
+        self._stopped = False
+
+    async def update(self, text: str):
+        self._text = text
+        if self._stopped or len(text) < self._min_length:
+            return
+        if self._task is not None and not self._task.done():
+            return
+        if time.monotonic() < self._next_edit_at:
+            return
+        # The request runs in background, the generation goes on meanwhile
+        self._task = asyncio.create_task(self._show(text))
+
+    async def _show(self, text: str):
+        if len(text) > MESSAGE_MAX_LENGTH - 100:
+            # The rest is shown by the final answer
+            text = text[:MESSAGE_MAX_LENGTH - 100] + '…'
+            self._stopped = True
+        if text == self._shown_text:
+            return
+        try:
+            if self._message_id is None:
+                message = await self.bot.send_message(
+                    chat_id=self.chat_id,
+                    text=text,
+                    reply_markup=ReplyKeyboardRemove(),
+                )
+                self._message_id = message.message_id
+            else:
+                await self.bot.edit_message_text(
+                    chat_id=self.chat_id,
+                    message_id=self._message_id,
+                    text=text,
+                )
+            self._shown_text = text
+            self._next_edit_at = time.monotonic() + self._edit_interval
+        except telegram.error.RetryAfter as e:
+            retry_after = e.retry_after
+            if isinstance(retry_after, timedelta):
+                retry_after = retry_after.total_seconds()
+            logger.warning(f'Answer draft to {self.chat_id} is throttled for {retry_after} s')
+            self._next_edit_at = time.monotonic() + retry_after
+        except telegram.error.BadRequest as e:
+            if 'not modified' not in e.message:
+                logger.warning(f'Failed to update answer draft to {self.chat_id}: {e}')
+                self._stopped = True
+        except telegram.error.TelegramError as e:
+            logger.warning(f'Failed to update answer draft to {self.chat_id}: {e}')
+            self._stopped = True
+
+    async def _wait_update(self):
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+    async def finish(self, answer: SingleAnswer) -> bool:
+        await self._wait_update()
+        self._stopped = True
+        if self._message_id is None:
+            return False
+        if answer.audio or answer.reply_keyboard or not answer.text:
+            # Can't be set by an edit
+            await self.cancel()
+            return False
+
+        text_content = TelegramMarkdownV2FormattedText(answer.text)
+        reply_markup = inline_keyboard_markup(answer.buttons) if answer.buttons else None
+        for parse_mode in ('MarkdownV2', None):
+            try:
+                logger.debug(f'Editing Telegram answer draft to {self.chat_id} with parse_mode={parse_mode}')
+                await self.bot.edit_message_text(
+                    chat_id=self.chat_id,
+                    message_id=self._message_id,
+                    text=text_content,
+                    reply_markup=reply_markup,
+                    parse_mode=parse_mode,
+                    disable_web_page_preview=answer.disable_web_page_preview,
+                )
+                return True
+            except telegram.error.BadRequest as e:
+                if 'not modified' in e.message:
+                    return True
+                if "Can't parse" in e.message and parse_mode == 'MarkdownV2':
+                    logger.warning(f'Can\'t parse message with parse_mode=MarkdownV2: {e}. Retrying without parse mode.')
+                    continue
+                logger.warning(f'Failed to finish answer draft to {self.chat_id}: {e}')
+                break
+            except telegram.error.TelegramError as e:
+                logger.warning(f'Failed to finish answer draft to {self.chat_id}: {e}')
+                break
+
+        await self.cancel()
+        return False
+
+    async def cancel(self):
+        await self._wait_update()
+        self._stopped = True
+        if self._message_id is None:
+            return
+        message_id, self._message_id = self._message_id, None
+        try:
+            await self.bot.delete_message(chat_id=self.chat_id, message_id=message_id)
+        except telegram.error.TelegramError as e:
+            logger.warning(f'Failed to delete answer draft to {self.chat_id}: {e}')
+
+
+def inline_keyboard_markup(buttons) -> telegram.InlineKeyboardMarkup:
+    return telegram.InlineKeyboardMarkup(
+        [
+            [
+                telegram.InlineKeyboardButton(
+                    button.text, callback_data=button.callback_data, url=button.url,
+                )
+                for button in button_row
+            ]
+            for button_row in buttons
+        ]
+    )
@@ -8,7 +8,7 @@ from assistant.bot.services.context_service.state import ContextProcessingState
 from assistant.bot.services.context_service.steps.base import ContextProcessingStep
 from assistant.bot.services.context_service.steps.choose_known_question import ChooseKnownQuestionStep
 from assistant.bot.services.context_service.steps.classify import ClassifyStep
-from assistant.bot.services.context_service.steps.embeddings import EmbeddingsStep
+from assistant.bot.services.context_service.steps.embeddings import ScopedEmbeddingsStep
 from assistant.bot.services.context_service.steps.fill_info import FillInfoStep
 from assistant.bot.services.context_service.steps.final_prompt import FinalPromptStep
 from assistant.bot.services.context_service.steps.interruptions import InterruptIfSmallTalkStep
@@ -41,7 +41,7 @@ class ContextService:
         Enriches the context of the messages.
         """
         await self._pipeline([
-            [ClassifyStep, EmbeddingsStep],
+            [ClassifyStep, ScopedEmbeddingsStep],
             # ReformulateQuestionStep,
             InterruptIfSmallTalkStep,
             ChooseKnownQuestionStep,
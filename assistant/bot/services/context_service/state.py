@@ -1,3 +1,4 @@
+import asyncio
 from typing import List
 
 from assistant.ai.domain import Message
@@ -8,6 +9,7 @@ class ContextProcessingState:
 
     messages: List[Message] = None
     topic: WikiDocument = None
+    query_embedding: List[float] = None
     related_questions: List[Question] = None
     documents: List[Document] = None
     final_info: str = None
@@ -15,6 +17,10 @@ class ContextProcessingState:
 
     done: bool = False
 
+    def __init__(self):
+        # Set by `ClassifyStep` once the `topic` is known
+        self.classified = asyncio.Event()
+
     @property
     def user_question(self) -> str:
         return self.messages[-1]['content'].strip()
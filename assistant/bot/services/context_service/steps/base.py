@@ -4,6 +4,7 @@ from abc import ABC, abstractmethod
 from typing import Dict
 
 from assistant.ai.providers.base import AIDebugger
+from assistant.ai.providers.cached import response_cache_enabled
 from assistant.ai.services.ai_service import get_ai_provider
 from assistant.bot.models import Bot
 from assistant.bot.services.context_service.state import ContextProcessingState
@@ -13,6 +14,8 @@ from assistant.utils.debug import TimeDebugger
 class ContextProcessingStep(ABC):
 
     debug_info_key: str = None
+    # Cache the validated responses of the fast AI (if `AI_RESPONSE_CACHE_ENABLED`)
+    ai_response_cache: bool = False
 
     def __init__(
             self,
@@ -24,7 +27,9 @@ class ContextProcessingStep(ABC):
     ):
         self._bot = bot
         self._state = state
-        self._fast_ai = get_ai_provider(fast_ai_model)
+        self._fast_ai = get_ai_provider(
+            fast_ai_model, cached=response_cache_enabled(self.__class__.__name__, self.ai_response_cache)
+        )
         self._strong_ai = get_ai_provider(strong_ai_model)
         if self.debug_info_key is not None:
             if self.debug_info_key not in debug_info:
@@ -10,6 +10,7 @@ class CheckContextStep(ContextProcessingStep):
     """
 
     debug_info_key = 'check_context'
+    ai_response_cache = True
 
     @ai_debugger
     async def run(self):
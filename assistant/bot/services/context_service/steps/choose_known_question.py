@@ -12,6 +12,7 @@ class ChooseKnownQuestionStep(ContextProcessingStep):
     """
 
     debug_info_key = 'known_question_choice'
+    ai_response_cache = True
 
     prompt = (
         "The user asked a question:\n"
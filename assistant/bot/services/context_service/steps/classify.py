@@ -16,6 +16,7 @@ class ClassifyStep(ContextProcessingStep):
     """
 
     debug_info_key = 'classify'
+    ai_response_cache = True
 
     _offtopic_examples = [
         ("Hello", "Small talk"),
@@ -25,6 +26,12 @@ class ClassifyStep(ContextProcessingStep):
 
     @ai_debugger
     async def run(self):
+        try:
+            await self._classify()
+        finally:
+            self._state.classified.set()
+
+    async def _classify(self):
         wds = await (sync_to_async(
             lambda: list(WikiDocument.objects.filter(
                 bot=self._bot, processing__status=WikiDocumentProcessing.Status.COMPLETED,
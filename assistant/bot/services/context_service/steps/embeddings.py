@@ -1,10 +1,16 @@
+import asyncio
 from itertools import chain
+from typing import List, Tuple, Dict, Optional
 
 from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import QuerySet
+
 from assistant.bot.services.context_service.steps.base import ContextProcessingStep, time_debugger
-from assistant.storage.models import Question, Document, WikiDocumentProcessing
+from assistant.storage.models import Question, Document
+from assistant.rag.services.retrieval_cache import get_cached_retrieval, cache_retrieval
 from assistant.rag.services.search_service import embedding_search, embedding_search_questions, \
-    get_embedding
+    get_embedding, hybrid_search_questions, hybrid_search_enabled, scope_queryset
 from assistant.utils.debug import TimeDebugger
 
 
@@ -16,35 +22,80 @@ class EmbeddingsStep(ContextProcessingStep):
     debug_info_key = 'embedding_search'
     debugger_class = TimeDebugger
 
+    _query_embedding_task: Optional[asyncio.Future] = None
+
     @time_debugger
     async def run(self):
-        search_query = self._state.user_question
-        self._logger.debug(f'Search query: {search_query}')
+        self._logger.debug(f'Search query: {self._state.user_question}')
 
-        query_embedding = await get_embedding(search_query)
+        questions, documents = await self._retrieve()
+        self._state.related_questions = questions
+        self._state.documents = documents
 
-        qs = Question.objects.filter(
-            document__wiki__bot=self._bot,
-            document__wiki__processing__status=WikiDocumentProcessing.Status.COMPLETED
-        )
-        questions = list(await embedding_search_questions(query_embedding, qs, n=5))
+    async def _retrieve(self) -> Tuple[List[Question], List[Document]]:
+        return await self._cached_search(self._state.user_question, self._queryset(), scope='all')
+
+    def _queryset(self) -> QuerySet:
+        return Question.objects.filter(bot=self._bot, is_live=True)
+
+    async def _get_query_embedding(self) -> List[float]:
+        if self._state.query_embedding is None:
+            if self._query_embedding_task is None:
+                # Shared by the concurrent searches, so a cancelled one does not cancel it for the others
+                self._query_embedding_task = asyncio.ensure_future(get_embedding(self._state.user_question))
+            self._state.query_embedding = await asyncio.shield(self._query_embedding_task)
+        return self._state.query_embedding
+
+    async def _cached_search(
+            self,
+            search_query: str,
+            qs: QuerySet,
+            scope: str,
+            debug_info: Dict = None,
+    ) -> Tuple[List[Question], List[Document]]:
+        """
+        Search through the retrieval cache of the bot corpus version.
+        """
+        if debug_info is None:
+            debug_info = self._debug_info
+        cached = await get_cached_retrieval(self._bot, scope, search_query)
+        if cached is not None:
+            debug_info['cache_hit'] = True
+            return cached
+
+        query_embedding = await self._get_query_embedding()
+        questions, documents = await self._search(search_query, query_embedding, qs, debug_info)
+        await cache_retrieval(self._bot, scope, search_query, questions, documents)
+        return questions, documents
+
+    async def _search(
+            self,
+            search_query: str,
+            query_embedding: List[float],
+            qs: QuerySet,
+            debug_info: Dict,
+    ) -> Tuple[List[Question], List[Document]]:
+        if hybrid_search_enabled():
+            questions = list(await hybrid_search_questions(search_query, query_embedding, qs, n=5))
+        else:
+            questions = list(await embedding_search_questions(query_embedding, qs, n=5))
 
-        self._state.related_questions = questions
-        self._debug_info['related_questions'] = [
+        debug_info['related_questions'] = [
             f"[{q.id} {1 - q.distance}] {q.text}" for q in questions[:5]
         ]
 
         # documents_q_prec = await embedding_search(search_query, max_scores_n=1, top_n=5, field='questions')  #, root=self._state.topic)
 
-        if questions and questions[0].distance < 0.05:
-            self._debug_info['the_same_question'] = questions[0].text
+        closest_question = min(questions, key=lambda q: q.distance) if questions else None
+        if closest_question and closest_question.distance < 0.05:
+            debug_info['the_same_question'] = closest_question.text
             documents = [
                 await sync_to_async(
-                    lambda: (Document.objects.get(id=questions[0].document_id), 1 - questions[0].distance)
+                    lambda: (Document.objects.get(id=closest_question.document_id), 1 - closest_question.distance)
                 )()
             ]
         else:
-            documents_q_broad = await embedding_search(search_query, qs, max_scores_n=5, top_n=5)  #, root=self._state.topic)
+            documents_q_broad = await embedding_search(search_query, qs, max_scores_n=5, top_n=5)
             # documents_s_prec = await embedding_search(search_query, max_scores_n=1, top_n=5, field='sentences', root=root)
             # documents_s_broad = await embedding_search(search_query, max_scores_n=5, top_n=5, field='sentences', root=root)
 
@@ -60,10 +111,9 @@ class EmbeddingsStep(ContextProcessingStep):
         # uniq by doc.id
         documents = list({doc[0].id: doc for doc in documents}.values())
 
-        self._debug_info['documents'] = [f"[{d[0].id} {d[1]}] {d[0].name}" for d in documents]
+        debug_info['documents'] = [f"[{d[0].id} {d[1]}] {d[0].name}" for d in documents]
 
-        documents = [doc[0] for doc in documents]
-        self._state.documents = documents
+        return questions, [doc[0] for doc in documents]
 
     def _log_scores(self, docs):
         self._logger.debug(
@@ -75,3 +125,49 @@ class EmbeddingsStep(ContextProcessingStep):
                 )
             )
         )
+
+
+class ScopedEmbeddingsStep(EmbeddingsStep):
+    """
+    Search inside the wiki subtree of the topic found by `ClassifyStep`, which must run in parallel.
+    The query is embedded while the question is classified. The whole-bot search only runs
+    if there is no topic or the scoped search finds fewer than `TOPIC_SEARCH_MIN_HITS` questions or no documents.
+    """
+
+    async def _retrieve(self) -> Tuple[List[Question], List[Document]]:
+        if not getattr(settings, 'TOPIC_SCOPED_SEARCH', True):
+            return await super()._retrieve()
+
+        self._prefetch_query_embedding()
+        try:
+            scoped = await self._scoped_search()
+        except BaseException:
+            if self._query_embedding_task is not None:
+                self._query_embedding_task.cancel()
+            raise
+        if scoped is None:
+            return await super()._retrieve()
+        return scoped
+
+    def _prefetch_query_embedding(self):
+        if self._state.query_embedding is None and self._query_embedding_task is None:
+            self._query_embedding_task = asyncio.ensure_future(get_embedding(self._state.user_question))
+            # Not awaited on a retrieval cache hit
+            self._query_embedding_task.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+    async def _scoped_search(self) -> Optional[Tuple[List[Question], List[Document]]]:
+        await self._state.classified.wait()
+        topic = self._state.topic
+        if topic is None:
+            return None
+
+        debug_info = self._debug_info.setdefault('scoped', {})
+        questions, documents = await self._cached_search(
+            self._state.user_question, scope_queryset(self._queryset(), topic), scope=f'topic:{topic.id}',
+            debug_info=debug_info,
+        )
+        if len(questions) < getattr(settings, 'TOPIC_SEARCH_MIN_HITS', 3) or not documents:
+            self._logger.debug(f'Not enough results in the topic {topic}, the global search results are used')
+            debug_info['fallback'] = True
+            return None
+        return questions, documents
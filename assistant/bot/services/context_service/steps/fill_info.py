@@ -18,16 +18,20 @@ class FillInfoStep(ContextProcessingStep):
         if not documents:
             return
         max_tokens = int(self._fast_ai.context_size * self.max_tokens_share)
+        blocks = [
+            f"# {document.wiki.path}:\n```\n{document.content}\n```\n"
+            for document in documents[:self.max_documents]
+        ]
         output = ''
+        tokens = 0
         n = 0
-        while documents and n < self.max_documents:
-            document = documents.pop(0)
-            new_output = f"{output}# {document.wiki.path}:\n```\n{document.content}\n```\n"
-            if output and self._fast_ai.calculate_tokens(new_output) > max_tokens:
+        for block, block_tokens in zip(blocks, self._fast_ai.calculate_tokens_batch(blocks)):
+            if output and tokens + block_tokens > max_tokens:
                 break
-            output = new_output
+            output += block
+            tokens += block_tokens
             n += 1
-        self._logger.info(f'Filled output with {n} documents with {self._fast_ai.calculate_tokens(output)} tokens.')
+        self._logger.info(f'Filled output with {n} documents with {tokens} tokens.')
         self._state.documents = self._state.documents[:n]
         self._state.final_info = output
         self._state.context_is_ok = True
@@ -1,9 +1,12 @@
 import logging
 
 import requests
-from django.db.models.signals import post_save, pre_save
+from celery import signals as celery_signals
+from django.db import transaction
+from django.db.models.signals import post_save, pre_save, post_delete
 from django.dispatch import receiver
 
+from assistant.ai.utils.http import close_all_http_sessions
 from assistant.bot.models import Bot
 
 
@@ -38,9 +41,35 @@ def bot_post_save(sender, instance, created, **kwargs):
         logging.debug(f'Webhook for bot {instance.codename} is already set')
 
 
+@receiver(post_save, sender=Bot)
+def bot_vector_indexes_post_save(sender, instance, created, **kwargs):
+    from assistant.processing.tasks import create_bot_vector_indexes_task
+    from assistant.rag.services.index_service import per_bot_vector_indexes_enabled
+
+    if created and per_bot_vector_indexes_enabled():
+        bot_id = instance.id
+        transaction.on_commit(lambda: create_bot_vector_indexes_task.delay(bot_id))
+
+
+@receiver(post_delete, sender=Bot)
+def bot_vector_indexes_post_delete(sender, instance, **kwargs):
+    from assistant.processing.tasks import drop_bot_vector_indexes_task
+    from assistant.rag.services.index_service import per_bot_vector_indexes_enabled
+
+    if per_bot_vector_indexes_enabled():
+        bot_id = instance.id
+        transaction.on_commit(lambda: drop_bot_vector_indexes_task.delay(bot_id))
+
+
 def _set_webhook(telegram_token: str, url: str):
     telegram_api_url = f"https://api.telegram.org/bot{telegram_token}/setWebhook"
     response = requests.post(telegram_api_url, data={'url': url}, timeout=30)
 
     if response.status_code != 200:
         raise RuntimeError(f"Telegram API error: {response.text}")
+
+
+@celery_signals.worker_process_shutdown.connect
+@celery_signals.worker_shutdown.connect
+def close_http_sessions_on_worker_shutdown(**kwargs):
+    close_all_http_sessions()
@@ -6,6 +6,7 @@ from asgiref.sync import sync_to_async, async_to_sync
 from celery import shared_task
 from rest_framework.generics import get_object_or_404
 
+from assistant.ai.utils.http import closing_http_sessions
 from assistant.assistant.queue import CeleryQueues
 from assistant.bot.domain import Update, MultiPartAnswer, BotPlatform, SingleAnswer, User, Answer, Button, answer_from_dict
 from assistant.bot.exceptions import UserUnavailableError
@@ -21,7 +22,7 @@ logger = logging.getLogger(__name__)
 @shared_task(queue=CeleryQueues.QUERY.value)
 def answer_task(*args, **kwargs):
     logger.info('Answer Task started')
-    return async_to_sync(_answer_task)(*args, **kwargs)
+    return async_to_sync(closing_http_sessions(_answer_task))(*args, **kwargs)
 
 
 async def _answer_task(bot_codename: str, dialog_id: int, platform_codename: str, update: Dict):
@@ -83,7 +84,7 @@ async def _post_answer(platform: BotPlatform, chat_id: str, answer):
 def send_answer_task(*args, **kwargs):
     """Sends a single pre-defined answer to a specific chat ID."""
     logger.info('Send Answer Task started')
-    return async_to_sync(_send_answer_task)(*args, **kwargs)
+    return async_to_sync(closing_http_sessions(_send_answer_task))(*args, **kwargs)
 
 
 async def _send_answer_task(bot_codename: str, platform_codename: str, chat_id: str, answer_data: Dict):
@@ -8,7 +8,8 @@ from django.conf import settings
 from django.utils.module_loading import import_string
 
 from assistant.processing.documents.steps.base import DocumentProcessingStep
-from assistant.processing.documents.steps.embeddings import SentencesEmbeddingsStep, QuestionsEmbeddingsStep
+from assistant.processing.documents.steps.embeddings import SentencesEmbeddingsStep, QuestionsEmbeddingsStep, \
+    ContentEmbeddingsStep
 from assistant.processing.documents.steps.formatter import DocumentFormatStep
 from assistant.processing.documents.steps.questions import GenerateQuestionsStep, MergeQuestionsStep
 from assistant.processing.documents.steps.sentences import ExtractSentencesStep
@@ -40,6 +41,7 @@ class DefaultDocumentProcessor(DocumentProcessor):
             GenerateQuestionsStep,
             SentencesEmbeddingsStep,
             QuestionsEmbeddingsStep,
+            ContentEmbeddingsStep,
             MergeQuestionsStep,
         ]
 
@@ -1,17 +1,24 @@
 import logging
 from abc import ABC, abstractmethod
 
+from assistant.ai.providers.cached import response_cache_enabled
 from assistant.storage.models import Document
 
 
 class DocumentProcessingStep(ABC):
 
     _document: Document
+    # Cache the validated AI responses (if `AI_RESPONSE_CACHE_ENABLED`), so re-runs don't pay for them again
+    ai_response_cache: bool = True
 
     def __init__(self, document: Document):
         self._document = document
         self._logger = logging.getLogger(self.__class__.__name__)
 
+    @property
+    def ai_response_cache_enabled(self) -> bool:
+        return response_cache_enabled(self.__class__.__name__, self.ai_response_cache)
+
     @abstractmethod
     def run(self):
         pass
@@ -2,11 +2,11 @@ import logging
 
 from asgiref.sync import sync_to_async
 
-from assistant.ai.services.ai_service import get_ai_embdedder
 from django.conf import settings
 
 from assistant.processing.documents.steps.base import DocumentProcessingStep
-from assistant.storage.models import Document, Sentence, Question
+from assistant.rag.services.embeddings_service import save_embeddings, StoredEmbedder, save_building_embeddings
+from assistant.storage.models import Document
 
 logger = logging.getLogger(__name__)
 
@@ -15,7 +15,7 @@ class SentencesEmbeddingsStep(DocumentProcessingStep):
 
     def __init__(self, document: Document):
         super().__init__(document)
-        self._ai_embedder = get_ai_embdedder(settings.EMBEDDING_AI_MODEL)
+        self._ai_embedder = StoredEmbedder(settings.EMBEDDING_AI_MODEL)
 
     async def run(self):
         self._logger.info(f'Embedding sentences for document {self._document}')
@@ -32,11 +32,10 @@ class SentencesEmbeddingsStep(DocumentProcessingStep):
             assert len(sentences_embeddings) == len(sentences)
             for e in sentences_embeddings:
                 assert len(e) > 0
-            for s, e in zip(sentences, sentences_embeddings):
-                s.embedding = e
             await (sync_to_async(
-                lambda: Sentence.objects.bulk_update(sentences, fields=['embedding'])
+                lambda: save_embeddings(sentences, sentences_embeddings)
             ))()
+            await save_building_embeddings(sentences, [s.text for s in sentences])
 
         logger.debug(f'Sentences embedded for document {self._document}')
 
@@ -45,7 +44,7 @@ class QuestionsEmbeddingsStep(DocumentProcessingStep):
 
     def __init__(self, document: Document):
         super().__init__(document)
-        self._ai_embedder = get_ai_embdedder(settings.EMBEDDING_AI_MODEL)
+        self._ai_embedder = StoredEmbedder(settings.EMBEDDING_AI_MODEL)
 
     async def run(self):
         self._logger.info(f'Embedding questions for document {self._document}')
@@ -62,11 +61,10 @@ class QuestionsEmbeddingsStep(DocumentProcessingStep):
             assert len(questions_embeddings) == len(questions)
             for e in questions_embeddings:
                 assert len(e) > 0
-            for q, e in zip(questions, questions_embeddings):
-                q.embedding = e
             await (sync_to_async(
-                lambda: Question.objects.bulk_update(questions, fields=['embedding'])
+                lambda: save_embeddings(questions, questions_embeddings)
             ))()
+            await save_building_embeddings(questions, [q.text for q in questions])
 
         logger.debug(f'Questions embedded for document {self._document}')
 
@@ -75,16 +73,20 @@ class ContentEmbeddingsStep(DocumentProcessingStep):
 
     def __init__(self, document: Document):
         super().__init__(document)
-        self._ai_embedder = get_ai_embdedder(settings.EMBEDDING_AI_MODEL)
+        self._ai_embedder = StoredEmbedder(settings.EMBEDDING_AI_MODEL)
 
     async def run(self):
         self._logger.info(f'Embedding content for document {self._document}')
 
+        if not self._document.content.strip():
+            logger.debug(f'No content to embed for document {self._document}')
+            return
+
         content_embedding = (await self._ai_embedder.embeddings([self._document.content]))[0]
         assert len(content_embedding) > 0
-        self._document.content_embedding = content_embedding
         await (sync_to_async(
-            self._document.save
-        ))(update_fields=['content_embedding'])
+            lambda: save_embeddings([self._document], [content_embedding], field='content_embedding')
+        ))()
+        await save_building_embeddings([self._document], [self._document.content], field='content_embedding')
 
         logger.debug(f'Content embedded for document {self._document}')
\ No newline at end of file
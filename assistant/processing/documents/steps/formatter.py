@@ -12,7 +12,8 @@ class DocumentFormatStep(DocumentProcessingStep):
     def __init__(self, document):
         super().__init__(document)
         self._ai = AIDialog(
-            settings.FORMAT_DOCUMENTS_AI_MODEL
+            settings.FORMAT_DOCUMENTS_AI_MODEL,
+            cached=self.ai_response_cache_enabled,
         )
 
     async def run(self):
@@ -8,7 +8,9 @@ from django.conf import settings
 from assistant.processing.documents.steps.base import DocumentProcessingStep
 from assistant.processing.utils import json_prompt, split_text_by_parts
 from assistant.storage.models import Document, Question
-from assistant.rag.services.search_service import embedding_search_questions
+from assistant.rag.backends.postgres import PgVectorSearchBackend
+from assistant.rag.services.embeddings_service import load_embeddings
+from assistant.rag.services.search_service import embedding_search_questions_many
 from assistant.utils.language import get_language
 from assistant.utils.repeat_until import repeat_until
 
@@ -21,7 +23,8 @@ class GenerateQuestionsStep(DocumentProcessingStep):
     def __init__(self, document: Document):
         super().__init__(document)
         self._ai = AIDialog(
-            settings.QUESTIONS_AI_MODEL
+            settings.QUESTIONS_AI_MODEL,
+            cached=self.ai_response_cache_enabled,
         )
 
     async def run(self):
@@ -106,8 +109,11 @@ class MergeQuestionsStep(DocumentProcessingStep):
     def __init__(self, document: Document):
         super().__init__(document)
         self._ai = AIDialog(
-            settings.QUESTIONS_AI_MODEL
+            settings.QUESTIONS_AI_MODEL,
+            cached=self.ai_response_cache_enabled,
         )
+        # The searched queryset differs for every document, so in-memory indexes would not be reused
+        self._search_backend = PgVectorSearchBackend()
 
     async def run(self):
         self._logger.info(f"Merge questions for document {self._document}")
@@ -118,15 +124,24 @@ class MergeQuestionsStep(DocumentProcessingStep):
         if not questions:
             return
 
-        for q in questions:
-            similar_question = await embedding_search_questions(
-                query_embedding=q.embedding,
-                qs=Question.objects.filter(document__id__lt=self._document.id),
-                n=1
-            )
+        embeddings = await sync_to_async(load_embeddings)(questions)
+        embedded = [(q, e) for q, e in zip(questions, embeddings) if e is not None]
+        questions = [q for q, _ in embedded]
+        similar_questions_lists = await embedding_search_questions_many(
+            query_embeddings=[e for _, e in embedded],
+            qs=Question.objects.filter(document__id__lt=self._document.id),
+            n=1,
+            backend=self._search_backend,
+            ef_search=getattr(settings, 'HNSW_EF_SEARCH_OFFLINE', None),
+        )
+        deleted_question_ids = set()
+
+        for q, similar_question in zip(questions, similar_questions_lists):
             if not similar_question:
                 continue
             similar_question = similar_question[0]
+            if similar_question.id in deleted_question_ids:
+                continue
 
             self._logger.info(f"Question: {q.text}")
             self._logger.info(f"Similar question: {similar_question.text}")
@@ -136,7 +151,10 @@ class MergeQuestionsStep(DocumentProcessingStep):
                 is_similar = await self._check_similarity(q.text, similar_question.text)
                 self._logger.info(f"Is similar: {is_similar}")
                 if is_similar:
+                    similar_question_id = similar_question.id
                     await self._merge_queries(q, similar_question)
+                    if similar_question.pk is None:
+                        deleted_question_ids.add(similar_question_id)
 
     async def _check_similarity(self, question: str, similar_question: str) -> bool:
         if question == similar_question:
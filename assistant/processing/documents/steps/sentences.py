@@ -21,7 +21,8 @@ class ExtractSentencesStep(DocumentProcessingStep):
     def __init__(self, document: Document):
         super().__init__(document)
         self._ai = AIDialog(
-            settings.SENTENCES_AI_MODEL
+            settings.SENTENCES_AI_MODEL,
+            cached=self.ai_response_cache_enabled,
         )
 
     async def run(self):
@@ -3,10 +3,15 @@ import logging
 from asgiref.sync import async_to_sync
 from celery import shared_task, chain, group
 from django.db import transaction
+from django.db.models import F
 
+from assistant.ai.utils.http import closing_http_sessions
+from assistant.utils.bulkhead import background_priority
 from assistant.assistant.queue import CeleryQueues
+from assistant.bot.models import Bot
 from assistant.processing.documents.processor import process_document
-from assistant.processing.wiki import split_wiki_document
+from assistant.processing.wiki import split_wiki_document, update_search_fields
+from assistant.rag.services.index_service import create_bot_vector_indexes, drop_bot_vector_indexes
 from assistant.storage.models import WikiDocument, Document, WikiDocumentProcessing
 
 logger = logging.getLogger(__name__)
@@ -28,7 +33,7 @@ def wiki_processing_task(wiki_document_id: int, **kwargs):
         logger.error(f'Wiki Document with id {wiki_document_id} not found. Task aborted')
         return
     processing: WikiDocumentProcessing = async_to_sync(
-        split_wiki_document
+        closing_http_sessions(background_priority(split_wiki_document))
     )(wiki_document)
     task_group = group(
         document_processing_task.si(document.id)
@@ -51,7 +56,7 @@ def document_processing_task(document_id: int, **kwargs):
     logger.info(f'Document Processing Task started for id {document_id}')
     document = Document.objects.get(id=document_id)
     async_to_sync(
-        process_document
+        closing_http_sessions(background_priority(process_document))
     )(document)
     logger.info(f'Document Processing Task finished for id {document_id}')
 
@@ -68,7 +73,40 @@ def finalize_document_processing_task(processing_id: int, **kwargs):
     logger.info(f'Finalize Document Processing Task started for id {processing_id}')
     processing = WikiDocumentProcessing.objects.get(id=processing_id)
     with transaction.atomic():
+        update_search_fields(processing.documents.all())
         processing.status = WikiDocumentProcessing.Status.COMPLETED
         processing.save()
         processing.wiki_document.processing.exclude(id=processing_id).delete()
+        # Invalidates the retrieval cache of the bot
+        Bot.objects.filter(
+            id=processing.wiki_document.bot_id
+        ).update(corpus_version=F('corpus_version') + 1)
     logger.info(f'Finalize Document Processing Task finished for id {processing_id}')
+
+
+@shared_task(
+    queue=CeleryQueues.PROCESSING.value,
+    acks_late=True,
+    autoretry_for=(Exception,),
+    reject_on_worker_lost=True,
+    max_retries=3,
+    default_retry_delay=60
+)
+def create_bot_vector_indexes_task(bot_id: int, **kwargs):
+    logger.info(f'Create Bot Vector Indexes Task started for bot {bot_id}')
+    create_bot_vector_indexes(bot_id)
+    logger.info(f'Create Bot Vector Indexes Task finished for bot {bot_id}')
+
+
+@shared_task(
+    queue=CeleryQueues.PROCESSING.value,
+    acks_late=True,
+    autoretry_for=(Exception,),
+    reject_on_worker_lost=True,
+    max_retries=3,
+    default_retry_delay=60
+)
+def drop_bot_vector_indexes_task(bot_id: int, **kwargs):
+    logger.info(f'Drop Bot Vector Indexes Task started for bot {bot_id}')
+    drop_bot_vector_indexes(bot_id)
+    logger.info(f'Drop Bot Vector Indexes Task finished for bot {bot_id}')
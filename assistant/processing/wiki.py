@@ -3,10 +3,11 @@ from typing import List
 
 from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.db.models import QuerySet, Subquery, OuterRef
 
 from assistant.ai.dialog import AIDialog
 from assistant.processing.utils import json_prompt
-from assistant.storage.models import Document, WikiDocument, WikiDocumentProcessing
+from assistant.storage.models import Document, WikiDocument, WikiDocumentProcessing, Question, Sentence
 from assistant.utils.language import get_language
 from assistant.utils.repeat_until import repeat_until
 
@@ -97,3 +98,17 @@ class WikiDocumentSplitter:
 
 async def split_wiki_document(wiki_document: WikiDocument) -> WikiDocumentProcessing:
     return await WikiDocumentSplitter(wiki_document).run()
+
+
+def update_search_fields(documents: QuerySet):
+    """
+    Denormalize the search filters of the documents to their questions and sentences
+    (the bot, the wiki for the topic-scoped search) and make them live.
+    """
+    for model in (Question, Sentence):
+        document = Document.objects.filter(id=OuterRef('document_id'))
+        model.objects.filter(document__in=documents).update(
+            bot_id=Subquery(document.values('wiki__bot_id')[:1]),
+            wiki_id=Subquery(document.values('wiki_id')[:1]),
+            is_live=True,
+        )
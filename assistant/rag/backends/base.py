@@ -0,0 +1,122 @@
+import asyncio
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import List, Dict, Tuple, Optional
+
+from asgiref.sync import sync_to_async
+from django.db.models import QuerySet
+
+from assistant.storage.models import BaseEmbeddingModel, Document
+
+
+def document_scores(top_objects: List[BaseEmbeddingModel], max_scores_n: int) -> Dict[int, float]:
+    """
+    Score the documents by the average similarity of their `max_scores_n` closest objects.
+    Documents with fewer found objects are skipped.
+    """
+    docs = defaultdict(list)
+    for obj in top_objects:
+        docs[obj.document_id].append(obj)
+
+    return {
+        doc_id: 1 - sum([o.distance for o in v[:max_scores_n]]) / max_scores_n
+        for doc_id, v in docs.items() if len(v) >= max_scores_n
+    }
+
+
+class VectorSearchBackend(ABC):
+    """
+    Nearest neighbour search over the embedding fields of the storage models.
+    """
+
+    @abstractmethod
+    async def search(
+            self,
+            query_embedding: List[float],
+            qs: QuerySet,
+            n: int = 10,
+            field: str = 'embedding',
+            ef_search: int = None,
+    ) -> List[BaseEmbeddingModel]:
+        """
+        Get the `n` objects of the queryset closest to the query embedding by cosine distance.
+        Every returned object has the `distance` attribute set.
+        `ef_search` is the search effort of the approximate backends (ignored by the exact ones).
+        """
+        pass
+
+    async def search_many(
+            self,
+            query_embeddings: List[List[float]],
+            qs: QuerySet,
+            n: int = 10,
+            field: str = 'embedding',
+            ef_search: int = None,
+    ) -> List[List[BaseEmbeddingModel]]:
+        """
+        Get the `n` closest objects for each of the query embeddings.
+        Backends should override it to answer all the queries at once.
+        """
+        return list(await asyncio.gather(*[
+            self.search(query_embedding, qs, n, field=field, ef_search=ef_search)
+            for query_embedding in query_embeddings
+        ]))
+
+    async def search_documents(
+            self,
+            query_embedding: List[float],
+            qs: QuerySet,
+            n: int = 100,
+            max_scores_n: int = 10,
+            top_n: Optional[int] = 10,
+            field: str = 'embedding',
+            ef_search: int = None,
+    ) -> List[Tuple[Document, float]]:
+        """
+        Get the `top_n` documents (all of them if `None`) scored by `document_scores` over the `n` objects
+        of the queryset closest to the query embedding, ordered by the score.
+        """
+        return (await self.search_documents_many(
+            [query_embedding], qs, n, max_scores_n, top_n, field=field, ef_search=ef_search
+        ))[0]
+
+    async def search_documents_many(
+            self,
+            query_embeddings: List[List[float]],
+            qs: QuerySet,
+            n: int = 100,
+            max_scores_n: int = 10,
+            top_n: Optional[int] = 10,
+            field: str = 'embedding',
+            ef_search: int = None,
+    ) -> List[List[Tuple[Document, float]]]:
+        """
+        The same as `search_documents` for each of the query embeddings.
+        """
+        top_objects_lists = await self.search_many(query_embeddings, qs, n, field=field, ef_search=ef_search)
+        doc_scores_list = [
+            document_scores(top_objects, max_scores_n)
+            for top_objects in top_objects_lists
+        ]
+
+        doc_ids = {doc_id for doc_scores in doc_scores_list for doc_id in doc_scores}
+        document_model = qs.model._meta.get_field('document').related_model
+        documents = await (sync_to_async(
+            lambda: document_model._default_manager.in_bulk(list(doc_ids))
+        ))()
+
+        results = []
+        for doc_scores in doc_scores_list:
+            result = [
+                (documents[doc_id], score)
+                for doc_id, score in doc_scores.items() if doc_id in documents
+            ]
+            result.sort(key=lambda x: x[1], reverse=True)
+            results.append(result[:top_n])
+        return results
+
+    def invalidate(self):
+        """
+        Drop any state the backend keeps about the stored embeddings.
+        """
+        pass
@@ -0,0 +1,306 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Tuple, Dict, Hashable, Optional, Any
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import QuerySet, Expression, Lookup
+from django.db.models.expressions import Col
+from django.db.models.sql import Query
+from django.db.models.sql.where import AND
+
+from assistant.bot.models import Bot
+from assistant.rag.backends.base import VectorSearchBackend
+from assistant.rag.backends.postgres import PgVectorSearchBackend
+from assistant.rag.services.embeddings_service import side_tables_enabled
+from assistant.storage.models import BaseEmbeddingModel
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingIndex:
+    """
+    Embeddings of a queryset kept as one contiguous float32 matrix of normalized rows.
+    """
+
+    def __init__(self, ids: List[int], embeddings: np.ndarray):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        self.matrix = matrix / norms
+        self.created_at = time.monotonic()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def top_k(self, query_embedding: List[float], k: int, mask: np.ndarray = None) -> List[Tuple[int, float]]:
+        """
+        Get the `k` nearest rows as (row position, cosine distance) pairs sorted by distance.
+        """
+        return self.top_k_many([query_embedding], k, mask)[0]
+
+    def top_k_many(
+            self,
+            query_embeddings: List[List[float]],
+            k: int,
+            mask: np.ndarray = None,
+    ) -> List[List[Tuple[int, float]]]:
+        """
+        Get the `k` nearest rows for every query embedding using a single matrix product.
+        Only the rows selected by the boolean `mask` are returned if it is given.
+        """
+        candidates_n = len(self) if mask is None else int(np.count_nonzero(mask))
+        k = min(k, candidates_n)
+        if not len(query_embeddings) or k <= 0:
+            return [[] for _ in query_embeddings]
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1)
+        query_norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        query_norms[query_norms == 0] = 1
+        similarities = (queries / query_norms) @ self.matrix.T
+        if mask is not None:
+            similarities = np.where(mask, similarities, -np.inf)
+        if k < len(self):
+            positions = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        else:
+            positions = np.tile(np.arange(len(self)), (len(queries), 1))
+        top_similarities = np.take_along_axis(similarities, positions, axis=1)
+        order = np.argsort(-top_similarities, axis=1, kind='stable')
+        positions = np.take_along_axis(positions, order, axis=1)
+        top_similarities = np.take_along_axis(top_similarities, order, axis=1)
+        return [
+            [(int(p), float(1 - s)) for p, s in zip(row_positions, row_similarities)]
+            for row_positions, row_similarities in zip(positions, top_similarities)
+        ]
+
+
+class IndexEntry:
+    """
+    In-memory index of the embeddings of one model field with the other column values of its rows.
+    """
+
+    def __init__(self, index: EmbeddingIndex, field_names: List[str], rows: List[tuple], corpus_version):
+        self.index = index
+        self.field_names = field_names
+        self.rows = rows
+        self.corpus_version = corpus_version
+        self.checked_at = time.monotonic()
+        self._columns: Dict[str, np.ndarray] = {}
+        self._masks: OrderedDict = OrderedDict()
+
+    def column(self, attname: str) -> np.ndarray:
+        column = self._columns.get(attname)
+        if column is None:
+            position = self.field_names.index(attname)
+            column = np.empty(len(self.rows), dtype=object)
+            column[:] = [row[position] for row in self.rows]
+            self._columns[attname] = column
+        return column
+
+    def mask(self, filters: Tuple[Tuple[str, str, Hashable], ...]) -> np.ndarray:
+        """
+        Get the rows matching all the (column, lookup, value) filters, the masks are cached by the filters.
+        """
+        mask = self._masks.get(filters)
+        if mask is not None:
+            return mask
+        mask = np.ones(len(self.rows), dtype=bool)
+        for attname, lookup_name, value in filters:
+            column = self.column(attname)
+            if lookup_name == 'exact':
+                mask &= np.fromiter((v == value for v in column), dtype=bool, count=len(column))
+            elif lookup_name == 'in':
+                mask &= np.fromiter((v in value for v in column), dtype=bool, count=len(column))
+            else:
+                mask &= np.fromiter(((v is None) == value for v in column), dtype=bool, count=len(column))
+        self._masks[filters] = mask
+        if len(self._masks) > _max_masks:
+            self._masks.popitem(last=False)
+        return mask
+
+
+_max_masks = 64
+_mask_lookups = {'exact', 'in', 'isnull'}
+
+
+class InMemorySearchBackend(VectorSearchBackend):
+    """
+    Search backend keeping the embeddings of the searched bots in the process memory.
+
+    The first search in the questions or sentences of a bot loads all of their embeddings into an `EmbeddingIndex`;
+    later searches are answered by a single matrix product without the database. The other filters
+    of the searched queryset (liveness, topic scope) are applied to the index as a mask of its rows:
+    the filters by the own columns of the rows are evaluated in memory, the `__in` subqueries are read
+    from the database (the scope subtree of the small wikis table), and the querysets with any other filters
+    (joins, `OR`, expressions) get the mask from the ids of their rows.
+
+    The corpus version of the bot is checked every `VECTOR_SEARCH_VERSION_CHECK_INTERVAL` seconds,
+    and the index is rebuilt once it changes (the document processing is finalized in any process)
+    or after `VECTOR_SEARCH_INDEX_TTL` seconds. At most `VECTOR_SEARCH_MAX_INDEXES` indexes are kept.
+    The search is exact, so `ef_search` is ignored. The embeddings are read from the columns, with
+    `EMBEDDING_SIDE_TABLES` the search is passed to `PgVectorSearchBackend`.
+    """
+
+    def __init__(self, ttl: float = None, max_indexes: int = None, version_check_interval: float = None):
+        self._ttl = ttl if ttl is not None else getattr(settings, 'VECTOR_SEARCH_INDEX_TTL', 300)
+        self._max_indexes = max_indexes or getattr(settings, 'VECTOR_SEARCH_MAX_INDEXES', 32)
+        self._version_check_interval = (
+            version_check_interval if version_check_interval is not None
+            else getattr(settings, 'VECTOR_SEARCH_VERSION_CHECK_INTERVAL', 5)
+        )
+        self._indexes: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._side_tables_backend = PgVectorSearchBackend()
+
+    async def search(
+            self,
+            query_embedding: List[float],
+            qs: QuerySet,
+            n: int = 10,
+            field: str = 'embedding',
+            ef_search: int = None,
+    ) -> List[BaseEmbeddingModel]:
+        return (await self.search_many([query_embedding], qs, n, field=field))[0]
+
+    async def search_many(
+            self,
+            query_embeddings: List[List[float]],
+            qs: QuerySet,
+            n: int = 10,
+            field: str = 'embedding',
+            ef_search: int = None,
+    ) -> List[List[BaseEmbeddingModel]]:
+        if side_tables_enabled():
+            return await self._side_tables_backend.search_many(
+                query_embeddings, qs, n, field=field, ef_search=ef_search
+            )
+        if qs.query.is_empty():
+            return [[] for _ in query_embeddings]
+        filters = self._column_filters(qs)
+        bot_id = self._bot_id(filters)
+        key = (qs.model._meta.label, field, bot_id)
+
+        entry = await self._get_entry(key)
+        if entry is None:
+            entry = await sync_to_async(self._build_entry)(key, qs, field, bot_id)
+
+        if filters is None or any(isinstance(value, Query) for _, _, value in filters):
+            mask = await sync_to_async(self._queryset_mask)(qs, entry, filters)
+        else:
+            mask = entry.mask(filters)
+
+        result = []
+        for top in entry.index.top_k_many(query_embeddings, n, mask):
+            objects = []
+            for position, distance in top:
+                obj = qs.model.from_db(qs.db or DEFAULT_DB_ALIAS, entry.field_names, entry.rows[position])
+                obj.distance = distance
+                objects.append(obj)
+            result.append(objects)
+        return result
+
+    def invalidate(self):
+        with self._lock:
+            self._indexes.clear()
+
+    @staticmethod
+    def _column_filters(qs: QuerySet) -> Optional[Tuple[Tuple[str, str, Any], ...]]:
+        """
+        Get the filters of the queryset as (column, lookup, value) if all of them are `exact`, `in` or `isnull`
+        lookups of the own columns of the rows joined by `AND`, `None` otherwise.
+        """
+        where = qs.query.where
+        if where.negated or where.connector != AND:
+            return None
+        filters = []
+        for lookup in where.children:
+            if not isinstance(lookup, Lookup) or lookup.lookup_name not in _mask_lookups:
+                return None
+            if not isinstance(lookup.lhs, Col) or lookup.lhs.alias != qs.model._meta.db_table:
+                return None
+            value = lookup.rhs
+            if lookup.lookup_name == 'in':
+                if not isinstance(value, Query):
+                    value = frozenset(value)
+            elif isinstance(value, (Expression, Query)) or hasattr(value, 'resolve_expression'):
+                return None
+            filters.append((lookup.lhs.target.attname, lookup.lookup_name, value))
+        return tuple(filters)
+
+    @staticmethod
+    def _bot_id(filters) -> Optional[int]:
+        for attname, lookup_name, value in filters or ():
+            if attname == 'bot_id' and lookup_name == 'exact':
+                return value
+        return None
+
+    @staticmethod
+    def _queryset_mask(qs: QuerySet, entry: IndexEntry, filters) -> np.ndarray:
+        if filters is None:
+            ids = set(qs.values_list('pk', flat=True))
+            return np.fromiter((i in ids for i in entry.index.ids.tolist()), dtype=bool, count=len(entry.index))
+        using = qs.db or DEFAULT_DB_ALIAS
+        return entry.mask(tuple(
+            (attname, lookup_name, frozenset(
+                row[0] for row in value.get_compiler(using=using).results_iter()
+            ) if isinstance(value, Query) else value)
+            for attname, lookup_name, value in filters
+        ))
+
+    @staticmethod
+    def _corpus_version(bot_id: Optional[int]):
+        # Bumped by `finalize_document_processing_task` in any process
+        if bot_id is None:
+            return tuple(Bot.objects.order_by('id').values_list('id', 'corpus_version'))
+        return Bot.objects.filter(id=bot_id).values_list('corpus_version', flat=True).first()
+
+    async def _get_entry(self, key) -> Optional[IndexEntry]:
+        with self._lock:
+            entry = self._indexes.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry.index.created_at > self._ttl:
+                del self._indexes[key]
+                return None
+            self._indexes.move_to_end(key)
+        if time.monotonic() - entry.checked_at > self._version_check_interval:
+            if await sync_to_async(self._corpus_version)(key[2]) != entry.corpus_version:
+                with self._lock:
+                    if self._indexes.get(key) is entry:
+                        del self._indexes[key]
+                return None
+            entry.checked_at = time.monotonic()
+        return entry
+
+    def _build_entry(self, key, qs: QuerySet, field: str, bot_id: Optional[int]) -> IndexEntry:
+        start_ts = time.time()
+        # Read before the rows, so a processing finalized meanwhile gets the index rebuilt
+        corpus_version = self._corpus_version(bot_id)
+        field_names = [
+            f.attname for f in qs.model._meta.concrete_fields
+            if f.attname != field and not isinstance(f, SearchVectorField)
+        ]
+        rows_qs = qs.model._default_manager.using(qs.db).filter(**{f'{field}__isnull': False})
+        if bot_id is not None:
+            rows_qs = rows_qs.filter(bot_id=bot_id)
+        rows, embeddings = [], []
+        for values in rows_qs.values_list(*field_names, field).iterator():
+            rows.append(values[:-1])
+            embeddings.append(values[-1])
+        pk_position = field_names.index(qs.model._meta.pk.attname)
+        index = EmbeddingIndex(
+            [row[pk_position] for row in rows],
+            np.vstack(embeddings) if embeddings else np.empty((0, 0), dtype=np.float32),
+        )
+        entry = IndexEntry(index, field_names, rows, corpus_version)
+        with self._lock:
+            self._indexes[key] = entry
+            while len(self._indexes) > self._max_indexes:
+                self._indexes.popitem(last=False)
+        logger.info(f'Built in-memory index of {len(index)} {key[0]} embeddings in {time.time() - start_ts:.3f} s')
+        return entry
@@ -0,0 +1,507 @@
+from contextlib import contextmanager
+from typing import List, Optional, Tuple, NamedTuple, Dict, Type
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import EmptyResultSet
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+from django.db.models import QuerySet
+from pgvector.django import CosineDistance, VectorField
+from pgvector.utils import to_db
+
+from assistant.rag.backends.base import VectorSearchBackend
+from assistant.rag.services.embeddings_service import (
+    side_tables_enabled, get_embedding_table, get_active_embedding_model, get_embedding_model_dimensions,
+    embedding_index_name,
+)
+from assistant.storage.models import BaseEmbeddingModel, Document, BaseObjectEmbedding
+
+
+@contextmanager
+def local_settings(values: Dict[str, str], using: str = None):
+    """
+    Apply the PostgreSQL settings with `SET LOCAL` in a transaction for the queries run inside.
+    Inside an outer transaction the block is only a savepoint, so the previous values are restored on exit
+    (a rolled back savepoint reverts them by itself).
+    """
+    using = using or DEFAULT_DB_ALIAS
+    connection = connections[using]
+    nested = connection.in_atomic_block
+    with transaction.atomic(using=using):
+        previous = {}
+        with connection.cursor() as cursor:
+            for name, value in values.items():
+                if nested:
+                    cursor.execute('SELECT current_setting(%s, true)', [name])
+                    previous[name] = cursor.fetchone()[0]
+                cursor.execute('SELECT set_config(%s, %s, true)', [name, str(value)])
+        yield
+        with connection.cursor() as cursor:
+            for name, value in previous.items():
+                if value is None:
+                    cursor.execute(f'SET LOCAL {name} TO DEFAULT')
+                else:
+                    cursor.execute('SELECT set_config(%s, %s, true)', [name, value])
+
+
+@contextmanager
+def hnsw_ef_search(ef_search: Optional[int], using: str = None):
+    """
+    Set `hnsw.ef_search` (the size of the candidates list of the HNSW index scans) for the queries run inside.
+    The setting is applied with `SET LOCAL` (see `local_settings`), so it never leaks to other queries.
+    An index scan returns at most `ef_search` rows, so it should not be less than the searched number of objects.
+    """
+    if ef_search is None:
+        yield
+        return
+    with local_settings({'hnsw.ef_search': int(ef_search)}, using=using):
+        yield
+
+
+@contextmanager
+def exact_vector_search(using: str = None):
+    """
+    Disable the index scans for the queries run inside, so the nearest neighbours are found exactly.
+    """
+    with local_settings({'enable_indexscan': 'off', 'enable_bitmapscan': 'off'}, using=using):
+        yield
+
+
+class EmbeddingSource(NamedTuple):
+    from_sql: str
+    expression: str
+    dimensions: int
+    params: list
+
+
+class PgVectorSearchBackend(VectorSearchBackend):
+    """
+    Search backend based on the pgvector `CosineDistance` ordering inside PostgreSQL.
+
+    The search effort of the HNSW indexes is `ef_search` if given, otherwise the `HNSW_EF_SEARCH` setting
+    (the server default if it is not set either).
+    """
+
+    async def search(
+            self,
+            query_embedding: List[float],
+            qs: QuerySet,
+            n: int = 10,
+            field: str = 'embedding',
+            ef_search: int = None,
+    ) -> List[BaseEmbeddingModel]:
+        if side_tables_enabled():
+            return (await self.search_many([query_embedding], qs, n, field=field, ef_search=ef_search))[0]
+        return await sync_to_async(self._search_sync)(query_embedding, qs, n, field, ef_search)
+
+    def _search_sync(
+            self,
+            query_embedding: List[float],
+            qs: QuerySet,
+            n: int,
+            field: str,
+            ef_search: Optional[int],
+    ) -> List[BaseEmbeddingModel]:
+        with hnsw_ef_search(self._ef_search(ef_search), using=qs.db):
+            return list(qs.annotate(
+                distance=CosineDistance(field, query_embedding)
+            ).order_by('distance')[:n])
+
+    async def search_many(
+            self,
+            query_embeddings: List[List[float]],
+            qs: QuerySet,
+            n: int = 10,
+            field: str = 'embedding',
+            ef_search: int = None,
+    ) -> List[List[BaseEmbeddingModel]]:
+        if not query_embeddings:
+            return []
+        return await sync_to_async(self._search_many_sync)(query_embeddings, qs, n, field, ef_search)
+
+    def _search_many_sync(
+            self,
+            query_embeddings: List[List[float]],
+            qs: QuerySet,
+            n: int,
+            field: str,
+            ef_search: Optional[int],
+    ) -> List[List[BaseEmbeddingModel]]:
+        """
+        Runs all the queries in one statement: every query embedding is joined laterally
+        with its own `ORDER BY distance LIMIT n` scan, so each of them can use the vector index.
+        """
+        result = [[] for _ in query_embeddings]
+        try:
+            base_sql, base_params = qs.order_by().query.sql_with_params()
+        except EmptyResultSet:
+            return result
+        with hnsw_ef_search(self._ef_search(ef_search), using=qs.db):
+            nearest_sql, nearest_params = self._nearest_sql(
+                base_sql, base_params, qs.model._meta.get_field(field), n, query_embeddings, using=qs.db
+            )
+            sql = (
+                f'SELECT objects.*, queries.query_index '
+                f'FROM unnest(%s::vector[]) WITH ORDINALITY AS queries(embedding, query_index) '
+                f'CROSS JOIN LATERAL ({nearest_sql}) objects '
+                f'ORDER BY queries.query_index, objects.distance'
+            )
+            params = [[to_db(e) for e in query_embeddings], *nearest_params]
+            for obj in qs.model._default_manager.raw(sql, params, using=qs.db):
+                result[obj.query_index - 1].append(obj)
+        return result
+
+    async def search_documents_many(
+            self,
+            query_embeddings: List[List[float]],
+            qs: QuerySet,
+            n: int = 100,
+            max_scores_n: int = 10,
+            top_n: Optional[int] = 10,
+            field: str = 'embedding',
+            ef_search: int = None,
+    ) -> List[List[Tuple[Document, float]]]:
+        if not query_embeddings:
+            return []
+        return await sync_to_async(self._search_documents_many_sync)(
+            query_embeddings, qs, n, max_scores_n, top_n, field, ef_search
+        )
+
+    def _search_documents_many_sync(
+            self,
+            query_embeddings: List[List[float]],
+            qs: QuerySet,
+            n: int,
+            max_scores_n: int,
+            top_n: Optional[int],
+            field: str,
+            ef_search: Optional[int],
+    ) -> List[List[Tuple[Document, float]]]:
+        """
+        Scores the documents in one statement: the nearest objects of every query are numbered
+        per document with window functions, the closest `max_scores_n` of them are averaged,
+        and only the scored documents are joined and returned.
+        """
+        result = [[] for _ in query_embeddings]
+        try:
+            base_sql, base_params = qs.order_by().values_list(
+                qs.model._meta.pk.attname, 'document_id', field
+            ).query.sql_with_params()
+        except EmptyResultSet:
+            return result
+        document_model = qs.model._meta.get_field('document').related_model
+        top_n_filter = 'WHERE scores.score_position <= %s ' if top_n is not None else ''
+        with hnsw_ef_search(self._ef_search(ef_search), using=qs.db):
+            nearest_sql, nearest_params = self._nearest_sql(
+                base_sql, base_params, qs.model._meta.get_field(field), n, query_embeddings, using=qs.db
+            )
+            sql = (
+                f'WITH nearest AS ('
+                f'SELECT queries.query_index, objects.document_id, objects.distance '
+                f'FROM unnest(%s::vector[]) WITH ORDINALITY AS queries(embedding, query_index) '
+                f'CROSS JOIN LATERAL ({nearest_sql}) objects'
+                f'), ranked AS ('
+                f'SELECT query_index, document_id, distance, '
+                f'row_number() OVER (PARTITION BY query_index, document_id ORDER BY distance) AS position, '
+                f'count(*) OVER (PARTITION BY query_index, document_id) AS total '
+                f'FROM nearest'
+                f'), scores AS ('
+                f'SELECT query_index, document_id, 1 - sum(distance) / %s AS score, '
+                f'row_number() OVER (PARTITION BY query_index ORDER BY sum(distance)) AS score_position '
+                f'FROM ranked '
+                f'WHERE position <= %s AND total >= %s '
+                f'GROUP BY query_index, document_id'
+                f') '
+                f'SELECT documents.*, scores.query_index, scores.score '
+                f'FROM scores '
+                f'JOIN "{document_model._meta.db_table}" documents '
+                f'ON documents."{document_model._meta.pk.column}" = scores.document_id '
+                f'{top_n_filter}'
+                f'ORDER BY scores.query_index, scores.score DESC'
+            )
+            params = [
+                [to_db(e) for e in query_embeddings], *nearest_params,
+                max_scores_n, max_scores_n, max_scores_n,
+            ]
+            if top_n is not None:
+                params.append(top_n)
+            for document in document_model._default_manager.raw(sql, params, using=qs.db):
+                result[document.query_index - 1].append((document, document.score))
+        return result
+
+    def _nearest_sql(
+            self,
+            base_sql: str,
+            base_params: tuple,
+            field: VectorField,
+            n: int,
+            query_embeddings: List[List[float]] = None,
+            using: str = None,
+    ) -> Tuple[str, list]:
+        """
+        Get the SQL (and all its params) of the lateral subquery
+        selecting the `n` rows of `base_sql` closest to `queries.embedding` with their `distance`.
+        It is called inside the `ef_search` setting of the search, the subclasses may run preliminary queries
+        for the `query_embeddings` there.
+        """
+        source = self._embedding_source(base_sql, field)
+        return (
+            f'SELECT base.*, {source.expression} <=> queries.embedding AS distance '
+            f'FROM {source.from_sql} '
+            f'ORDER BY distance '
+            f'LIMIT %s'
+        ), [*base_params, *source.params, n]
+
+    def _embedding_source(self, base_sql: str, field: VectorField) -> EmbeddingSource:
+        """
+        Get where the embeddings of the `base` rows come from: the `field` column itself
+        or, if `EMBEDDING_SIDE_TABLES` is set, the side table rows of the active embedding model.
+        """
+        if not side_tables_enabled():
+            return EmbeddingSource(
+                from_sql=f'({base_sql}) base',
+                expression=f'base."{field.column}"',
+                dimensions=field.dimensions,
+                params=[],
+            )
+        table = get_embedding_table(field.model, field.name)
+        model_name = get_active_embedding_model()
+        dimensions = get_embedding_model_dimensions(model_name)
+        object_column = table._meta.get_field(table.object_field).column
+        return EmbeddingSource(
+            from_sql=(
+                f'({base_sql}) base '
+                f'JOIN "{table._meta.db_table}" embeddings '
+                f'ON embeddings."{object_column}" = base."{field.model._meta.pk.column}" AND embeddings.model = %s'
+            ),
+            # The cast matches the expression of the partial per-model index
+            expression=f'embeddings.embedding::vector({dimensions})',
+            dimensions=dimensions,
+            params=[model_name],
+        )
+
+    @staticmethod
+    def _ef_search(ef_search: Optional[int]) -> Optional[int]:
+        return ef_search if ef_search is not None else getattr(settings, 'HNSW_EF_SEARCH', None)
+
+
+class Quantization(NamedTuple):
+    expression: str
+    operator: str
+    opclass: str
+
+    def apply(self, value: str, dimensions: int) -> str:
+        return self.expression.format(value=value, dimensions=dimensions)
+
+
+QUANTIZATIONS = {
+    # 2x smaller index, the distances are nearly exact
+    'halfvec': Quantization('({value})::halfvec({dimensions})', '<=>', 'halfvec_cosine_ops'),
+    # 32x smaller index, the candidates are ranked by the Hamming distance of the sign bits
+    'binary': Quantization('binary_quantize({value})::bit({dimensions})', '<~>', 'bit_hamming_ops'),
+}
+
+
+def quantized_index_name(field: VectorField, quantization: str) -> str:
+    return f'{field.model._meta.db_table}_{field.column}_{quantization}_idx'
+
+
+def create_quantized_embedding_index_sql(
+        table: Type[BaseObjectEmbedding],
+        model_name: str,
+        dimensions: int,
+        quantization: str,
+        m: int = 16,
+        ef_construction: int = 64,
+) -> str:
+    """
+    SQL of the partial quantized HNSW index of the side table embeddings of one model
+    (the expression matches the one searched by `QuantizedPgVectorSearchBackend` with `EMBEDDING_SIDE_TABLES`).
+    """
+    index_name = embedding_index_name(table, model_name, quantization)
+    quoted_model_name = model_name.replace("'", "''")
+    expression = QUANTIZATIONS[quantization].apply(f'embedding::vector({int(dimensions)})', int(dimensions))
+    return (
+        f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{index_name}" '
+        f'ON "{table._meta.db_table}" '
+        f'USING hnsw (({expression}) {QUANTIZATIONS[quantization].opclass}) '
+        f'WITH (m = {m}, ef_construction = {ef_construction}) '
+        f"WHERE model = '{quoted_model_name}'"
+    )
+
+
+class QuantizedPgVectorSearchBackend(PgVectorSearchBackend):
+    """
+    Search backend running the coarse search over a quantized copy of the embeddings
+    (`VECTOR_SEARCH_QUANTIZATION`: `halfvec` or `binary`) and re-ranking the `VECTOR_SEARCH_RERANK_FACTOR` times
+    more candidates by the exact cosine distance of the full-precision embeddings.
+
+    The quantized copy lives only in the expression HNSW indexes created by the `vector_quantization` command
+    (pgvector 0.7+ is required), the full-precision embeddings stay in the tables.
+    With `EMBEDDING_SIDE_TABLES` the command indexes the side table embeddings of the active model instead,
+    so it has to be run again for every new model.
+    `ef_search` should not be less than the number of the candidates.
+    """
+
+    def __init__(self, quantization: str = None, rerank_factor: int = None):
+        self._quantization = quantization or getattr(settings, 'VECTOR_SEARCH_QUANTIZATION', 'halfvec')
+        if self._quantization not in QUANTIZATIONS:
+            raise ValueError(f'Unknown vector search quantization: {self._quantization}')
+        self._rerank_factor = rerank_factor or getattr(settings, 'VECTOR_SEARCH_RERANK_FACTOR', 4)
+
+    async def search(
+            self,
+            query_embedding: List[float],
+            qs: QuerySet,
+            n: int = 10,
+            field: str = 'embedding',
+            ef_search: int = None,
+    ) -> List[BaseEmbeddingModel]:
+        return (await self.search_many([query_embedding], qs, n, field=field, ef_search=ef_search))[0]
+
+    def _nearest_sql(
+            self,
+            base_sql: str,
+            base_params: tuple,
+            field: VectorField,
+            n: int,
+            query_embeddings: List[List[float]] = None,
+            using: str = None,
+    ) -> Tuple[str, list]:
+        quantization = QUANTIZATIONS[self._quantization]
+        source = self._embedding_source(base_sql, field)
+        column_expression = quantization.apply(source.expression, source.dimensions)
+        query_expression = quantization.apply('queries.embedding', source.dimensions)
+        # The exact distance is only computed for the candidates returned by the quantized index scan
+        return (
+            f'SELECT candidates.* '
+            f'FROM ('
+            f'SELECT base.*, {source.expression} <=> queries.embedding AS distance '
+            f'FROM {source.from_sql} '
+            f'ORDER BY {column_expression} {quantization.operator} {query_expression} '
+            f'LIMIT %s'
+            f') candidates '
+            f'ORDER BY candidates.distance '
+            f'LIMIT %s'
+        ), [*base_params, *source.params, n * self._rerank_factor, n]
+
+
+class TwoStagePgVectorSearchBackend(PgVectorSearchBackend):
+    """
+    Coarse-to-fine search backend: the HNSW index of `Document.content_embedding` picks
+    the `TWO_STAGE_SEARCH_DOCUMENTS` documents closest to the query (among the documents of the searched objects),
+    then only the objects of these documents are ranked by the exact cosine distance.
+
+    The documents index is many times smaller than the questions and sentences ones, so the latency
+    depends on the number of the candidates rather than on the size of the bot corpus.
+    The index scan keeps only the documents of the searched objects among its `ef_search` nearest ones,
+    so if the documents of other bots leave fewer candidates, they are found by an exact search
+    of the documents of the searched objects (cheap for the small bots this happens to).
+    The documents without `content_embedding` are never found.
+    """
+
+    def __init__(self, documents_n: int = None):
+        self._documents_n = documents_n or getattr(settings, 'TWO_STAGE_SEARCH_DOCUMENTS', 200)
+
+    async def search(
+            self,
+            query_embedding: List[float],
+            qs: QuerySet,
+            n: int = 10,
+            field: str = 'embedding',
+            ef_search: int = None,
+    ) -> List[BaseEmbeddingModel]:
+        return (await self.search_many([query_embedding], qs, n, field=field, ef_search=ef_search))[0]
+
+    def _nearest_sql(
+            self,
+            base_sql: str,
+            base_params: tuple,
+            field: VectorField,
+            n: int,
+            query_embeddings: List[List[float]] = None,
+            using: str = None,
+    ) -> Tuple[str, list]:
+        source = self._embedding_source(base_sql, field)
+        query_indexes, candidate_ids = [], []
+        candidates = self._candidate_documents(base_sql, base_params, field, query_embeddings, using)
+        for query_index, document_ids in enumerate(candidates, start=1):
+            query_indexes += [query_index] * len(document_ids)
+            candidate_ids += document_ids
+        return (
+            f'SELECT base.*, {source.expression} <=> queries.embedding AS distance '
+            f'FROM unnest(%s::bigint[], %s::bigint[]) AS candidates(query_index, candidate_id) '
+            f'JOIN {source.from_sql} ON base.document_id = candidates.candidate_id '
+            f'WHERE candidates.query_index = queries.query_index '
+            f'ORDER BY distance '
+            f'LIMIT %s'
+        ), [query_indexes, candidate_ids, *base_params, *source.params, n]
+
+    def _candidate_documents(
+            self,
+            base_sql: str,
+            base_params: tuple,
+            field: VectorField,
+            query_embeddings: List[List[float]],
+            using: str = None,
+    ) -> List[List[int]]:
+        """
+        Get the ids of the `documents_n` documents of the `base_sql` objects closest to every query.
+        """
+        document_model = field.model._meta.get_field('document').related_model
+        document_pk = document_model._meta.pk.column
+        documents = self._embedding_source(
+            f'SELECT * FROM "{document_model._meta.db_table}"', document_model._meta.get_field('content_embedding')
+        )
+        # OFFSET 0 keeps the subquery from being flattened, so it is an index scan of the documents
+        index_sql = (
+            f'SELECT base."{document_pk}" '
+            f'FROM {documents.from_sql} '
+            f'WHERE {documents.expression} IS NOT NULL '
+            f'AND EXISTS (SELECT 1 FROM ({base_sql}) objects WHERE objects.document_id = base."{document_pk}") '
+            f'ORDER BY {documents.expression} <=> queries.embedding '
+            f'LIMIT %s OFFSET 0'
+        )
+        # The distance expression differs from the indexed one, so the documents are read by the ids
+        # of the searched objects and ranked exactly
+        exact_sql = (
+            f'SELECT base."{document_pk}" '
+            f'FROM {documents.from_sql} '
+            f'WHERE {documents.expression} IS NOT NULL '
+            f'AND base."{document_pk}" IN (SELECT objects.document_id FROM ({base_sql}) objects) '
+            f'ORDER BY ({documents.expression} <=> queries.embedding) + 0 '
+            f'LIMIT %s'
+        )
+        params = [*documents.params, *base_params, self._documents_n]
+
+        result = self._query_candidates(index_sql, params, query_embeddings, using)
+        short = [i for i, document_ids in enumerate(result) if len(document_ids) < self._documents_n]
+        if short:
+            exact = self._query_candidates(exact_sql, params, [query_embeddings[i] for i in short], using)
+            for i, document_ids in zip(short, exact):
+                result[i] = document_ids
+        return result
+
+    @staticmethod
+    def _query_candidates(
+            candidates_sql: str,
+            params: list,
+            query_embeddings: List[List[float]],
+            using: str = None,
+    ) -> List[List[int]]:
+        result = [[] for _ in query_embeddings]
+        sql = (
+            f'SELECT queries.query_index, candidates.* '
+            f'FROM unnest(%s::vector[]) WITH ORDINALITY AS queries(embedding, query_index) '
+            f'CROSS JOIN LATERAL ({candidates_sql}) candidates'
+        )
+        with connections[using or DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.execute(sql, [[to_db(e) for e in query_embeddings], *params])
+            for query_index, document_id in cursor.fetchall():
+                result[query_index - 1].append(document_id)
+        return result
+
+    def _ef_search(self, ef_search: Optional[int]) -> Optional[int]:
+        # An index scan returns at most `ef_search` rows, fewer than the candidates would hurt the recall
+        ef_search = super()._ef_search(ef_search)
+        return max(ef_search or 0, self._documents_n)
@@ -0,0 +1,146 @@
+import logging
+import math
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Max
+
+from assistant.bot.models import Bot
+from assistant.storage.models import WikiDocument, WikiDocumentProcessing, Document, Question
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CorpusSpec:
+    vectors: int = 10000
+    # 0 means uniformly random embeddings, otherwise they are grouped around this number of centers
+    clusters: int = 0
+    # Norm of the noise added to the cluster centers (the centers are unit vectors)
+    spread: float = 0.5
+    questions_per_document: int = 10
+    documents_per_wiki: int = 10
+    seed: int = 0
+    batch_size: int = 5000
+
+
+class EmbeddingGenerator:
+    """
+    Random unit embeddings, either uniform on the sphere or clustered around random centers.
+    """
+
+    def __init__(self, dimensions: int, clusters: int = 0, spread: float = 0.5, seed: int = 0):
+        self.dimensions = dimensions
+        self.spread = spread
+        self._rng = np.random.default_rng(seed)
+        self.centers = _normalize(self._rng.normal(size=(clusters, dimensions))) if clusters else None
+
+    def sample(self, n: int) -> np.ndarray:
+        """
+        Get `n` embeddings as an (n, dimensions) float32 matrix of unit rows.
+        """
+        if self.centers is None:
+            return _normalize(self._rng.normal(size=(n, self.dimensions)))
+        labels = self._rng.integers(0, len(self.centers), n)
+        return _normalize(self.centers[labels] + self.noise(n))
+
+    def noise(self, n: int) -> np.ndarray:
+        return self._rng.normal(size=(n, self.dimensions)) * (self.spread / math.sqrt(self.dimensions))
+
+
+def generate_corpus(codename: str, spec: CorpusSpec) -> Bot:
+    """
+    Create a bot with a synthetic knowledge base: `spec.vectors` live questions with random embeddings
+    in completed documents, grouped into root wiki documents. Processing is not triggered.
+    """
+    bot, _ = Bot.objects.get_or_create(codename=codename)
+    dimensions = Question._meta.get_field('embedding').dimensions
+    generator = EmbeddingGenerator(dimensions, spec.clusters, spec.spread, spec.seed)
+
+    documents_n = math.ceil(spec.vectors / spec.questions_per_document)
+    wikis_n = math.ceil(documents_n / spec.documents_per_wiki)
+    wikis_per_batch = max(1, spec.batch_size // (spec.questions_per_document * spec.documents_per_wiki))
+
+    questions_n = 0
+    for wiki_start in range(0, wikis_n, wikis_per_batch):
+        batch_wikis_n = min(wikis_per_batch, wikis_n - wiki_start)
+        with transaction.atomic():
+            questions_n += _create_batch(bot, spec, generator, wiki_start, batch_wikis_n, spec.vectors - questions_n)
+        logger.info(f'Generated {questions_n} of {spec.vectors} questions for bot {codename}')
+    return bot
+
+
+def _create_batch(
+        bot: Bot,
+        spec: CorpusSpec,
+        generator: EmbeddingGenerator,
+        wiki_start: int,
+        wikis_n: int,
+        questions_left: int,
+) -> int:
+    # Bulk created nodes get no MPTT bookkeeping (nor post_save signals), so every wiki is a separate tree
+    next_tree_id = (WikiDocument.objects.aggregate(max_tree_id=Max('tree_id'))['max_tree_id'] or 0) + 1
+    wikis = WikiDocument.objects.bulk_create([
+        WikiDocument(
+            bot=bot,
+            title=f'Synthetic topic {wiki_start + i}',
+            tree_id=next_tree_id + i,
+            lft=1,
+            rght=2,
+            level=0,
+        )
+        for i in range(wikis_n)
+    ])
+    processings = WikiDocumentProcessing.objects.bulk_create([
+        WikiDocumentProcessing(wiki_document=wiki, status=WikiDocumentProcessing.Status.COMPLETED)
+        for wiki in wikis
+    ])
+    documents = Document.objects.bulk_create([
+        Document(
+            wiki=wiki,
+            processing=processing,
+            name=f'{wiki.title}, document {j}',
+            content=f'Synthetic document {j} of {wiki.title}',
+        )
+        for wiki, processing in zip(wikis, processings)
+        for j in range(spec.documents_per_wiki)
+    ])
+
+    questions = []
+    for document in documents:
+        for j in range(spec.questions_per_document):
+            if len(questions) >= questions_left:
+                break
+            questions.append(Question(
+                document=document,
+                text=f'Synthetic question {len(questions)} of {document.name}',
+                order=j,
+                bot=bot,
+                is_live=True,
+                wiki=document.wiki,
+            ))
+    for question, embedding in zip(questions, generator.sample(len(questions))):
+        question.embedding = embedding
+    Question.objects.bulk_create(questions)
+    return len(questions)
+
+
+def delete_corpus(codename: str) -> Optional[int]:
+    """
+    Delete the synthetic bot with its whole knowledge base.
+    """
+    bot = Bot.objects.filter(codename=codename).first()
+    if bot is None:
+        return None
+    WikiDocument.objects.filter(bot=bot).delete()
+    bot.delete()
+    return bot.id
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
@@ -0,0 +1,56 @@
+from dataclasses import dataclass, field
+from typing import List, Dict
+
+import numpy as np
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    k: int
+    concurrency: int
+    recalls: List[float] = field(default_factory=list)
+    latencies: List[float] = field(default_factory=list)
+    wall_time: float = 0.0
+
+    @property
+    def queries(self) -> int:
+        return len(self.latencies)
+
+    @property
+    def recall(self) -> float:
+        return float(np.mean(self.recalls)) if self.recalls else 0.0
+
+    @property
+    def qps(self) -> float:
+        return self.queries / self.wall_time if self.wall_time else 0.0
+
+    def latency_ms(self, percentile: float) -> float:
+        return float(np.percentile(self.latencies, percentile) * 1000) if self.latencies else 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            'name': self.name,
+            'k': self.k,
+            'concurrency': self.concurrency,
+            'queries': self.queries,
+            'recall': self.recall,
+            'qps': self.qps,
+            'p50_ms': self.latency_ms(50),
+            'p95_ms': self.latency_ms(95),
+            'p99_ms': self.latency_ms(99),
+        }
+
+
+def format_report(results: List[BenchmarkResult]) -> str:
+    """
+    Format the results as a plain text table.
+    """
+    header = f'{"case":<40} {"recall@k":>9} {"qps":>9} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9}'
+    lines = [header, '-' * len(header)]
+    for result in results:
+        lines.append(
+            f'{result.name:<40} {result.recall:>9.3f} {result.qps:>9.1f} '
+            f'{result.latency_ms(50):>9.2f} {result.latency_ms(95):>9.2f} {result.latency_ms(99):>9.2f}'
+        )
+    return '\n'.join(lines)
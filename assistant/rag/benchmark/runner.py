@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import math
+import time
+from dataclasses import dataclass
+from typing import List, Callable, Awaitable, Set, Optional
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import QuerySet
+from pgvector.django import CosineDistance
+
+from assistant.ai.embedders.cache import CachedEmbedder, get_embedding_cache
+from assistant.rag.backends.base import document_scores
+from assistant.rag.backends.postgres import exact_vector_search
+from assistant.rag.benchmark.report import BenchmarkResult
+from assistant.rag.services.search_service import get_search_backend, embedding_search, embedding_search_questions
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BenchmarkQuery:
+    text: str
+    embedding: List[float]
+    # Exact answers
+    question_ids: List[int]
+    document_ids: List[int]
+
+
+class BenchmarkRunner:
+    """
+    Measure recall@k and latency of the vector search over the questions of the queryset.
+
+    The queries are the stored embeddings with added noise, the exact answers are found with the index scans
+    disabled. The searches are run from one event loop like in the bot, so `concurrency` shows how the latency
+    degrades under the concurrent requests of one process.
+    """
+
+    def __init__(self, qs: QuerySet, k: int = 10, concurrency: int = 1, max_scores_n: int = 10):
+        self.qs = qs
+        self.k = k
+        self.concurrency = concurrency
+        self.max_scores_n = max_scores_n
+
+    @property
+    def document_candidates(self) -> int:
+        # The same number of the closest questions as `embedding_search` scores the documents by
+        return self.max_scores_n * self.k * 10
+
+    def prepare(self, queries_n: int, noise: float = 0.5, seed: int = 0) -> List[BenchmarkQuery]:
+        embeddings = list(self.qs.order_by('?').values_list('embedding', flat=True)[:queries_n])
+        if not embeddings:
+            return []
+        rng = np.random.default_rng(seed)
+        embeddings = np.array(embeddings, dtype=np.float32)
+        embeddings += rng.normal(size=embeddings.shape) * (noise / math.sqrt(embeddings.shape[1]))
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+        queries = []
+        for i, embedding in enumerate(embeddings.tolist()):
+            with exact_vector_search(using=self.qs.db):
+                nearest = list(self.qs.annotate(
+                    distance=CosineDistance('embedding', embedding)
+                ).order_by('distance').only('id', 'document_id')[:self.document_candidates])
+            doc_scores = document_scores(nearest, self.max_scores_n)
+            queries.append(BenchmarkQuery(
+                text=f'benchmark query {seed}:{i}',
+                embedding=embedding,
+                question_ids=[q.id for q in nearest[:self.k]],
+                document_ids=sorted(doc_scores, key=doc_scores.get, reverse=True)[:self.k],
+            ))
+        return queries
+
+    async def run_questions(
+            self,
+            queries: List[BenchmarkQuery],
+            backend_path: str = None,
+            ef_search: int = None,
+    ) -> BenchmarkResult:
+        """
+        Benchmark `embedding_search_questions` with the backend.
+        """
+        backend = get_search_backend(backend_path)
+
+        async def search(query: BenchmarkQuery) -> List[int]:
+            questions = await embedding_search_questions(
+                query.embedding, self.qs, n=self.k, backend=backend, ef_search=ef_search
+            )
+            return [q.id for q in questions]
+
+        return await self._run(
+            _case_name('questions', backend, ef_search), queries, search, lambda query: query.question_ids
+        )
+
+    async def run_documents(
+            self,
+            queries: List[BenchmarkQuery],
+            backend_path: str = None,
+            ef_search: int = None,
+    ) -> Optional[BenchmarkResult]:
+        """
+        Benchmark the vector mode of `embedding_search` with the backend. The query embeddings are put
+        to the embeddings cache, so no embedding model is called.
+        """
+        cache_size = getattr(settings, 'EMBEDDING_CACHE_SIZE', 10000)
+        if cache_size < len(queries):
+            logger.warning(f'EMBEDDING_CACHE_SIZE={cache_size} is less than the number of queries, '
+                           f'embedding_search is not benchmarked')
+            return None
+        await self.prime_embedding_cache(queries)
+        backend = get_search_backend(backend_path)
+
+        async def search(query: BenchmarkQuery) -> List[int]:
+            documents = await embedding_search(
+                query.text, self.qs, max_scores_n=self.max_scores_n, top_n=self.k, backend=backend,
+                ef_search=ef_search, hybrid=False,
+            )
+            return [d.id for d, _ in documents]
+
+        return await self._run(
+            _case_name('documents', backend, ef_search), queries, search, lambda query: query.document_ids
+        )
+
+    @staticmethod
+    async def prime_embedding_cache(queries: List[BenchmarkQuery]):
+        embedder = CachedEmbedder(settings.EMBEDDING_AI_MODEL)
+        cache = get_embedding_cache()
+        for query in queries:
+            await cache.set(embedder.cache_key(query.text), query.embedding)
+
+    async def _run(
+            self,
+            name: str,
+            queries: List[BenchmarkQuery],
+            search: Callable[[BenchmarkQuery], Awaitable[List[int]]],
+            expected: Callable[[BenchmarkQuery], List[int]],
+    ) -> BenchmarkResult:
+        result = BenchmarkResult(name=name, k=self.k, concurrency=self.concurrency)
+        if not queries:
+            return result
+
+        # Warm up the connection and the backend state
+        await search(queries[0])
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run_query(query: BenchmarkQuery):
+            async with semaphore:
+                start_ts = time.perf_counter()
+                found = await search(query)
+                result.latencies.append(time.perf_counter() - start_ts)
+            expected_ids = set(expected(query))
+            if expected_ids:
+                result.recalls.append(recall(expected_ids, found))
+
+        start_ts = time.perf_counter()
+        await asyncio.gather(*[run_query(query) for query in queries])
+        result.wall_time = time.perf_counter() - start_ts
+        logger.info(f'{name}: {result.to_dict()}')
+        return result
+
+
+def recall(expected: Set[int], found: List[int]) -> float:
+    return len(expected.intersection(found)) / len(expected)
+
+
+def _case_name(target: str, backend, ef_search: Optional[int]) -> str:
+    name = f'{target} {type(backend).__name__}'
+    if ef_search is not None:
+        name += f' ef={ef_search}'
+    return name
+
+
+async def run_benchmark(
+        qs: QuerySet,
+        backend_paths: List[Optional[str]],
+        queries_n: int = 100,
+        k: int = 10,
+        concurrency: int = 1,
+        ef_search: List[Optional[int]] = None,
+        max_scores_n: int = 10,
+        noise: float = 0.5,
+        seed: int = 0,
+) -> List[BenchmarkResult]:
+    """
+    Run the questions and the documents cases for every backend and `ef_search` value.
+    """
+    runner = BenchmarkRunner(qs, k=k, concurrency=concurrency, max_scores_n=max_scores_n)
+    queries = await sync_to_async(runner.prepare)(queries_n, noise=noise, seed=seed)
+    results = []
+    for backend_path in backend_paths:
+        for ef in ef_search or [None]:
+            results.append(await runner.run_questions(queries, backend_path, ef))
+            documents_result = await runner.run_documents(queries, backend_path, ef)
+            if documents_result is not None:
+                results.append(documents_result)
+    return results
@@ -0,0 +1,238 @@
+import hashlib
+import logging
+from functools import lru_cache
+from typing import List, Optional, Type, Callable
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import models
+
+from assistant.ai.providers.base import AIEmbedder
+from assistant.storage.models import (
+    Question, Sentence, Document, EmbeddingModel, BaseObjectEmbedding, QuestionEmbedding, SentenceEmbedding,
+    DocumentEmbedding, StoredEmbedding,
+)
+
+logger = logging.getLogger(__name__)
+
+
+EMBEDDING_TABLES = {
+    (Question, 'embedding'): QuestionEmbedding,
+    (Sentence, 'embedding'): SentenceEmbedding,
+    (Document, 'content_embedding'): DocumentEmbedding,
+}
+
+
+def side_tables_enabled() -> bool:
+    """
+    Whether the embeddings are stored in the side tables (by model) instead of the fixed-size columns.
+    """
+    return getattr(settings, 'EMBEDDING_SIDE_TABLES', False)
+
+
+def get_active_embedding_model() -> str:
+    return settings.EMBEDDING_AI_MODEL
+
+
+def get_embedding_table(model: Type[models.Model], field: str) -> Type[BaseObjectEmbedding]:
+    try:
+        return EMBEDDING_TABLES[(model, field)]
+    except KeyError:
+        raise ValueError(f'No embedding table for {model.__name__}.{field}')
+
+
+@lru_cache
+def get_embedding_model_dimensions(name: str) -> int:
+    try:
+        return EmbeddingModel.objects.get(name=name).dimensions
+    except EmbeddingModel.DoesNotExist:
+        raise ValueError(f'Embedding model {name} is not registered, run the `embed_model` command')
+
+
+def register_embedding_model(name: str, dimensions: int) -> EmbeddingModel:
+    embedding_model, _ = EmbeddingModel.objects.get_or_create(name=name, defaults={'dimensions': dimensions})
+    if embedding_model.dimensions != dimensions:
+        raise ValueError(
+            f'Embedding model {name} is registered with {embedding_model.dimensions} dimensions, got {dimensions}'
+        )
+    return embedding_model
+
+
+def save_embeddings(
+        objects: List[models.Model],
+        embeddings: List[List[float]],
+        field: str = 'embedding',
+        model_name: str = None,
+        side_tables: bool = None,
+):
+    """
+    Save the embeddings of the objects (of the same model) either to the `field` column
+    or to the side table rows of the embedding model (the active one by default).
+    """
+    if not objects:
+        return
+    assert len(objects) == len(embeddings)
+    if side_tables is None:
+        side_tables = side_tables_enabled()
+    model = type(objects[0])
+
+    if not side_tables:
+        for obj, embedding in zip(objects, embeddings):
+            setattr(obj, field, embedding)
+        model.objects.bulk_update(objects, fields=[field])
+        return
+
+    model_name = model_name or get_active_embedding_model()
+    register_embedding_model(model_name, len(embeddings[0]))
+    table = get_embedding_table(model, field)
+    table.objects.bulk_create(
+        [
+            table(**{table.object_field: obj}, model=model_name, embedding=embedding)
+            for obj, embedding in zip(objects, embeddings)
+        ],
+        update_conflicts=True,
+        unique_fields=[table.object_field, 'model'],
+        update_fields=['embedding'],
+    )
+
+
+def get_building_embedding_models() -> List[str]:
+    """
+    Get the embedding models being built by the `embed_model` command, except the active one.
+    """
+    return list(
+        EmbeddingModel.objects.filter(is_building=True).exclude(name=get_active_embedding_model())
+        .values_list('name', flat=True)
+    )
+
+
+def set_embedding_model_building(name: str, is_building: bool) -> bool:
+    return EmbeddingModel.objects.filter(name=name).update(is_building=is_building) > 0
+
+
+async def save_building_embeddings(
+        objects: List[models.Model],
+        texts: List[str],
+        field: str = 'embedding',
+        embedder_factory: Callable[[str], AIEmbedder] = None,
+):
+    """
+    Embed the objects by every model being built too and save them to its side table rows,
+    so the objects processed during the backfill are searched once the model is switched to.
+    """
+    if not objects:
+        return
+    for model_name in await sync_to_async(get_building_embedding_models)():
+        embeddings = await StoredEmbedder(model_name, embedder_factory=embedder_factory).embeddings(texts)
+        await sync_to_async(save_embeddings)(objects, embeddings, field=field, model_name=model_name, side_tables=True)
+
+
+def load_embeddings(
+        objects: List[models.Model],
+        field: str = 'embedding',
+        model_name: str = None,
+        side_tables: bool = None,
+) -> List[Optional[List[float]]]:
+    """
+    Load the embeddings of the objects (of the same model) stored by `save_embeddings`.
+    """
+    if not objects:
+        return []
+    if side_tables is None:
+        side_tables = side_tables_enabled()
+    if not side_tables:
+        return [getattr(obj, field) for obj in objects]
+
+    model_name = model_name or get_active_embedding_model()
+    table = get_embedding_table(type(objects[0]), field)
+    embeddings = dict(
+        table.objects.filter(
+            **{f'{table.object_field}__in': objects}, model=model_name
+        ).values_list(f'{table.object_field}_id', 'embedding')
+    )
+    return [embeddings.get(obj.pk) for obj in objects]
+
+
+def embedding_index_name(table: Type[BaseObjectEmbedding], model_name: str, kind: str = 'hnsw') -> str:
+    slug = ''.join(c if c.isalnum() else '_' for c in model_name.lower())
+    suffix = f'_{kind}_idx'
+    return f'{table._meta.db_table}_{slug}'[:63 - len(suffix)] + suffix
+
+
+def create_embedding_index_sql(table: Type[BaseObjectEmbedding], model_name: str, dimensions: int) -> str:
+    """
+    SQL of the partial HNSW index of the embeddings of one model (created without blocking the writes).
+    """
+    quoted_model_name = model_name.replace("'", "''")
+    return (
+        f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{embedding_index_name(table, model_name)}" '
+        f'ON "{table._meta.db_table}" '
+        f'USING hnsw ((embedding::vector({int(dimensions)})) vector_cosine_ops) '
+        f'WITH (m = 16, ef_construction = 64) '
+        f"WHERE model = '{quoted_model_name}'"
+    )
+
+
+def embedding_store_enabled() -> bool:
+    return getattr(settings, 'EMBEDDING_STORE_ENABLED', True)
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def get_stored_embeddings(model_name: str, texts: List[str], batch_size: int = 1000) -> List[Optional[List[float]]]:
+    """
+    Get the stored embeddings of the texts by the model (`None` for the texts never embedded).
+    """
+    hashes = [text_hash(text) for text in texts]
+    found = {}
+    for i in range(0, len(hashes), batch_size):
+        for h, embedding in StoredEmbedding.objects.filter(
+            model=model_name, text_hash__in=hashes[i:i + batch_size]
+        ).values_list('text_hash', 'embedding'):
+            found[h] = [float(x) for x in embedding]
+    return [found.get(h) for h in hashes]
+
+
+def store_embeddings(model_name: str, texts: List[str], embeddings: List[List[float]]):
+    StoredEmbedding.objects.bulk_create(
+        [
+            StoredEmbedding(model=model_name, text_hash=text_hash(text), embedding=embedding)
+            for text, embedding in zip(texts, embeddings)
+        ],
+        ignore_conflicts=True,
+        batch_size=1000,
+    )
+
+
+class StoredEmbedder(AIEmbedder):
+    """
+    Looks the texts up in the persistent embedding store (by the model and the SHA-256 of the text)
+    and embeds only the missing ones, which are stored for the next processing.
+    """
+
+    def __init__(self, model: str, embedder_factory: Callable[[str], AIEmbedder] = None):
+        self._model = model
+        if embedder_factory is None:
+            from assistant.ai.services.ai_service import get_ai_embdedder
+            embedder_factory = get_ai_embdedder
+        self._embedder = embedder_factory(model)
+
+    async def embeddings(self, input: List[str]) -> List[List[float]]:
+        if not input or not embedding_store_enabled():
+            return await self._embedder.embeddings(input)
+
+        result = await sync_to_async(get_stored_embeddings)(self._model, input)
+        missing = list(dict.fromkeys(text for text, embedding in zip(input, result) if embedding is None))
+        logger.debug(f'Embedding store: {len(input) - len(missing)} hits, {len(missing)} misses')
+
+        if missing:
+            embeddings = await self._embedder.embeddings(missing)
+            await sync_to_async(store_embeddings)(self._model, missing, embeddings)
+            computed = dict(zip(missing, embeddings))
+            result = [
+                embedding if embedding is not None else computed[text]
+                for text, embedding in zip(input, result)
+            ]
+        return result
@@ -0,0 +1,47 @@
+import logging
+from typing import List, Type
+
+from django.conf import settings
+from django.db import connection
+
+from assistant.storage.models import Question, Sentence, BaseEmbeddingModel
+
+logger = logging.getLogger(__name__)
+
+
+BOT_INDEXED_MODELS: List[Type[BaseEmbeddingModel]] = [Question, Sentence]
+
+
+def per_bot_vector_indexes_enabled() -> bool:
+    return getattr(settings, 'PER_BOT_VECTOR_INDEXES', False)
+
+
+def bot_vector_index_name(model: Type[BaseEmbeddingModel], bot_id: int) -> str:
+    return f'{model._meta.model_name}_embedding_bot_{int(bot_id)}_idx'
+
+
+def create_bot_vector_indexes(bot_id: int):
+    """
+    Create the partial HNSW indexes of the live embeddings of one bot, so its searches
+    do not scan (and post-filter) the corpus of the other bots.
+    The searched queryset must filter by `bot` and `is_live=True` for the planner to use them.
+    """
+    for model in BOT_INDEXED_MODELS:
+        field = model._meta.get_field('embedding')
+        sql = (
+            f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{bot_vector_index_name(model, bot_id)}" '
+            f'ON "{model._meta.db_table}" '
+            f'USING hnsw ("{field.column}" vector_cosine_ops) '
+            f'WITH (m = 16, ef_construction = 64) '
+            f'WHERE "{model._meta.get_field("bot").column}" = {int(bot_id)} AND is_live'
+        )
+        logger.info(f'Creating vector index of {model.__name__} for bot {bot_id}')
+        with connection.cursor() as cursor:
+            cursor.execute(sql)
+
+
+def drop_bot_vector_indexes(bot_id: int):
+    for model in BOT_INDEXED_MODELS:
+        logger.info(f'Dropping vector index of {model.__name__} for bot {bot_id}')
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{bot_vector_index_name(model, bot_id)}"')
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import logging
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from assistant.ai.embedders.cache import CachedEmbedder
+from assistant.bot.models import Bot
+from assistant.rag.services.embeddings_service import get_active_embedding_model, side_tables_enabled
+from assistant.storage.models import Question, Document
+from assistant.utils.cache import TieredCache, get_shared_store
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache
+def get_retrieval_cache() -> TieredCache:
+    """
+    Get the process-wide retrieval results cache configured by the `RETRIEVAL_CACHE_*` settings.
+    """
+    return TieredCache(
+        namespace='retrieval',
+        maxsize=getattr(settings, 'RETRIEVAL_CACHE_SIZE', 1000),
+        ttl=getattr(settings, 'RETRIEVAL_CACHE_TTL', 60 * 60),
+        shared_store=get_shared_store(getattr(settings, 'RETRIEVAL_CACHE_URL', None)),
+        dumps=lambda value: json.dumps(value).encode('utf-8'),
+        loads=lambda data: json.loads(data),
+    )
+
+
+def retrieval_cache_enabled() -> bool:
+    return getattr(settings, 'RETRIEVAL_CACHE_ENABLED', True)
+
+
+def retrieval_settings() -> tuple:
+    """
+    Settings the retrieval results depend on: the embedding model and the search configuration.
+    """
+    from assistant.rag.services.search_service import hybrid_search_enabled
+    return (
+        get_active_embedding_model(),
+        side_tables_enabled(),
+        getattr(settings, 'VECTOR_SEARCH_BACKEND', None),
+        getattr(settings, 'HNSW_EF_SEARCH', None),
+        getattr(settings, 'VECTOR_SEARCH_QUANTIZATION', None),
+        getattr(settings, 'VECTOR_SEARCH_RERANK_FACTOR', None),
+        getattr(settings, 'TWO_STAGE_SEARCH_DOCUMENTS', None),
+        hybrid_search_enabled(),
+        getattr(settings, 'HYBRID_SEARCH_RRF_K', None),
+        getattr(settings, 'HYBRID_SEARCH_VECTOR_CANDIDATES', None),
+        getattr(settings, 'HYBRID_SEARCH_LEXICAL_CANDIDATES', None),
+    )
+
+
+def retrieval_cache_key(bot: Bot, scope: str, query: str) -> str:
+    """
+    Key of the retrieval results of the query. It includes the corpus version of the bot,
+    so the results cached before a processing is completed are never read again,
+    and the retrieval settings, so changing the embedding model or the search configuration
+    does not serve the results found under the previous one.
+    """
+    digest = hashlib.sha1(CachedEmbedder.normalize(query).encode('utf-8')).hexdigest()
+    settings_digest = hashlib.sha1(json.dumps(retrieval_settings()).encode('utf-8')).hexdigest()[:12]
+    return f'{bot.id}:{bot.corpus_version}:{settings_digest}:{scope}:{digest}'
+
+
+async def get_cached_retrieval(
+        bot: Bot,
+        scope: str,
+        query: str,
+) -> Optional[Tuple[List[Question], List[Document]]]:
+    """
+    Get the cached related questions (with their `distance`) and documents of the query.
+    """
+    if not retrieval_cache_enabled():
+        return None
+    cached = await get_retrieval_cache().get(retrieval_cache_key(bot, scope, query))
+    if cached is None:
+        return None
+    return await sync_to_async(_load_retrieval)(cached)
+
+
+async def cache_retrieval(
+        bot: Bot,
+        scope: str,
+        query: str,
+        questions: List[Question],
+        documents: List[Document],
+):
+    if not retrieval_cache_enabled():
+        return
+    await get_retrieval_cache().set(
+        retrieval_cache_key(bot, scope, query),
+        {
+            'questions': [[q.id, float(q.distance)] for q in questions],
+            'documents': [d.id for d in documents],
+        }
+    )
+
+
+def _load_retrieval(cached: dict) -> Optional[Tuple[List[Question], List[Document]]]:
+    questions_by_id = Question.objects.in_bulk([question_id for question_id, _ in cached['questions']])
+    documents_by_id = Document.objects.in_bulk(cached['documents'])
+    if len(questions_by_id) < len(cached['questions']) or len(documents_by_id) < len(cached['documents']):
+        # Deleted by a reprocessing not completed yet
+        return None
+    questions = []
+    for question_id, distance in cached['questions']:
+        question = questions_by_id[question_id]
+        question.distance = distance
+        questions.append(question)
+    return questions, [documents_by_id[document_id] for document_id in cached['documents']]
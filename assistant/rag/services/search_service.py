@@ -1,19 +1,49 @@
+import asyncio
 import logging
 from collections import defaultdict
-from typing import List, Tuple
+from functools import lru_cache
+from typing import List, Tuple, Any, Callable, Hashable, Optional
 
 import numpy as np
 from asgiref.sync import sync_to_async
 from django.conf import settings
-from django.db.models import QuerySet
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import QuerySet, F, OuterRef, Subquery
+from django.utils.module_loading import import_string
 from pgvector.django import CosineDistance
 
+from assistant.ai.embedders.batching import get_batching_embedder
+from assistant.ai.embedders.cache import CachedEmbedder
 from assistant.ai.services.ai_service import get_ai_embdedder
+from assistant.rag.backends.base import VectorSearchBackend
+from assistant.rag.services.embeddings_service import side_tables_enabled, get_embedding_table, \
+    get_active_embedding_model
 from assistant.storage.models import Document, Sentence, Question, BaseEmbeddingModel, WikiDocument
 
 logger = logging.getLogger(__name__)
 
 
+_default_search_backend_class_path = 'assistant.rag.backends.postgres.PgVectorSearchBackend'
+
+# Text search configuration of the `search_vector` columns (see the storage migrations)
+SEARCH_CONFIG = 'pg_catalog.simple'
+
+_lexical_query_max_words = 32
+
+
+@lru_cache
+def get_search_backend(class_path: str = None) -> VectorSearchBackend:
+    """
+    Get the vector search backend instance (shared by the process) by its class path.
+    The `VECTOR_SEARCH_BACKEND` setting is used by default.
+    """
+    if class_path is None:
+        class_path = getattr(settings, 'VECTOR_SEARCH_BACKEND', _default_search_backend_class_path)
+    logger.info(f"Using vector search backend {class_path}")
+    backend_class = import_string(class_path)
+    return backend_class()
+
+
 def cosine_similarity(a, b):
     dot_product = np.dot(a, b)
     norm_a = np.linalg.norm(a)
@@ -113,10 +143,23 @@ async def embedding_search(
         qs: QuerySet,
         max_scores_n: int = 10,
         top_n: int = 10,
+        backend: VectorSearchBackend = None,
+        ef_search: int = None,
+        hybrid: bool = None,
 ) -> List[Tuple[dict, float]]:
+    """
+    Search the documents by the objects of the queryset closest to the query.
+
+    In the hybrid mode (`HYBRID_SEARCH_ENABLED`, off by default) the vector ranking of the documents is fused
+    with the full-text ranking of the objects by reciprocal rank fusion, and the scores are the fusion scores
+    instead of the cosine similarities.
+    """
 
     logger.info(f'Embedding search for query: {query}')
 
+    if hybrid is None:
+        hybrid = hybrid_search_enabled()
+
     filter_kwargs = {
     }
 
@@ -126,60 +169,294 @@ async def embedding_search(
 
     query_embedding = await get_embedding(query)
 
-    top_objects = await _objects_embedding_search(
-        query_embedding, embedding_qs, n=max_scores_n * top_n * 10
+    if backend is None:
+        backend = get_search_backend()
+
+    if hybrid:
+        vector_documents, lexical_objects = await asyncio.gather(
+            backend.search_documents(
+                query_embedding, embedding_qs, n=max_scores_n * top_n * 10, max_scores_n=max_scores_n, top_n=None,
+                ef_search=ef_search,
+            ),
+            lexical_search(query, embedding_qs, n=_hybrid_lexical_candidates()),
+        )
+        documents = {d.id: d for d, _ in vector_documents}
+        lexical_ranking = list(dict.fromkeys(obj.document_id for obj in lexical_objects))
+        missing_ids = [doc_id for doc_id in lexical_ranking if doc_id not in documents]
+        if missing_ids:
+            documents.update(await (sync_to_async(
+                lambda: Document.objects.in_bulk(missing_ids)
+            ))())
+        result = [
+            (documents[doc_id], score)
+            for doc_id, score in reciprocal_rank_fusion(
+                [[d.id for d, _ in vector_documents], lexical_ranking],
+                key=lambda doc_id: doc_id,
+            )
+            if doc_id in documents
+        ]
+        return result[:top_n]
+
+    return await backend.search_documents(
+        query_embedding, embedding_qs, n=max_scores_n * top_n * 10, max_scores_n=max_scores_n, top_n=top_n,
+        ef_search=ef_search,
     )
 
-    docs = defaultdict(list)
-    for obj in top_objects:
-        docs[obj.document_id].append(obj)
 
-    doc_scores = {
-        doc_id: 1 - sum([o.distance for o in v[:max_scores_n]]) / max_scores_n
-        for doc_id, v in docs.items() if len(v) >= max_scores_n
-    }
+async def embedding_search_many(
+        queries: List[str],
+        qs: QuerySet,
+        max_scores_n: int = 10,
+        top_n: int = 10,
+        backend: VectorSearchBackend = None,
+        ef_search: int = None,
+) -> List[List[Tuple[Document, float]]]:
+    """
+    The same as `embedding_search` but for many queries at once:
+    the queries are embedded in one call and searched in one round trip.
+    """
+    logger.info(f'Embedding search for {len(queries)} queries')
+
+    query_embeddings = await get_embeddings(queries)
+
+    if backend is None:
+        backend = get_search_backend()
+    return await backend.search_documents_many(
+        query_embeddings, qs, n=max_scores_n * top_n * 10, max_scores_n=max_scores_n, top_n=top_n,
+        ef_search=ef_search,
+    )
 
-    result = [
-        (d, doc_scores[d.id])
-        for d in await (sync_to_async(
-            lambda: list(Document.objects.filter(id__in=list(doc_scores.keys())))
-        ))()
-    ]
 
-    result.sort(key=lambda x: x[1], reverse=True)
-    result = result[:top_n]
+def scope_queryset(qs: QuerySet, root: WikiDocument) -> QuerySet:
+    """
+    Limit the questions or sentences of the queryset to the wiki subtree of `root`
+    by their denormalized wiki (see `update_search_fields`). The subtree is read from the live MPTT columns
+    of the wikis, so inserting, moving or deleting wikis never leaves the filter stale.
+    """
+    return qs.filter(wiki_id__in=root.get_descendants(include_self=True).values('id'))
+
+
+def reciprocal_rank_fusion(
+        rankings: List[List[Any]],
+        k: int = None,
+        key: Callable[[Any], Hashable] = lambda obj: obj.pk,
+) -> List[Tuple[Any, float]]:
+    """
+    Fuse several rankings into one by the sum of `1 / (k + rank)` over the rankings an item appears in.
+    Items are identified by `key`; the first seen instance of an item is returned.
+    """
+    if k is None:
+        k = getattr(settings, 'HYBRID_SEARCH_RRF_K', 60)
+    items, scores = {}, defaultdict(float)
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            item_key = key(item)
+            items.setdefault(item_key, item)
+            scores[item_key] += 1 / (k + rank)
+    return sorted(
+        [(items[item_key], score) for item_key, score in scores.items()],
+        key=lambda x: x[1], reverse=True
+    )
 
-    return result
+
+def _lexical_query(query: str) -> Optional[SearchQuery]:
+    """
+    Full-text query matching any of the query words, so the rank grows with the number of matched words.
+    """
+    words = list(dict.fromkeys(query.lower().split()))[:_lexical_query_max_words]
+    if not words:
+        return None
+    search_query = SearchQuery(words[0], config=SEARCH_CONFIG)
+    for word in words[1:]:
+        search_query |= SearchQuery(word, config=SEARCH_CONFIG)
+    return search_query
+
+
+async def lexical_search(
+        query: str,
+        qs: QuerySet,
+        n: int = 10,
+        query_embedding: List[float] = None,
+        field: str = 'embedding',
+) -> List[BaseEmbeddingModel]:
+    """
+    Get the `n` objects of the queryset best matching the query by full-text search over `search_vector`.
+    Every returned object has the `rank` attribute set, and the `distance` one if the query embedding is given
+    (the objects without an embedding are skipped then).
+    """
+    search_query = _lexical_query(query)
+    if search_query is None or n <= 0:
+        return []
+    qs = qs.filter(
+        search_vector=search_query
+    ).annotate(
+        rank=SearchRank(F('search_vector'), search_query)
+    )
+    if query_embedding is not None:
+        if side_tables_enabled():
+            table = get_embedding_table(qs.model, field)
+            distance = Subquery(
+                table.objects.filter(
+                    **{table.object_field: OuterRef('pk')}, model=get_active_embedding_model()
+                ).annotate(
+                    distance=CosineDistance('embedding', query_embedding)
+                ).values('distance')[:1]
+            )
+        else:
+            distance = CosineDistance(field, query_embedding)
+        qs = qs.annotate(distance=distance).filter(distance__isnull=False)
+    return await sync_to_async(lambda: list(qs.order_by('-rank')[:n]))()
+
+
+async def hybrid_search(
+        query: str,
+        query_embedding: List[float],
+        qs: QuerySet,
+        n: int = 10,
+        field: str = 'embedding',
+        backend: VectorSearchBackend = None,
+        ef_search: int = None,
+) -> List[BaseEmbeddingModel]:
+    """
+    Get the `n` objects of the queryset best matching the query by the reciprocal rank fusion
+    of the vector search and the full-text search results.
+    Every returned object has the `distance` attribute set.
+    """
+    vector_objects, lexical_objects = await asyncio.gather(
+        _objects_embedding_search(
+            query_embedding, qs, n=max(n, _hybrid_vector_candidates()), field=field, backend=backend,
+            ef_search=ef_search,
+        ),
+        lexical_search(
+            query, qs, n=_hybrid_lexical_candidates(), query_embedding=query_embedding, field=field
+        ),
+    )
+    fused = reciprocal_rank_fusion([vector_objects, lexical_objects])
+    return [obj for obj, _ in fused[:n]]
+
+
+async def hybrid_search_documents(
+        query: str,
+        query_embedding: List[float],
+        qs: QuerySet,
+        n: int = 10,
+        backend: VectorSearchBackend = None,
+        ef_search: int = None,
+) -> List[Document]:
+    return await hybrid_search(query, query_embedding, qs, n, field='content_embedding', backend=backend, ef_search=ef_search)
+
+
+async def hybrid_search_questions(
+        query: str,
+        query_embedding: List[float],
+        qs: QuerySet,
+        n: int = 10,
+        backend: VectorSearchBackend = None,
+        ef_search: int = None,
+) -> List[Question]:
+    return await hybrid_search(query, query_embedding, qs, n, backend=backend, ef_search=ef_search)
+
+
+async def hybrid_search_sentences(
+        query: str,
+        query_embedding: List[float],
+        qs: QuerySet,
+        n: int = 10,
+        backend: VectorSearchBackend = None,
+        ef_search: int = None,
+) -> List[Sentence]:
+    return await hybrid_search(query, query_embedding, qs, n, backend=backend, ef_search=ef_search)
+
+
+def hybrid_search_enabled() -> bool:
+    return getattr(settings, 'HYBRID_SEARCH_ENABLED', False)
+
+
+def _hybrid_vector_candidates() -> int:
+    return getattr(settings, 'HYBRID_SEARCH_VECTOR_CANDIDATES', 100)
+
+
+def _hybrid_lexical_candidates() -> int:
+    return getattr(settings, 'HYBRID_SEARCH_LEXICAL_CANDIDATES', 20)
 
 
 async def get_embedding(text: str) -> List[float]:
+    return (await get_embeddings([text]))[0]
+
+
+async def get_embeddings(texts: List[str]) -> List[List[float]]:
+    """
+    Get the query embeddings by the `EMBEDDING_AI_MODEL` through the embeddings cache.
+    The cache misses of the concurrent queries are embedded together if `EMBEDDING_BATCHING_ENABLED` is set.
+    """
+    if not texts:
+        return []
     model = settings.EMBEDDING_AI_MODEL
-    embedder = get_ai_embdedder(model)
-    return (await embedder.embeddings([text]))[0]
+    if getattr(settings, 'EMBEDDING_BATCHING_ENABLED', True):
+        embedder = CachedEmbedder(model, embedder_factory=get_batching_embedder)
+    else:
+        embedder = CachedEmbedder(model)
+    return await embedder.embeddings(texts)
 
 
 async def embedding_search_documents(
         query_embedding: List[float],
         qs: QuerySet,
-        n: int = 10
+        n: int = 10,
+        backend: VectorSearchBackend = None,
+        ef_search: int = None,
 ) -> List[Document]:
-    return await _objects_embedding_search(query_embedding, qs, n, field='content_embedding')
+    return await _objects_embedding_search(query_embedding, qs, n, field='content_embedding', backend=backend, ef_search=ef_search)
+
+
+async def embedding_search_documents_many(
+        query_embeddings: List[List[float]],
+        qs: QuerySet,
+        n: int = 10,
+        backend: VectorSearchBackend = None,
+        ef_search: int = None,
+) -> List[List[Document]]:
+    return await _objects_embedding_search_many(query_embeddings, qs, n, field='content_embedding', backend=backend, ef_search=ef_search)
 
 
 async def embedding_search_questions(
         query_embedding: List[float],
         qs: QuerySet,
-        n: int = 10
+        n: int = 10,
+        backend: VectorSearchBackend = None,
+        ef_search: int = None,
 ) -> List[Question]:
-    return await _objects_embedding_search(query_embedding, qs, n)
+    return await _objects_embedding_search(query_embedding, qs, n, backend=backend, ef_search=ef_search)
 
 
 async def embedding_search_sentences(
         query_embedding: List[float],
         qs: QuerySet,
-        n: int = 10
+        n: int = 10,
+        backend: VectorSearchBackend = None,
+        ef_search: int = None,
 ) -> List[Sentence]:
-    return await _objects_embedding_search(query_embedding, qs, n)
+    return await _objects_embedding_search(query_embedding, qs, n, backend=backend, ef_search=ef_search)
+
+
+async def embedding_search_sentences_many(
+        query_embeddings: List[List[float]],
+        qs: QuerySet,
+        n: int = 10,
+        backend: VectorSearchBackend = None,
+        ef_search: int = None,
+) -> List[List[Sentence]]:
+    return await _objects_embedding_search_many(query_embeddings, qs, n, backend=backend, ef_search=ef_search)
+
+
+async def embedding_search_questions_many(
+        query_embeddings: List[List[float]],
+        qs: QuerySet,
+        n: int = 10,
+        backend: VectorSearchBackend = None,
+        ef_search: int = None,
+) -> List[List[Question]]:
+    return await _objects_embedding_search_many(query_embeddings, qs, n, backend=backend, ef_search=ef_search)
 
 
 async def _objects_embedding_search(
@@ -187,10 +464,22 @@ async def _objects_embedding_search(
         qs: QuerySet,
         n: int = 10,
         field: str = 'embedding',
+        backend: VectorSearchBackend = None,
+        ef_search: int = None,
 ) -> List[BaseEmbeddingModel]:
-    top_objects = await (sync_to_async(
-        lambda: list(qs.annotate(
-            distance=CosineDistance(field, query_embedding)
-        ).order_by('distance')[:n])
-    ))()
-    return top_objects
+    if backend is None:
+        backend = get_search_backend()
+    return await backend.search(query_embedding, qs, n, field=field, ef_search=ef_search)
+
+
+async def _objects_embedding_search_many(
+        query_embeddings: List[List[float]],
+        qs: QuerySet,
+        n: int = 10,
+        field: str = 'embedding',
+        backend: VectorSearchBackend = None,
+        ef_search: int = None,
+) -> List[List[BaseEmbeddingModel]]:
+    if backend is None:
+        backend = get_search_backend()
+    return await backend.search_many(query_embeddings, qs, n, field=field, ef_search=ef_search)
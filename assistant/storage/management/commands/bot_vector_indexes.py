@@ -0,0 +1,23 @@
+from django.core.management import BaseCommand
+
+from assistant.bot.models import Bot
+from assistant.rag.services.index_service import create_bot_vector_indexes, drop_bot_vector_indexes
+
+
+class Command(BaseCommand):
+    help = 'Create (or drop) the per-bot partial HNSW indexes of the questions and sentences'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bot', type=str, help='Codename of the bot (all bots by default)')
+        parser.add_argument('--drop', action='store_true', help='Drop the indexes instead of creating them')
+
+    def handle(self, *args, **options):
+        bots = Bot.objects.order_by('id')
+        if options['bot']:
+            bots = bots.filter(codename=options['bot'])
+        for bot in bots:
+            self.stdout.write(f'{"Dropping" if options["drop"] else "Creating"} vector indexes for {bot}')
+            if options['drop']:
+                drop_bot_vector_indexes(bot.id)
+            else:
+                create_bot_vector_indexes(bot.id)
@@ -0,0 +1,39 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from assistant.ai.services.ai_service import get_ai_embdedder
+from assistant.rag.services.embeddings_service import save_embeddings, side_tables_enabled, get_active_embedding_model
+from assistant.storage.models import Document
+
+
+class Command(BaseCommand):
+    help = 'Embed the content of the documents processed without `ContentEmbeddingsStep` (for the two-stage search)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bot', type=str, help='Codename of the bot (all bots by default)')
+        parser.add_argument('--batch-size', default=16, type=int, help='Number of documents embedded at once')
+
+    def handle(self, *args, **options):
+        asyncio.run(self._embed(options['bot'], options['batch_size']))
+
+    async def _embed(self, bot: str, batch_size: int):
+        # The embedder's API client is bound to the event loop, so the whole backfill runs in the same one
+        embedder = get_ai_embdedder(settings.EMBEDDING_AI_MODEL)
+        qs = Document.objects.exclude(content='').order_by('pk')
+        if side_tables_enabled():
+            qs = qs.exclude(embeddings__model=get_active_embedding_model())
+        else:
+            qs = qs.filter(content_embedding__isnull=True)
+        if bot:
+            qs = qs.filter(wiki__bot__codename=bot)
+        total = 0
+        last_pk = 0
+        while batch := await sync_to_async(list)(qs.filter(pk__gt=last_pk)[:batch_size]):
+            embeddings = await embedder.embeddings([document.content for document in batch])
+            await sync_to_async(save_embeddings)(batch, embeddings, field='content_embedding')
+            total += len(batch)
+            last_pk = batch[-1].pk
+            self.stdout.write(f'{total} documents embedded')
@@ -0,0 +1,98 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.core.management import BaseCommand
+from django.db import connection
+
+from assistant.ai.services.ai_service import get_ai_embdedder
+from assistant.rag.services.embeddings_service import EMBEDDING_TABLES, save_embeddings, register_embedding_model, \
+    create_embedding_index_sql, get_embedding_model_dimensions, set_embedding_model_building
+from assistant.storage.models import Document
+
+
+class Command(BaseCommand):
+    help = (
+        'Fill the side embedding tables for an embedding model and build its HNSW indexes '
+        'without touching the searched model (switch EMBEDDING_AI_MODEL when it is done)'
+    )
+
+    text_fields = {
+        'embedding': 'text',
+        'content_embedding': 'content',
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', type=str, help='Embedding model')
+        parser.add_argument('--copy-columns', action='store_true',
+                            help='Copy the embeddings from the columns instead of computing them')
+        parser.add_argument('--batch-size', default=64, type=int, help='Number of texts embedded at once')
+        parser.add_argument('--no-index', action='store_true', help='Do not create the indexes')
+        parser.add_argument('--stop-building', action='store_true',
+                            help='Stop embedding the processed documents by the model (if it is not switched to)')
+
+    def handle(self, *args, **options):
+        model_name = options['model']
+        if options['stop_building']:
+            set_embedding_model_building(model_name, False)
+            return
+
+        self._backfill(model_name, options)
+        # The documents processed from now on are embedded by the model as well (until it is the active one),
+        # the second pass catches up the ones processed during the first
+        if not set_embedding_model_building(model_name, True):
+            self.stderr.write(f'Nothing was embedded, the model {model_name} is not registered')
+            return
+        self._backfill(model_name, options)
+
+        if options['no_index']:
+            return
+        get_embedding_model_dimensions.cache_clear()
+        dimensions = get_embedding_model_dimensions(model_name)
+        for table in EMBEDDING_TABLES.values():
+            sql = create_embedding_index_sql(table, model_name, dimensions)
+            self.stdout.write(sql)
+            with connection.cursor() as cursor:
+                cursor.execute(sql)
+
+    def _backfill(self, model_name, options):
+        for (model, field), table in EMBEDDING_TABLES.items():
+            if options['copy_columns']:
+                self._copy_columns(model, field, table, model_name)
+            else:
+                self._embed(model, field, table, model_name, options['batch_size'])
+
+    def _copy_columns(self, model, field, table, model_name):
+        register_embedding_model(model_name, model._meta.get_field(field).dimensions)
+        object_column = table._meta.get_field(table.object_field).column
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO "{table._meta.db_table}" ("{object_column}", model, embedding) '
+                f'SELECT "{model._meta.pk.column}", %s, "{model._meta.get_field(field).column}" '
+                f'FROM "{model._meta.db_table}" '
+                f'WHERE "{model._meta.get_field(field).column}" IS NOT NULL '
+                f'ON CONFLICT ("{object_column}", model) DO NOTHING',
+                [model_name],
+            )
+            self.stdout.write(f'{model.__name__}: {cursor.rowcount} embeddings copied')
+
+    def _embed(self, model, field, table, model_name, batch_size):
+        asyncio.run(self._embed_batches(model, field, table, model_name, batch_size))
+
+    async def _embed_batches(self, model, field, table, model_name, batch_size):
+        # The embedder's API client is bound to the event loop, so all the batches run in the same one
+        embedder = get_ai_embdedder(model_name)
+        text_field = self.text_fields[field]
+        qs = model.objects.exclude(
+            pk__in=table.objects.filter(model=model_name).values(f'{table.object_field}_id')
+        ).order_by('pk')
+        if model is Document:
+            # Like `ContentEmbeddingsStep`, the documents without content are not embedded
+            qs = qs.exclude(**{f'{text_field}__regex': r'^\s*$'})
+        total = 0
+        while batch := await sync_to_async(list)(qs[:batch_size]):
+            embeddings = await embedder.embeddings([getattr(obj, text_field) for obj in batch])
+            await sync_to_async(save_embeddings)(
+                batch, embeddings, field=field, model_name=model_name, side_tables=True
+            )
+            total += len(batch)
+            self.stdout.write(f'{model.__name__}: {total} embedded')
@@ -0,0 +1,67 @@
+import time
+
+import numpy as np
+from django.core.management import BaseCommand
+from pgvector.django import CosineDistance
+
+from assistant.rag.backends.postgres import hnsw_ef_search, exact_vector_search
+from assistant.storage.models import Question, Sentence
+
+
+class Command(BaseCommand):
+    help = 'Measure recall@k and latency of the HNSW vector search for several hnsw.ef_search values'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bot', type=str, help='Codename of the bot to search in')
+        parser.add_argument('--field', type=str, default='questions', choices=('sentences', 'questions'), help='Field to search in')
+        parser.add_argument('--k', default=10, type=int, help='Number of the nearest neighbours')
+        parser.add_argument('--samples', default=100, type=int, help='Number of the sampled query embeddings')
+        parser.add_argument('--ef-search', nargs='+', default=[10, 20, 40, 80, 160, 320], type=int, help='Tested hnsw.ef_search values')
+
+    def handle(self, *args, **options):
+        model = Question if options['field'] == 'questions' else Sentence
+        qs = model.objects.filter(is_live=True, embedding__isnull=False)
+        if options['bot']:
+            qs = qs.filter(bot__codename=options['bot'])
+        k = options['k']
+
+        # Stored embeddings are used as the queries, the query object itself is not counted
+        queries = list(qs.order_by('?').values_list('id', 'embedding')[:options['samples']])
+        if not queries:
+            self.stdout.write('Nothing to search in')
+            return
+        self.stdout.write(f'{qs.count()} {model._meta.verbose_name_plural}, {len(queries)} queries, k={k}')
+
+        def nearest_ids(query_id, query_embedding):
+            ids = qs.annotate(
+                distance=CosineDistance('embedding', query_embedding)
+            ).order_by('distance').values_list('id', flat=True)[:k + 1]
+            return [i for i in ids if i != query_id][:k]
+
+        exact = {}
+        latencies = []
+        for query_id, query_embedding in queries:
+            start_ts = time.perf_counter()
+            with exact_vector_search(using=qs.db):
+                exact[query_id] = set(nearest_ids(query_id, query_embedding))
+            latencies.append(time.perf_counter() - start_ts)
+        self._report('exact', 1.0, latencies)
+
+        for ef_search in options['ef_search']:
+            recalls, latencies = [], []
+            for query_id, query_embedding in queries:
+                start_ts = time.perf_counter()
+                with hnsw_ef_search(ef_search, using=qs.db):
+                    found = nearest_ids(query_id, query_embedding)
+                latencies.append(time.perf_counter() - start_ts)
+                if exact[query_id]:
+                    recalls.append(len(exact[query_id].intersection(found)) / len(exact[query_id]))
+            self._report(f'ef_search={ef_search}', np.mean(recalls) if recalls else 0.0, latencies)
+
+    def _report(self, name: str, recall: float, latencies):
+        latencies_ms = np.array(latencies) * 1000
+        self.stdout.write(
+            f'{name:<16} recall@k={recall:.3f}  '
+            f'p50={np.percentile(latencies_ms, 50):.2f} ms  '
+            f'p99={np.percentile(latencies_ms, 99):.2f} ms'
+        )
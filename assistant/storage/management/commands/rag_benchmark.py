@@ -0,0 +1,83 @@
+import asyncio
+import json
+
+from django.core.management import BaseCommand, CommandError
+
+from assistant.rag.benchmark.generator import CorpusSpec, generate_corpus, delete_corpus
+from assistant.rag.benchmark.report import format_report
+from assistant.rag.benchmark.runner import run_benchmark
+from assistant.storage.models import Question
+
+
+class Command(BaseCommand):
+    help = 'Generate synthetic retrieval corpora and benchmark the vector search on them'
+
+    def add_arguments(self, parser):
+        subparsers = parser.add_subparsers(dest='action', required=True)
+
+        generate = subparsers.add_parser('generate', help='Create a bot with a synthetic knowledge base')
+        generate.add_argument('--codename', default='benchmark', help='Codename of the created bot')
+        generate.add_argument('--vectors', default=10000, type=int, help='Number of the questions')
+        generate.add_argument('--clusters', default=0, type=int, help='Number of the embedding clusters (0 for uniform)')
+        generate.add_argument('--spread', default=0.5, type=float, help='Noise norm around the cluster centers')
+        generate.add_argument('--questions-per-document', default=10, type=int)
+        generate.add_argument('--documents-per-wiki', default=10, type=int)
+        generate.add_argument('--batch-size', default=5000, type=int, help='Number of the questions inserted at once')
+        generate.add_argument('--seed', default=0, type=int)
+
+        run = subparsers.add_parser('run', help='Measure recall@k, QPS and latency percentiles')
+        run.add_argument('--codename', default='benchmark', help='Codename of the searched bot')
+        run.add_argument('--queries', default=100, type=int, help='Number of the queries')
+        run.add_argument('--k', default=10, type=int, help='Number of the searched questions and documents')
+        run.add_argument('--concurrency', default=1, type=int, help='Number of the concurrent queries')
+        run.add_argument('--backend', nargs='+', default=[None],
+                         help='Class paths of the compared backends (VECTOR_SEARCH_BACKEND by default)')
+        run.add_argument('--ef-search', nargs='+', type=int, help='Tested hnsw.ef_search values')
+        run.add_argument('--max-scores-n', default=10, type=int, help='Questions averaged in the document score')
+        run.add_argument('--noise', default=0.5, type=float, help='Noise norm added to the sampled query embeddings')
+        run.add_argument('--seed', default=0, type=int)
+        run.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+        cleanup = subparsers.add_parser('cleanup', help='Delete a synthetic bot with its knowledge base')
+        cleanup.add_argument('--codename', default='benchmark', help='Codename of the deleted bot')
+
+    def handle(self, *args, **options):
+        getattr(self, f'_{options["action"]}')(options)
+
+    def _generate(self, options):
+        spec = CorpusSpec(
+            vectors=options['vectors'],
+            clusters=options['clusters'],
+            spread=options['spread'],
+            questions_per_document=options['questions_per_document'],
+            documents_per_wiki=options['documents_per_wiki'],
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+        )
+        bot = generate_corpus(options['codename'], spec)
+        self.stdout.write(f'Generated {spec.vectors} questions for bot {bot.codename}')
+
+    def _run(self, options):
+        qs = Question.objects.filter(bot__codename=options['codename'], is_live=True, embedding__isnull=False)
+        if not qs.exists():
+            raise CommandError(f'No questions to search for bot {options["codename"]}, run `generate` first')
+        results = asyncio.run(run_benchmark(
+            qs,
+            options['backend'],
+            queries_n=options['queries'],
+            k=options['k'],
+            concurrency=options['concurrency'],
+            ef_search=options['ef_search'],
+            max_scores_n=options['max_scores_n'],
+            noise=options['noise'],
+            seed=options['seed'],
+        ))
+        if options['json']:
+            self.stdout.write(json.dumps([result.to_dict() for result in results], indent=2))
+        else:
+            self.stdout.write(format_report(results))
+
+    def _cleanup(self, options):
+        if delete_corpus(options['codename']) is None:
+            raise CommandError(f'Bot {options["codename"]} does not exist')
+        self.stdout.write(f'Deleted bot {options["codename"]}')
@@ -1,26 +1,34 @@
-
 import asyncio
 
 from django.core.management import BaseCommand
 
-from assistant.rag.services.search_service import embedding_search
+from assistant.rag.services.search_service import embedding_search_many
+from assistant.storage.models import Question, Sentence
 
 
 class Command(BaseCommand):
     help = 'Embed documents'
 
     def add_arguments(self, parser):
-        parser.add_argument('query', type=str, help='Search query')
+        parser.add_argument('queries', nargs='+', type=str, help='Search queries')
         # parser.add_argument('--provider', default='llama3:8b', type=str, help='AI provider')
-        parser.add_argument('--field', type=str, choices=('sentences', 'questions'), help='Field to search in')
+        parser.add_argument('--bot', type=str, help='Codename of the bot to search in')
+        parser.add_argument('--field', type=str, default='questions', choices=('sentences', 'questions'), help='Field to search in')
         parser.add_argument('--max-scores-n', default=5, type=int, help='Max scores N')
         parser.add_argument('--n', default=10, type=int, help='Top N documents')
 
     def handle(self, *args, **options):
-        results: list = asyncio.run(
-            embedding_search(
-                options['query'], max_scores_n=options['max_scores_n'], top_n=options['n'], field=options['field']
+        model = Question if options['field'] == 'questions' else Sentence
+        qs = model.objects.filter(is_live=True)
+        if options['bot']:
+            qs = qs.filter(bot__codename=options['bot'])
+
+        results_list = asyncio.run(
+            embedding_search_many(
+                options['queries'], qs, max_scores_n=options['max_scores_n'], top_n=options['n']
             )
         )
-        for document, score in results:
-            print(f'{document.id}  {score}  ', document.name)
+        for query, results in zip(options['queries'], results_list):
+            print(f'Query: {query}')
+            for document, score in results:
+                print(f'{document.id}  {score}  ', document.name)
@@ -0,0 +1,67 @@
+from django.core.management import BaseCommand
+from django.db import connection
+
+from assistant.rag.backends.postgres import QUANTIZATIONS, quantized_index_name, create_quantized_embedding_index_sql
+from assistant.rag.services.embeddings_service import EMBEDDING_TABLES, side_tables_enabled, \
+    get_active_embedding_model, get_embedding_model_dimensions, embedding_index_name
+from assistant.storage.models import Question, Sentence, Document
+
+
+class Command(BaseCommand):
+    help = 'Create (or drop) the quantized HNSW indexes used by QuantizedPgVectorSearchBackend'
+
+    fields = [
+        (Question, 'embedding'),
+        (Sentence, 'embedding'),
+        (Document, 'content_embedding'),
+    ]
+
+    def add_arguments(self, parser):
+        parser.add_argument('quantization', type=str, choices=list(QUANTIZATIONS), help='Quantization of the index')
+        parser.add_argument('--drop', action='store_true', help='Drop the indexes instead of creating them')
+        parser.add_argument('--m', default=16, type=int, help='HNSW m')
+        parser.add_argument('--ef-construction', default=64, type=int, help='HNSW ef_construction')
+        parser.add_argument('--model', type=str,
+                            help='Embedding model whose side table embeddings are indexed '
+                                 '(EMBEDDING_AI_MODEL by default, only with EMBEDDING_SIDE_TABLES)')
+
+    def handle(self, *args, **options):
+        if side_tables_enabled() or options['model']:
+            statements = self._side_table_statements(options)
+        else:
+            statements = self._column_statements(options)
+        for sql in statements:
+            self.stdout.write(sql)
+            with connection.cursor() as cursor:
+                cursor.execute(sql)
+
+    def _column_statements(self, options):
+        quantization = QUANTIZATIONS[options['quantization']]
+        for model, field_name in self.fields:
+            field = model._meta.get_field(field_name)
+            index_name = quantized_index_name(field, options['quantization'])
+            if options['drop']:
+                yield f'DROP INDEX CONCURRENTLY IF EXISTS "{index_name}"'
+            else:
+                yield (
+                    f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{index_name}" '
+                    f'ON "{model._meta.db_table}" '
+                    f'USING hnsw (({quantization.apply(f"{field.column}", field.dimensions)}) {quantization.opclass}) '
+                    f'WITH (m = {options["m"]}, ef_construction = {options["ef_construction"]})'
+                )
+
+    def _side_table_statements(self, options):
+        model_name = options['model'] or get_active_embedding_model()
+        for table in EMBEDDING_TABLES.values():
+            if options['drop']:
+                index_name = embedding_index_name(table, model_name, options['quantization'])
+                yield f'DROP INDEX CONCURRENTLY IF EXISTS "{index_name}"'
+            else:
+                yield create_quantized_embedding_index_sql(
+                    table,
+                    model_name,
+                    get_embedding_model_dimensions(model_name),
+                    options['quantization'],
+                    m=options['m'],
+                    ef_construction=options['ef_construction'],
+                )
@@ -0,0 +1,71 @@
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+# The text search configuration is `simple` (no stemming, no stop words), so product codes, names
+# and other exact tokens are matched as they are in any language of the documents.
+SEARCH_CONFIG = 'pg_catalog.simple'
+
+TRIGGERS = [
+    ('assistant_storage_question', ['text']),
+    ('assistant_storage_sentence', ['text']),
+    ('assistant_storage_document', ['name', 'content']),
+]
+
+
+def _create_trigger_sql(table, columns):
+    source = " || ' ' || ".join(f'coalesce({column}, \'\')' for column in columns)
+    return f"""
+        CREATE TRIGGER {table}_search_vector_update
+        BEFORE INSERT OR UPDATE OF {', '.join(columns)} ON {table}
+        FOR EACH ROW EXECUTE FUNCTION tsvector_update_trigger(search_vector, '{SEARCH_CONFIG}', {', '.join(columns)});
+        UPDATE {table} SET search_vector = to_tsvector('{SEARCH_CONFIG}', {source});
+    """
+
+
+def _drop_trigger_sql(table, columns):
+    return f'DROP TRIGGER IF EXISTS {table}_search_vector_update ON {table};'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assistant_storage', '0002_document_content_embedding_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='sentence',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='document_search_vector_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='question_search_vector_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sentence',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='sentence_search_vector_idx'),
+        ),
+    ] + [
+        migrations.RunSQL(
+            sql=_create_trigger_sql(table, columns),
+            reverse_sql=_drop_trigger_sql(table, columns),
+        )
+        for table, columns in TRIGGERS
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 4.2.13 on 2026-10-17 01:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+import pgvector.django
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assistant_storage', '0003_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmbeddingModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('dimensions', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SentenceEmbedding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=255)),
+                ('embedding', pgvector.django.VectorField()),
+                ('sentence', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='embeddings', to='assistant_storage.sentence')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='QuestionEmbedding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=255)),
+                ('embedding', pgvector.django.VectorField()),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='embeddings', to='assistant_storage.question')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DocumentEmbedding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=255)),
+                ('embedding', pgvector.django.VectorField()),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='embeddings', to='assistant_storage.document')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='sentenceembedding',
+            constraint=models.UniqueConstraint(fields=('sentence', 'model'), name='sentence_embedding_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='questionembedding',
+            constraint=models.UniqueConstraint(fields=('question', 'model'), name='question_embedding_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='documentembedding',
+            constraint=models.UniqueConstraint(fields=('document', 'model'), name='document_embedding_unique'),
+        ),
+    ]
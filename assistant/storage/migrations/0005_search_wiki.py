@@ -0,0 +1,34 @@
+# Generated by Django 4.2.13 on 2026-10-17 01:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_wikis(apps, schema_editor):
+    Document = apps.get_model('assistant_storage', 'Document')
+    for model_name in ('Question', 'Sentence'):
+        model = apps.get_model('assistant_storage', model_name)
+        model.objects.update(
+            wiki_id=models.Subquery(Document.objects.filter(id=models.OuterRef('document_id')).values('wiki_id')[:1]),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assistant_storage', '0004_embedding_side_tables'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='wiki',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='assistant_storage.wikidocument'),
+        ),
+        migrations.AddField(
+            model_name='sentence',
+            name='wiki',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='assistant_storage.wikidocument'),
+        ),
+        migrations.RunPython(fill_wikis, migrations.RunPython.noop),
+    ]
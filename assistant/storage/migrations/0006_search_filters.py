@@ -0,0 +1,56 @@
+# Generated by Django 4.2.13 on 2026-10-17 01:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_search_filters(apps, schema_editor):
+    Document = apps.get_model('assistant_storage', 'Document')
+    for model_name in ('Question', 'Sentence'):
+        model = apps.get_model('assistant_storage', model_name)
+        model.objects.update(
+            bot_id=models.Subquery(
+                Document.objects.filter(id=models.OuterRef('document_id')).values('wiki__bot_id')[:1]
+            ),
+        )
+        model.objects.filter(document__wiki__processing__status='completed').update(is_live=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assistant_bot', '0006_botuser_phone_number_instance_is_unavailable'),
+        ('assistant_storage', '0005_search_wiki'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='bot',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='assistant_bot.bot'),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='is_live',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='sentence',
+            name='bot',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='assistant_bot.bot'),
+        ),
+        migrations.AddField(
+            model_name='sentence',
+            name='is_live',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['bot', 'is_live'], name='question_bot_live_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sentence',
+            index=models.Index(fields=['bot', 'is_live'], name='sentence_bot_live_idx'),
+        ),
+        migrations.RunPython(fill_search_filters, migrations.RunPython.noop),
+    ]
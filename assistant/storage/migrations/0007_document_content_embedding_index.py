@@ -0,0 +1,21 @@
+# Generated by Django 4.2.13 on 2026-10-17 01:36
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+import pgvector.django
+
+
+class Migration(migrations.Migration):
+    # The index is built on a live table without blocking the writes
+    atomic = False
+
+    dependencies = [
+        ('assistant_storage', '0006_search_filters'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='document',
+            index=pgvector.django.HnswIndex(ef_construction=64, fields=['content_embedding'], m=16, name='document_content_emb_idx', opclasses=['vector_cosine_ops']),
+        ),
+    ]
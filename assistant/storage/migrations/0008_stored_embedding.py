@@ -0,0 +1,28 @@
+# Generated by Django 4.2.13 on 2026-10-17 01:39
+
+from django.db import migrations, models
+import pgvector.django
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assistant_storage', '0007_document_content_embedding_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredEmbedding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=255)),
+                ('text_hash', models.CharField(max_length=64)),
+                ('embedding', pgvector.django.VectorField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='storedembedding',
+            constraint=models.UniqueConstraint(fields=('model', 'text_hash'), name='stored_embedding_unique'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.13 on 2026-10-17 02:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assistant_storage', '0008_stored_embedding'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='embeddingmodel',
+            name='is_building',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -1,3 +1,5 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from mptt.fields import TreeForeignKey
 from mptt.models import MPTTModel
@@ -11,6 +13,19 @@ class Document(models.Model):
     description = models.TextField(default='', blank=True)
     content = models.TextField(default='', blank=True)
     content_embedding = VectorField(dimensions=768, blank=True, null=True)  # for RuBert
+    search_vector = SearchVectorField(null=True, editable=False)  # maintained by a DB trigger over name and content
+
+    class Meta:
+        indexes = [
+            HnswIndex(
+                name="document_content_emb_idx",
+                fields=["content_embedding"],
+                m=16,
+                ef_construction=64,
+                opclasses=["vector_cosine_ops"],
+            ),
+            GinIndex(fields=['search_vector'], name='document_search_vector_idx'),
+        ]
 
     def __str__(self):
         return self.wiki.path.replace(' / ', '. ') if hasattr(self, 'parent') else self.name
@@ -21,6 +36,12 @@ class BaseEmbeddingModel(models.Model):
     text = models.TextField()
     order = models.PositiveIntegerField()
     embedding = VectorField(dimensions=768, blank=True, null=True)  # for RuBert
+    search_vector = SearchVectorField(null=True, editable=False)  # maintained by a DB trigger over text
+    # Wiki of the document, denormalized for the topic-scoped search (the id is kept by the MPTT moves)
+    wiki = models.ForeignKey('WikiDocument', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    # Bot of the document and whether its processing is completed, denormalized for the search filters
+    bot = models.ForeignKey('assistant_bot.Bot', on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    is_live = models.BooleanField(default=False)
 
     class Meta:
         abstract = True
@@ -39,7 +60,9 @@ class Sentence(BaseEmbeddingModel):
                 m=16,
                 ef_construction=64,
                 opclasses=["vector_cosine_ops"],
-            )
+            ),
+            GinIndex(fields=['search_vector'], name='sentence_search_vector_idx'),
+            models.Index(fields=['bot', 'is_live'], name='sentence_bot_live_idx'),
             # GistIndex(fields=['embedding'], name='sentence_embedding_gist_idx'),
         ]
 
@@ -54,7 +77,86 @@ class Question(BaseEmbeddingModel):
                 m=16,
                 ef_construction=64,
                 opclasses=["vector_cosine_ops"],
-            )
+            ),
+            GinIndex(fields=['search_vector'], name='question_search_vector_idx'),
+            models.Index(fields=['bot', 'is_live'], name='question_bot_live_idx'),
+        ]
+
+
+class EmbeddingModel(models.Model):
+    """
+    Embedding model registered in the side embedding tables, with the dimensions of its vectors.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    dimensions = models.PositiveIntegerField()
+    # Being built by the `embed_model` command, the processed documents are embedded by the model as well
+    is_building = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.name} ({self.dimensions})'
+
+
+class BaseObjectEmbedding(models.Model):
+    """
+    Embedding of an object by one of the embedding models. The vectors of different models have different
+    dimensions, so every model gets its own partial HNSW index (see the `embed_model` command).
+    """
+    object_field: str
+
+    model = models.CharField(max_length=255)
+    embedding = VectorField()
+
+    class Meta:
+        abstract = True
+
+
+class QuestionEmbedding(BaseObjectEmbedding):
+    object_field = 'question'
+
+    question = models.ForeignKey('Question', on_delete=models.CASCADE, related_name='embeddings')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['question', 'model'], name='question_embedding_unique'),
+        ]
+
+
+class SentenceEmbedding(BaseObjectEmbedding):
+    object_field = 'sentence'
+
+    sentence = models.ForeignKey('Sentence', on_delete=models.CASCADE, related_name='embeddings')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['sentence', 'model'], name='sentence_embedding_unique'),
+        ]
+
+
+class DocumentEmbedding(BaseObjectEmbedding):
+    object_field = 'document'
+
+    document = models.ForeignKey('Document', on_delete=models.CASCADE, related_name='embeddings')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['document', 'model'], name='document_embedding_unique'),
+        ]
+
+
+class StoredEmbedding(models.Model):
+    """
+    Embedding of a text by a model, keyed by the SHA-256 of the text, so the unchanged texts
+    of a reprocessed document are not embedded again.
+    """
+    model = models.CharField(max_length=255)
+    text_hash = models.CharField(max_length=64)
+    embedding = VectorField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['model', 'text_hash'], name='stored_embedding_unique'),
         ]
 
 
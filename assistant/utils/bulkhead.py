@@ -0,0 +1,338 @@
+import asyncio
+import contextvars
+import enum
+import functools
+import heapq
+import itertools
+import logging
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple, Callable, Awaitable, TypeVar
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+class Priority(enum.IntEnum):
+    INTERACTIVE = 0
+    BACKGROUND = 1
+
+
+_priority: contextvars.ContextVar[Priority] = contextvars.ContextVar('bulkhead_priority', default=Priority.INTERACTIVE)
+
+
+def get_priority() -> Priority:
+    return _priority.get()
+
+
+def background_priority(func: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+    """
+    Run the coroutine function with the background priority: its AI calls wait for the interactive ones.
+    """
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        token = _priority.set(Priority.BACKGROUND)
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            _priority.reset(token)
+
+    return wrapper
+
+
+@dataclass
+class BulkheadStats:
+    in_flight: int = 0
+    queued: int = 0
+    acquired: int = 0
+    wait_time: Dict[str, float] = field(default_factory=lambda: {p.name.lower(): 0. for p in Priority})
+    max_wait_time: float = 0.
+
+    def to_dict(self) -> Dict:
+        return {
+            'in_flight': self.in_flight,
+            'queued': self.queued,
+            'acquired': self.acquired,
+            'wait_time': dict(self.wait_time),
+            'max_wait_time': self.max_wait_time,
+        }
+
+
+_stats: Dict[str, BulkheadStats] = {}
+_stats_lock = threading.Lock()
+
+
+def get_bulkhead_stats() -> Dict[str, Dict]:
+    """
+    Get the in-flight and queued calls and the queue wait times of the bulkheads of the process.
+    """
+    with _stats_lock:
+        return {name: stats.to_dict() for name, stats in _stats.items()}
+
+
+def _get_stats(name: str) -> BulkheadStats:
+    with _stats_lock:
+        return _stats.setdefault(name, BulkheadStats())
+
+
+class SlotStore(ABC):
+    """
+    Slots of the bulkheads shared by the processes.
+    """
+
+    @abstractmethod
+    def try_acquire(self, key: str, slot_id: str, limit: int, ttl: float) -> bool:
+        pass
+
+    @abstractmethod
+    def release(self, key: str, slot_id: str):
+        pass
+
+
+class RedisSlotStore(SlotStore):
+    """
+    Leases in a sorted set by their expiration time, so the slots of the crashed processes are freed by the TTL.
+    """
+
+    _script = """
+    if redis.replicate_commands then redis.replicate_commands() end
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+    if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[2]) then
+        return 0
+    end
+    redis.call('ZADD', KEYS[1], now + tonumber(ARGV[3]), ARGV[1])
+    redis.call('PEXPIRE', KEYS[1], math.ceil(tonumber(ARGV[3]) * 1000))
+    return 1
+    """
+
+    def __init__(self, url: str):
+        import redis
+        self._client = redis.Redis.from_url(url)
+        self._try_acquire = self._client.register_script(self._script)
+
+    def try_acquire(self, key: str, slot_id: str, limit: int, ttl: float) -> bool:
+        return bool(self._try_acquire(keys=[key], args=[slot_id, limit, ttl]))
+
+    def release(self, key: str, slot_id: str):
+        self._client.zrem(key, slot_id)
+
+
+class LocalSlotStore(SlotStore):
+    """
+    In-process stand-in for the shared slots (for tests).
+    """
+
+    def __init__(self):
+        self._slots: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def try_acquire(self, key: str, slot_id: str, limit: int, ttl: float) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            slots = {s: expires_at for s, expires_at in self._slots.get(key, {}).items() if expires_at > now}
+            if len(slots) >= limit:
+                self._slots[key] = slots
+                return False
+            slots[slot_id] = now + ttl
+            self._slots[key] = slots
+            return True
+
+    def release(self, key: str, slot_id: str):
+        with self._lock:
+            self._slots.get(key, {}).pop(slot_id, None)
+
+
+@lru_cache
+def get_slot_store(url: Optional[str]) -> Optional[SlotStore]:
+    if not url:
+        return None
+    if url.startswith('local://'):
+        return LocalSlotStore()
+    return RedisSlotStore(url)
+
+
+class Bulkhead:
+    """
+    Limits the concurrent calls to an endpoint. The waiting calls are let in by their priority,
+    then in the order of arrival. With a slot store the limit is shared by the processes as well:
+    the background calls may take all the shared slots but `reserved_interactive` ones,
+    and poll for a free slot. The limit is process-wide: it is shared by the event loops of the threads
+    (e.g. the one of every Celery task run by `async_to_sync`), a freed slot is handed over to the waiter's loop.
+    """
+
+    poll_interval = 0.1
+
+    def __init__(
+            self,
+            name: str,
+            limit: int,
+            slot_store: SlotStore = None,
+            reserved_interactive: int = 1,
+            slot_ttl: float = 300,
+    ):
+        self.name = name
+        self.limit = limit
+        self.stats = _get_stats(name)
+        self._slot_store = slot_store
+        self._reserved_interactive = reserved_interactive
+        self._slot_ttl = slot_ttl
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+        # The shared slots are interchangeable, any of them is released
+        self._slot_ids: List[Optional[str]] = []
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.release()
+
+    async def acquire(self):
+        priority = get_priority()
+        start_ts = time.monotonic()
+        with self._lock:
+            self.stats.queued += 1
+        try:
+            await self._acquire_local(priority)
+            try:
+                slot_id = await self._acquire_shared(priority)
+            except BaseException:
+                self._release_local()
+                raise
+        finally:
+            with self._lock:
+                self.stats.queued -= 1
+
+        wait_time = time.monotonic() - start_ts
+        with self._lock:
+            self.stats.in_flight += 1
+            self.stats.acquired += 1
+            self.stats.wait_time[priority.name.lower()] += wait_time
+            self.stats.max_wait_time = max(self.stats.max_wait_time, wait_time)
+        if wait_time > 1:
+            logger.info(f'{priority.name.lower().capitalize()} call to {self.name} waited {wait_time:.2f} s, '
+                        f'stats: {self.stats.to_dict()}')
+        self._slot_ids.append(slot_id)
+
+    async def release(self):
+        with self._lock:
+            self.stats.in_flight -= 1
+        slot_id = self._slot_ids.pop(0) if self._slot_ids else None
+        self._release_local()
+        if slot_id is not None:
+            try:
+                await sync_to_async(self._slot_store.release, thread_sensitive=False)(self._shared_key, slot_id)
+            except Exception as e:
+                logger.warning(f'Failed to release {self.name} shared slot, it expires in {self._slot_ttl} s: {e}')
+
+    @property
+    def _shared_key(self) -> str:
+        return f'bulkhead:{self.name}'
+
+    async def _acquire_local(self, priority: Priority):
+        with self._lock:
+            if self._in_flight < self.limit and not self._waiters:
+                self._in_flight += 1
+                return
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (priority, next(self._counter), future))
+        try:
+            # The slot is handed over by `_release_local`
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release_local()
+            raise
+
+    def _release_local(self):
+        with self._lock:
+            while self._waiters:
+                _, _, future = heapq.heappop(self._waiters)
+                if future.done():
+                    continue
+                try:
+                    future.get_loop().call_soon_threadsafe(self._hand_over, future)
+                except RuntimeError:
+                    # The loop of the waiter is closed
+                    continue
+                return
+            self._in_flight -= 1
+
+    def _hand_over(self, future: asyncio.Future):
+        # In the loop of the waiter, which may be cancelled meanwhile
+        if future.done():
+            self._release_local()
+        else:
+            future.set_result(None)
+
+    async def _acquire_shared(self, priority: Priority) -> Optional[str]:
+        if self._slot_store is None:
+            return None
+        limit = self.limit
+        if priority == Priority.BACKGROUND:
+            limit = max(1, limit - self._reserved_interactive)
+        slot_id = uuid.uuid4().hex
+        try_acquire = sync_to_async(self._slot_store.try_acquire, thread_sensitive=False)
+        while True:
+            try:
+                if await try_acquire(self._shared_key, slot_id, limit, self._slot_ttl):
+                    return slot_id
+            except Exception as e:
+                logger.warning(f'Failed to acquire {self.name} shared slot, limiting in process: {e}')
+                return None
+            await asyncio.sleep(self.poll_interval)
+
+
+class _Unlimited:
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+_unlimited = _Unlimited()
+_bulkheads: Dict[str, Bulkhead] = {}
+_lock = threading.Lock()
+
+
+def get_bulkhead(provider: str, endpoint: str):
+    """
+    Get the process-wide bulkhead of the provider endpoint. `AI_CONCURRENCY_LIMITS` setting
+    maps `<provider>:<endpoint>` or `<provider>` (e.g. `ollama`, `gpu_service`) to the number of concurrent calls,
+    `AI_CONCURRENCY_URL` (a Redis URL) shares the limits between the processes.
+    Returns a no-op context manager for the unlimited endpoints.
+    """
+    limits = getattr(settings, 'AI_CONCURRENCY_LIMITS', {})
+    name = f'{provider}:{endpoint}'
+    limit = limits.get(name, limits.get(provider))
+    if not limit:
+        return _unlimited
+
+    with _lock:
+        bulkhead = _bulkheads.get(name)
+        if bulkhead is None:
+            bulkhead = _bulkheads[name] = Bulkhead(
+                name,
+                limit,
+                slot_store=get_slot_store(getattr(settings, 'AI_CONCURRENCY_URL', None)),
+                reserved_interactive=getattr(settings, 'AI_CONCURRENCY_RESERVED_INTERACTIVE', 1),
+                # A response stream holds its slot for up to the stream timeout
+                slot_ttl=max(getattr(settings, 'AI_STREAM_TIMEOUT', 600), getattr(settings, 'HTTP_TIMEOUT', 300)),
+            )
+    return bulkhead
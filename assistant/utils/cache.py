@@ -0,0 +1,231 @@
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from asgiref.sync import sync_to_async
+
+logger = logging.getLogger(__name__)
+
+
+MISSING = object()
+
+
+@dataclass
+class CacheStats:
+    local_hits: int = 0
+    shared_hits: int = 0
+    misses: int = 0
+
+    @property
+    def hits(self) -> int:
+        return self.local_hits + self.shared_hits
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            'local_hits': self.local_hits,
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'hit_rate': self.hit_rate,
+        }
+
+
+class LRUCache:
+    """
+    Thread-safe in-process LRU cache with an optional time to live of the entries.
+    """
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        """
+        :param maxsize: Maximum number of entries.
+        :param ttl: Time to live of the entries in seconds (`None` means forever).
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key: Hashable, default=MISSING) -> Any:
+        with self._lock:
+            item = self._data.get(key, MISSING)
+            if item is MISSING:
+                return default
+            value, expires_at = item
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        if self.maxsize <= 0:
+            return
+        ttl = ttl if ttl is not None else self.ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class SharedStore(ABC):
+    """
+    Key-value store shared between processes (a Redis-compatible server).
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        pass
+
+    @abstractmethod
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        pass
+
+    @abstractmethod
+    def delete(self, key: str):
+        pass
+
+
+class RedisStore(SharedStore):
+
+    def __init__(self, url: str):
+        import redis
+        self._client = redis.Redis.from_url(url)
+
+    @property
+    def client(self):
+        return self._client
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._client.get(key)
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        self._client.set(key, value, px=int(ttl * 1000) if ttl else None)
+
+    def delete(self, key: str):
+        self._client.delete(key)
+
+
+class LocalStore(SharedStore):
+    """
+    In-process stand-in for the shared store (for tests and single-process setups).
+    """
+
+    def __init__(self):
+        self._cache = LRUCache(maxsize=2 ** 31)
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._cache.get(key, None)
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        self._cache.set(key, value, ttl=ttl)
+
+    def delete(self, key: str):
+        self._cache.delete(key)
+
+
+@lru_cache
+def get_shared_store(url: Optional[str]) -> Optional[SharedStore]:
+    """
+    Get the shared store by its URL: `redis://...` (or `rediss://`, `unix://`) or `local://` for the in-process stand-in.
+    """
+    if not url:
+        return None
+    if url.startswith('local://'):
+        return LocalStore()
+    return RedisStore(url)
+
+
+class TieredCache:
+    """
+    Two-level cache: an in-process `LRUCache` in front of an optional `SharedStore`.
+    Values found in the shared store are promoted to the local level.
+    """
+
+    def __init__(
+            self,
+            namespace: str,
+            maxsize: int,
+            ttl: Optional[float] = None,
+            shared_store: SharedStore = None,
+            dumps: Callable[[Any], bytes] = None,
+            loads: Callable[[bytes], Any] = None,
+    ):
+        """
+        :param namespace: Prefix of the keys in the shared store.
+        :param maxsize: Maximum number of entries of the local level (`0` disables the local level).
+        :param ttl: Time to live of the entries in seconds on both levels.
+        :param shared_store: Optional shared store.
+        :param dumps: Serializer of the values for the shared store.
+        :param loads: Deserializer of the values from the shared store.
+        """
+        self.namespace = namespace
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._local = LRUCache(maxsize=maxsize, ttl=ttl)
+        self._shared = shared_store
+        self._dumps = dumps
+        self._loads = loads
+
+    async def get(self, key: str, default=None) -> Any:
+        value = self._local.get(key)
+        if value is not MISSING:
+            self.stats.local_hits += 1
+            return value
+        if self._shared is not None:
+            try:
+                data = await sync_to_async(self._shared.get, thread_sensitive=False)(self._shared_key(key))
+            except Exception as e:
+                logger.warning(f'Failed to read {self.namespace} cache from the shared store: {e}')
+                data = None
+            if data is not None:
+                value = self._loads(data) if self._loads else data
+                self._local.set(key, value)
+                self.stats.shared_hits += 1
+                return value
+        self.stats.misses += 1
+        return default
+
+    async def set(self, key: str, value: Any):
+        self._local.set(key, value)
+        if self._shared is not None:
+            data = self._dumps(value) if self._dumps else value
+            try:
+                await sync_to_async(self._shared.set, thread_sensitive=False)(self._shared_key(key), data, self.ttl)
+            except Exception as e:
+                logger.warning(f'Failed to write {self.namespace} cache to the shared store: {e}')
+
+    async def delete(self, key: str):
+        self._local.delete(key)
+        if self._shared is not None:
+            try:
+                await sync_to_async(self._shared.delete, thread_sensitive=False)(self._shared_key(key))
+            except Exception as e:
+                logger.warning(f'Failed to delete {self.namespace} cache from the shared store: {e}')
+
+    def clear_local(self):
+        self._local.clear()
+
+    def _shared_key(self, key: str) -> str:
+        return f'{self.namespace}:{key}'
@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Dict, Optional, Tuple, AsyncIterator
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitBackend(ABC):
+    """
+    Storage of the token buckets. A bucket holds up to `capacity` tokens and gains `rate` tokens per second.
+    """
+
+    @abstractmethod
+    def reserve(self, key: str, capacity: float, rate: float, amount: float) -> float:
+        """
+        Take the amount of tokens from the bucket, going into debt if there are not enough of them
+        (a negative amount gives the tokens back).
+        Returns the time in seconds until the debt is paid off, the caller must wait for it before the call.
+        """
+        pass
+
+
+class LocalRateLimitBackend(RateLimitBackend):
+    """
+    In-process buckets (for tests and single-process setups).
+    """
+
+    def __init__(self):
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, key: str, capacity: float, rate: float, amount: float) -> float:
+        with self._lock:
+            now = time.monotonic()
+            tokens, ts = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - ts) * rate) - amount
+            self._buckets[key] = (tokens, now)
+        return max(0., -tokens / rate)
+
+
+class RedisRateLimitBackend(RateLimitBackend):
+    """
+    Buckets shared by the processes in a Redis-compatible server, updated atomically by a script
+    with the server clock.
+    """
+
+    _script = """
+    if redis.replicate_commands then redis.replicate_commands() end
+    local capacity = tonumber(ARGV[1])
+    local rate = tonumber(ARGV[2])
+    local amount = tonumber(ARGV[3])
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + (now - ts) * rate) - amount
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+    redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate * 1000) + 1000)
+    if tokens >= 0 then
+        return '0'
+    end
+    return tostring(-tokens / rate)
+    """
+
+    def __init__(self, url: str):
+        import redis
+        self._client = redis.Redis.from_url(url)
+        self._reserve = self._client.register_script(self._script)
+
+    def reserve(self, key: str, capacity: float, rate: float, amount: float) -> float:
+        return float(self._reserve(keys=[key], args=[capacity, rate, amount]))
+
+
+class RateLimiter:
+    """
+    Requests per minute and tokens per minute limits of an API, shared by the processes using the same backend.
+
+    Every call reserves a request and the estimated tokens at once, so the callers are served in the order
+    of their arrival and wait exactly until the reservation is covered. The tokens reservation is corrected
+    by the actual usage once it is known. If the backend fails, the limits are kept in process.
+    """
+
+    def __init__(
+            self,
+            name: str,
+            rpm: Optional[float] = None,
+            tpm: Optional[float] = None,
+            backend: RateLimitBackend = None,
+    ):
+        self.name = name
+        self.rpm = rpm
+        self.tpm = tpm
+        self._backend = backend or LocalRateLimitBackend()
+        self._fallback_backend = LocalRateLimitBackend()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.rpm or self.tpm)
+
+    async def _reserve(self, bucket: str, limit: float, amount: float) -> float:
+        # Not more than the capacity, otherwise the call would never fit
+        amount = min(amount, limit)
+        key = f'rate_limit:{self.name}:{bucket}'
+        try:
+            return await sync_to_async(self._backend.reserve, thread_sensitive=False)(key, limit, limit / 60, amount)
+        except Exception as e:
+            logger.warning(f'Failed to reserve {self.name} rate limit in the backend, limiting in process: {e}')
+            return self._fallback_backend.reserve(key, limit, limit / 60, amount)
+
+    async def acquire(self, tokens: int = 0):
+        """
+        Wait until a request with the given number of tokens is allowed.
+        """
+        delay = 0.
+        if self.rpm:
+            delay = max(delay, await self._reserve('rpm', self.rpm, 1))
+        if self.tpm and tokens:
+            delay = max(delay, await self._reserve('tpm', self.tpm, tokens))
+        if delay > 0:
+            logger.debug(f'Rate limit of {self.name}: waiting {delay:.2f} s')
+            await asyncio.sleep(delay)
+
+    async def adjust(self, reserved_tokens: int, used_tokens: int):
+        """
+        Correct the tokens reservation by the actual usage.
+        """
+        if self.tpm and used_tokens != reserved_tokens:
+            await self._reserve('tpm', self.tpm, used_tokens - reserved_tokens)
+
+    @asynccontextmanager
+    async def limit(self, tokens: int = 0) -> AsyncIterator['RateLimitUsage']:
+        """
+        Wait for the rate limits and account the tokens set to the yielded usage by the call.
+        """
+        usage = RateLimitUsage(tokens)
+        if not self.enabled:
+            yield usage
+            return
+        await self.acquire(tokens)
+        try:
+            yield usage
+        finally:
+            await self.adjust(tokens, usage.tokens)
+
+
+class RateLimitUsage:
+
+    def __init__(self, tokens: int):
+        self.tokens = tokens
+
+
+@lru_cache
+def get_rate_limit_backend(url: Optional[str]) -> RateLimitBackend:
+    if not url or url.startswith('local://'):
+        return LocalRateLimitBackend()
+    return RedisRateLimitBackend(url)
+
+
+@lru_cache
+def get_rate_limiter(model: str) -> RateLimiter:
+    """
+    Get the rate limiter of the model. `AI_RATE_LIMITS` setting maps the model name prefixes
+    (e.g. `groq:` or `groq:llama-3.1-70b`) to `{'rpm': ..., 'tpm': ...}` of every model, the longest matching
+    prefix wins.
+    The buckets are shared via `AI_RATE_LIMIT_URL` (a Redis URL), in process by default.
+    """
+    limits = getattr(settings, 'AI_RATE_LIMITS', {'groq:': {'rpm': 30}})
+    prefixes = [prefix for prefix in limits if model.startswith(prefix)]
+    if not prefixes:
+        return RateLimiter(model)
+    prefix = max(prefixes, key=len)
+    return RateLimiter(
+        name=model,
+        rpm=limits[prefix].get('rpm'),
+        tpm=limits[prefix].get('tpm'),
+        backend=get_rate_limit_backend(getattr(settings, 'AI_RATE_LIMIT_URL', None)),
+    )
@@ -19,11 +19,17 @@ async def repeat_until(
     :param args: The positional arguments to pass to the function.
     :param kwargs: The keyword arguments to pass to the function.
     """
+    # The AI providers are told about the validation result (e.g. to cache the accepted responses)
+    provider = getattr(func, '__self__', None)
     attempt = 0
     while attempt < max_attempts:
         response = await func(*args, **kwargs)
         if condition(response):
+            if hasattr(provider, 'accept_response'):
+                await provider.accept_response(response)
             return response
+        if hasattr(provider, 'reject_response'):
+            await provider.reject_response(response)
         attempt += 1
         logger.warning(f"Attempt {attempt} failed for response: {response}, retrying...")
     raise MaxAttemptsExceededError(f"Condition not met after {max_attempts} attempts")
@@ -13,4 +13,6 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'example.settings')
 
-application = get_asgi_application()
+from assistant.ai.utils.http import HTTPSessionsLifespan  # noqa: E402 - needs the settings module
+
+application = HTTPSessionsLifespan(get_asgi_application())
@@ -1,3 +1,4 @@
+import json
 import logging
 import os
 from dataclasses import asdict
@@ -5,6 +6,7 @@ from dataclasses import asdict
 import sys
 
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List
 
@@ -106,3 +108,22 @@ async def get_response(request: DialogRequest):
         logger.exception(f"Failed to get response: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+
+@app.post("/dialog/stream/")
+async def get_response_stream(request: DialogRequest):
+    model = request.model.lower()
+    if model not in providers:
+        raise HTTPException(status_code=400, detail="Model is not supported")
+    provider = providers[model]
+
+    async def deltas():
+        async for delta in provider.get_response_stream(
+            messages=[
+                {"role": msg.role, "content": msg.content}
+                for msg in request.messages
+            ],
+            max_tokens=request.max_tokens,
+        ):
+            yield json.dumps(asdict(delta), ensure_ascii=False) + "\n"
+
+    return StreamingResponse(deltas(), media_type="application/x-ndjson")
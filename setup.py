@@ -6,6 +6,7 @@ setup(
     packages=find_packages(include=['assistant.*']),
     package_data={
         'assistant.bot': ['schemas/*.json'],
+        'assistant.ai': ['encodings/tiktoken/*'],
     },
     install_requires=[
         'Django == 4.2.13',
@@ -41,6 +42,12 @@ setup(
         'pillow == 11.0.0',
         'requests == 2.32.3',
     ],
+    extras_require={
+        'tokenizers': [
+            'tiktoken == 0.7.0',
+            'tokenizers == 0.19.1',
+        ],
+    },
     include_package_data=True,
     description='',
     author='Aleksandr Fedotov',
@@ -0,0 +1,286 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from asgiref.sync import async_to_sync
+
+from assistant.rag.backends.base import document_scores
+from assistant.rag.backends.in_memory import EmbeddingIndex, InMemorySearchBackend
+from assistant.rag.backends.postgres import QuantizedPgVectorSearchBackend, TwoStagePgVectorSearchBackend
+from assistant.storage.models import Question, WikiDocument
+
+
+@pytest.fixture
+def index():
+    rng = np.random.default_rng(0)
+    embeddings = rng.normal(size=(100, 16)).astype(np.float32)
+    return EmbeddingIndex(list(range(1000, 1100)), embeddings), embeddings
+
+
+def test_top_k_matches_exact_search(index):
+    index, embeddings = index
+    query = embeddings[42] + 0.01
+
+    result = index.top_k(query, 5)
+
+    normalized = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    distances = 1 - normalized @ (query / np.linalg.norm(query))
+    expected = np.argsort(distances)[:5]
+
+    assert [position for position, _ in result] == list(expected)
+    assert result[0][0] == 42
+    assert result[0][1] == pytest.approx(distances[42], abs=1e-5)
+    assert index.ids[result[0][0]] == 1042
+
+
+def test_top_k_larger_than_index(index):
+    index, _ = index
+    result = index.top_k(np.ones(16), 500)
+    assert len(result) == 100
+    distances = [distance for _, distance in result]
+    assert distances == sorted(distances)
+
+
+def test_empty_index():
+    index = EmbeddingIndex([], np.empty((0, 0), dtype=np.float32))
+    assert index.top_k([1.0, 0.0], 3) == []
+
+
+def test_top_k_many_matches_single_queries(index):
+    index, embeddings = index
+    queries = embeddings[[3, 7, 11]]
+
+    results = index.top_k_many(queries, 4)
+
+    assert len(results) == 3
+    for query, result in zip(queries, results):
+        expected = index.top_k(query, 4)
+        assert [p for p, _ in result] == [p for p, _ in expected]
+        assert [d for _, d in result] == pytest.approx([d for _, d in expected], abs=1e-5)
+    assert [result[0][0] for result in results] == [3, 7, 11]
+
+
+def test_document_scores_average_closest_objects():
+    objects = [
+        SimpleNamespace(document_id=1, distance=0.1),
+        SimpleNamespace(document_id=2, distance=0.2),
+        SimpleNamespace(document_id=1, distance=0.3),
+        SimpleNamespace(document_id=1, distance=0.5),
+    ]
+
+    scores = document_scores(objects, max_scores_n=2)
+
+    assert scores == {1: pytest.approx(0.8)}
+
+
+def test_quantized_backend_reranks_coarse_candidates():
+    backend = QuantizedPgVectorSearchBackend(quantization='binary', rerank_factor=4)
+    sql, params = backend._nearest_sql('SELECT 1', (), Question._meta.get_field('embedding'), 10)
+
+    assert 'ORDER BY binary_quantize(base."embedding")::bit(768) <~> binary_quantize(queries.embedding)::bit(768)' in sql
+    assert sql.endswith('ORDER BY candidates.distance LIMIT %s')
+    assert params == [40, 10]
+
+
+def test_quantized_backend_side_tables_search_matches_index_expression(settings, monkeypatch):
+    from assistant.rag.backends import postgres
+    from assistant.storage.models import QuestionEmbedding
+
+    settings.EMBEDDING_SIDE_TABLES = True
+    monkeypatch.setattr(postgres, 'get_active_embedding_model', lambda: 'nomic-embed-text')
+    monkeypatch.setattr(postgres, 'get_embedding_model_dimensions', lambda model_name: 768)
+    backend = QuantizedPgVectorSearchBackend(quantization='halfvec')
+    sql, params = backend._nearest_sql('SELECT 1', (), Question._meta.get_field('embedding'), 10)
+    index_sql = postgres.create_quantized_embedding_index_sql(QuestionEmbedding, 'nomic-embed-text', 768, 'halfvec')
+
+    assert 'ORDER BY (embeddings.embedding::vector(768))::halfvec(768) <=> ' in sql
+    assert 'USING hnsw (((embedding::vector(768))::halfvec(768)) halfvec_cosine_ops)' in index_sql
+    assert index_sql.endswith("WHERE model = 'nomic-embed-text'")
+    assert params == ['nomic-embed-text', 40, 10]
+
+
+def test_two_stage_backend_ranks_objects_of_candidate_documents(monkeypatch):
+    backend = TwoStagePgVectorSearchBackend(documents_n=200)
+    monkeypatch.setattr(backend, '_candidate_documents', lambda *args: [[5, 6], [7]])
+    sql, params = backend._nearest_sql('SELECT 1', ('base',), Question._meta.get_field('embedding'), 10, [[1.], [2.]])
+
+    assert 'JOIN (SELECT 1) base ON base.document_id = candidates.candidate_id' in sql
+    assert 'WHERE candidates.query_index = queries.query_index' in sql
+    assert sql.endswith('ORDER BY distance LIMIT %s')
+    assert params == [[1, 1, 2], [5, 6, 7], 'base', 10]
+    assert backend._ef_search(40) == 200
+
+
+def test_two_stage_backend_searches_documents_exactly_for_short_candidates(monkeypatch):
+    backend = TwoStagePgVectorSearchBackend(documents_n=2)
+    calls = []
+
+    def query_candidates(sql, params, query_embeddings, using=None):
+        exact = '+ 0' in sql
+        calls.append((exact, query_embeddings))
+        if exact:
+            return [[8, 9] for _ in query_embeddings]
+        # The nearest documents of the second query belong to other bots
+        return [[1, 2], [3]]
+
+    monkeypatch.setattr(backend, '_query_candidates', query_candidates)
+    candidates = backend._candidate_documents('SELECT 1', (), Question._meta.get_field('embedding'), [[1.], [2.]])
+
+    assert candidates == [[1, 2], [8, 9]]
+    assert calls == [(False, [[1.], [2.]]), (True, [[2.]])]
+
+
+def fake_in_memory_backend(monkeypatch, version, **kwargs):
+    from assistant.rag.backends.in_memory import IndexEntry
+
+    backend = InMemorySearchBackend(**kwargs)
+    builds = []
+    version_reads = []
+    field_names = ['id', 'bot_id', 'is_live', 'wiki_id']
+    rows = [(1, 1, True, 10), (2, 1, True, 11), (3, 1, False, 10), (4, 1, True, 12)]
+    embeddings = np.array([[1., 0.], [0.9, 0.1], [1., 0.], [0., 1.]])
+
+    def build_entry(key, qs, field, bot_id):
+        builds.append(key)
+        entry = IndexEntry(EmbeddingIndex([row[0] for row in rows], embeddings), field_names, rows, version[0])
+        backend._indexes[key] = entry
+        return entry
+
+    def corpus_version(bot_id):
+        version_reads.append(bot_id)
+        return version[0]
+
+    monkeypatch.setattr(backend, '_build_entry', build_entry)
+    monkeypatch.setattr(backend, '_corpus_version', corpus_version)
+    return backend, builds, version_reads
+
+
+def test_in_memory_index_is_rebuilt_for_new_corpus_version(monkeypatch):
+    version = [1]
+    backend, builds, version_reads = fake_in_memory_backend(monkeypatch, version, version_check_interval=0)
+    qs = Question.objects.filter(bot_id=1, is_live=True)
+
+    async_to_sync(backend.search)([1., 0.], qs)
+    async_to_sync(backend.search)([1., 0.], qs)
+    version[0] += 1
+    async_to_sync(backend.search)([1., 0.], qs)
+
+    assert builds == [('assistant_storage.Question', 'embedding', 1)] * 2
+    assert version_reads == [1, 1]
+
+
+def test_in_memory_backend_checks_corpus_version_by_interval(monkeypatch):
+    backend, builds, version_reads = fake_in_memory_backend(monkeypatch, [1], version_check_interval=60)
+    qs = Question.objects.filter(bot_id=1, is_live=True)
+
+    for _ in range(3):
+        async_to_sync(backend.search)([1., 0.], qs)
+
+    assert len(builds) == 1
+    assert version_reads == []
+
+
+def test_in_memory_backend_applies_filters_as_mask(monkeypatch):
+    backend, builds, _ = fake_in_memory_backend(monkeypatch, [1])
+
+    live = async_to_sync(backend.search)([1., 0.], Question.objects.filter(bot_id=1, is_live=True), n=10)
+    scoped = async_to_sync(backend.search)(
+        [1., 0.], Question.objects.filter(bot_id=1, is_live=True, wiki_id__in=[10, 12]), n=10
+    )
+
+    assert [q.id for q in live] == [1, 2, 4]
+    assert [q.id for q in scoped] == [1, 4]
+    # One index of the bot serves all its querysets
+    assert len(builds) == 1
+
+
+def test_in_memory_backend_filters_by_subquery(monkeypatch):
+    backend, _, _ = fake_in_memory_backend(monkeypatch, [1])
+    queries = []
+
+    def queryset_mask(qs, entry, filters):
+        queries.append(filters)
+        return entry.mask(tuple(
+            (attname, lookup, frozenset([11]) if attname == 'wiki_id' else value)
+            for attname, lookup, value in filters
+        ))
+
+    monkeypatch.setattr(backend, '_queryset_mask', queryset_mask)
+    qs = Question.objects.filter(bot_id=1, is_live=True, wiki_id__in=WikiDocument.objects.values('id'))
+
+    assert [q.id for q in async_to_sync(backend.search)([1., 0.], qs)] == [2]
+    assert len(queries) == 1
+
+
+def test_top_k_with_mask(index):
+    index, embeddings = index
+    mask = np.zeros(len(index), dtype=bool)
+    mask[[5, 42, 77]] = True
+
+    result = index.top_k(embeddings[42], 10, mask)
+
+    assert sorted(position for position, _ in result) == [5, 42, 77]
+    assert result[0][0] == 42
+
+
+def test_in_memory_backend_searches_side_tables_in_postgres(settings, monkeypatch):
+    settings.EMBEDDING_SIDE_TABLES = True
+    backend = InMemorySearchBackend()
+    calls = []
+
+    async def search_many(query_embeddings, qs, n=10, field='embedding', ef_search=None):
+        calls.append(n)
+        return [['found'] for _ in query_embeddings]
+
+    monkeypatch.setattr(backend._side_tables_backend, 'search_many', search_many)
+
+    assert async_to_sync(backend.search)([1., 0.], Question.objects.all(), n=3) == ['found']
+    assert calls == [3]
+
+
+class FakeCursor:
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, sql, params=None):
+        self.connection.executed.append((sql, params))
+
+    def fetchone(self):
+        return ('40',)
+
+
+class FakeConnection:
+
+    def __init__(self, in_atomic_block):
+        self.in_atomic_block = in_atomic_block
+        self.executed = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+@pytest.mark.parametrize('in_atomic_block', [False, True])
+def test_hnsw_ef_search_restores_setting_in_outer_transaction(monkeypatch, in_atomic_block):
+    from contextlib import nullcontext
+    from assistant.rag.backends import postgres
+
+    connection = FakeConnection(in_atomic_block)
+    monkeypatch.setattr(postgres, 'connections', {'default': connection})
+    monkeypatch.setattr(postgres.transaction, 'atomic', lambda using: nullcontext())
+
+    with postgres.hnsw_ef_search(100, using='default'):
+        connection.executed.append(('search', None))
+
+    set_configs = [params for sql, params in connection.executed if 'set_config' in sql]
+    if in_atomic_block:
+        assert set_configs == [['hnsw.ef_search', '100'], ['hnsw.ef_search', '40']]
+        assert connection.executed[-2] == ('search', None)
+    else:
+        assert set_configs == [['hnsw.ef_search', '100']]
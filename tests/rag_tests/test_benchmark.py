@@ -0,0 +1,37 @@
+import numpy as np
+
+from assistant.rag.benchmark.generator import EmbeddingGenerator
+from assistant.rag.benchmark.report import BenchmarkResult, format_report
+from assistant.rag.benchmark.runner import recall
+
+
+def test_generated_embeddings_are_unit_vectors():
+    embeddings = EmbeddingGenerator(dimensions=32, seed=1).sample(50)
+
+    assert embeddings.shape == (50, 32)
+    assert embeddings.dtype == np.float32
+    assert np.allclose(np.linalg.norm(embeddings, axis=1), 1, atol=1e-5)
+
+
+def test_clustered_embeddings_are_close_to_centers():
+    generator = EmbeddingGenerator(dimensions=64, clusters=4, spread=0.1, seed=1)
+
+    embeddings = generator.sample(100)
+
+    similarities = embeddings @ generator.centers.T
+    assert np.all(similarities.max(axis=1) > 0.9)
+
+
+def test_result_stats():
+    result = BenchmarkResult(name='case', k=2, concurrency=1, recalls=[1.0, 0.5],
+                             latencies=[0.01, 0.03], wall_time=0.04)
+
+    assert result.queries == 2
+    assert result.recall == 0.75
+    assert result.qps == 50
+    assert abs(result.latency_ms(50) - 20) < 1e-6
+    assert 'case' in format_report([result])
+
+
+def test_recall():
+    assert recall({1, 2, 3, 4}, [1, 2, 5]) == 0.5
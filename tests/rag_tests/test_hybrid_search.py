@@ -0,0 +1,32 @@
+import pytest
+
+from assistant.rag.services.search_service import reciprocal_rank_fusion, hybrid_search_enabled
+
+
+def test_reciprocal_rank_fusion_prefers_items_found_by_both():
+    vector_ranking = ['a', 'b', 'c']
+    lexical_ranking = ['c', 'd']
+
+    result = reciprocal_rank_fusion([vector_ranking, lexical_ranking], k=60, key=lambda x: x)
+
+    assert [item for item, _ in result] == ['c', 'a', 'b', 'd']
+    assert result[0][1] == pytest.approx(1 / 63 + 1 / 61)
+    assert result[-1][1] == pytest.approx(1 / 62)
+
+
+def test_reciprocal_rank_fusion_keeps_first_seen_instance():
+    class Obj:
+        def __init__(self, pk, source):
+            self.pk = pk
+            self.source = source
+
+    result = reciprocal_rank_fusion([[Obj(1, 'vector')], [Obj(2, 'lexical'), Obj(1, 'lexical')]])
+
+    assert [(obj.pk, obj.source) for obj, _ in result] == [(1, 'vector'), (2, 'lexical')]
+
+
+def test_hybrid_search_is_opt_in(settings):
+    assert not hybrid_search_enabled()
+
+    settings.HYBRID_SEARCH_ENABLED = True
+    assert hybrid_search_enabled()
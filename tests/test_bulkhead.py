@@ -0,0 +1,96 @@
+import asyncio
+import threading
+
+from asgiref.sync import async_to_sync
+
+from assistant.utils.bulkhead import Bulkhead, LocalSlotStore, background_priority, get_bulkhead, get_bulkhead_stats
+
+
+def test_bulkhead_limits_concurrency_and_lets_interactive_calls_first():
+    bulkhead = Bulkhead('test:priority', limit=1)
+    order = []
+
+    async def call(name):
+        async with bulkhead:
+            order.append(name)
+            await asyncio.sleep(0.01)
+
+    async def run():
+        first = asyncio.create_task(call('first'))
+        await asyncio.sleep(0)
+        await asyncio.gather(
+            background_priority(call)('background'),
+            call('interactive'),
+            first,
+        )
+
+    async_to_sync(run)()
+
+    assert order == ['first', 'interactive', 'background']
+    stats = get_bulkhead_stats()['test:priority']
+    assert stats['acquired'] == 3
+    assert stats['in_flight'] == stats['queued'] == 0
+    assert stats['wait_time']['background'] > stats['wait_time']['interactive'] > 0
+
+
+def test_bulkhead_shares_slots_between_processes():
+    store = LocalSlotStore()
+    bulkheads = [Bulkhead('test:shared', limit=2, slot_store=store, reserved_interactive=1) for _ in range(2)]
+    in_flight = []
+    max_in_flight = []
+
+    async def call(bulkhead):
+        async with bulkhead:
+            in_flight.append(1)
+            max_in_flight.append(len(in_flight))
+            await asyncio.sleep(0.01)
+            in_flight.pop()
+
+    async def run():
+        for bulkhead in bulkheads:
+            bulkhead.poll_interval = 0.001
+        await asyncio.gather(*[background_priority(call)(bulkheads[i % 2]) for i in range(4)])
+
+    async_to_sync(run)()
+
+    # The background calls leave one shared slot to the interactive ones
+    assert max(max_in_flight) == 1
+
+
+def test_unlimited_endpoint_has_no_bulkhead(settings):
+    settings.AI_CONCURRENCY_LIMITS = {'ollama': 2}
+
+    async def run():
+        return get_bulkhead('ollama', 'http://ollama'), get_bulkhead('gpu_service', 'http://gpu')
+
+    ollama, gpu_service = async_to_sync(run)()
+
+    assert isinstance(ollama, Bulkhead) and ollama.limit == 2
+    assert not isinstance(gpu_service, Bulkhead)
+
+
+def test_bulkhead_limit_is_shared_by_event_loops():
+    # Every Celery task runs in its own event loop
+    bulkhead = Bulkhead('test:loops', limit=1)
+    in_flight = []
+    max_in_flight = []
+
+    async def call():
+        async with bulkhead:
+            in_flight.append(1)
+            max_in_flight.append(len(in_flight))
+            await asyncio.sleep(0.01)
+            in_flight.pop()
+
+    async def task():
+        await asyncio.gather(call(), call())
+
+    threads = [threading.Thread(target=asyncio.run, args=(task(),)) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert len(max_in_flight) == 6
+    assert max(max_in_flight) == 1
+    assert get_bulkhead_stats()['test:loops']['in_flight'] == 0
@@ -0,0 +1,159 @@
+from types import SimpleNamespace
+from typing import List
+
+import pytest
+from asgiref.sync import async_to_sync
+
+from assistant.ai.domain import AIResponse
+from assistant.ai.embedders.cache import CachedEmbedder, _dumps_embedding, _loads_embedding
+from assistant.ai.providers.base import AIEmbedder, AIProvider
+from assistant.ai.providers.cached import CachedAIProvider, _dumps_response, _loads_response
+from assistant.rag.services.retrieval_cache import retrieval_cache_key
+from assistant.utils.cache import LRUCache, TieredCache, LocalStore, MISSING
+from assistant.utils.repeat_until import repeat_until
+
+
+class FakeEmbedder(AIEmbedder):
+
+    def __init__(self):
+        self.calls = []
+
+    async def embeddings(self, input: List[str]) -> List[List[float]]:
+        self.calls.append(list(input))
+        return [[float(len(text)), 1.0] for text in input]
+
+
+class FakeAIProvider(AIProvider):
+
+    context_size = 1024
+
+    def __init__(self, results):
+        self.results = list(results)
+        self.calls = 0
+
+    def calculate_tokens(self, text: str) -> int:
+        return len(text)
+
+    async def get_response(self, messages, max_tokens=1024, json_format=False) -> AIResponse:
+        self.calls += 1
+        return AIResponse(result={'topic': self.results.pop(0)}, usage={'model': 'fake'})
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+
+    assert cache.get('a') == 1
+    assert cache.get('b') is MISSING
+    assert cache.get('c') == 3
+
+
+def test_lru_cache_expires_entries(mocker):
+    monotonic = mocker.patch('assistant.utils.cache.time.monotonic', return_value=100)
+    cache = LRUCache(maxsize=10, ttl=5)
+    cache.set('a', 1)
+
+    monotonic.return_value = 104
+    assert cache.get('a') == 1
+    monotonic.return_value = 106
+    assert cache.get('a', None) is None
+
+
+def test_tiered_cache_promotes_shared_values():
+    store = LocalStore()
+    first = TieredCache('test', maxsize=10, shared_store=store, dumps=str.encode, loads=bytes.decode)
+    second = TieredCache('test', maxsize=10, shared_store=store, dumps=str.encode, loads=bytes.decode)
+
+    async_to_sync(first.set)('key', 'value')
+
+    assert async_to_sync(second.get)('key') == 'value'
+    assert async_to_sync(second.get)('key') == 'value'
+    assert async_to_sync(second.get)('other') is None
+    assert second.stats.to_dict() == {'local_hits': 1, 'shared_hits': 1, 'misses': 1, 'hit_rate': pytest.approx(2 / 3)}
+
+
+def test_cached_embedder_calls_embedder_for_misses_only():
+    fake_embedder = FakeEmbedder()
+    cache = TieredCache(
+        'embedding', maxsize=10, shared_store=LocalStore(), dumps=_dumps_embedding, loads=_loads_embedding
+    )
+    embedder = CachedEmbedder('model', cache=cache, embedder_factory=lambda model: fake_embedder)
+
+    first = async_to_sync(embedder.embeddings)(['Hello', 'How do I pay?'])
+    second = async_to_sync(embedder.embeddings)(['  hello ', 'new', 'new'])
+
+    assert first == [[5.0, 1.0], [13.0, 1.0]]
+    assert second == [[5.0, 1.0], [3.0, 1.0], [3.0, 1.0]]
+    assert fake_embedder.calls == [['Hello', 'How do I pay?'], ['new']]
+    assert cache.stats.local_hits == 1
+
+
+def test_retrieval_cache_key_depends_on_corpus_version(settings):
+    bot = SimpleNamespace(id=1, corpus_version=3)
+    settings.EMBEDDING_AI_MODEL = 'nomic-embed-text'
+
+    key = retrieval_cache_key(bot, 'all', 'How  to PAY?')
+
+    assert key == retrieval_cache_key(bot, 'all', 'how to pay?')
+    bot.corpus_version = 4
+    assert key != retrieval_cache_key(bot, 'all', 'how to pay?')
+
+
+def test_retrieval_cache_key_depends_on_search_settings(settings):
+    bot = SimpleNamespace(id=1, corpus_version=3)
+    settings.EMBEDDING_AI_MODEL = 'nomic-embed-text'
+    settings.HYBRID_SEARCH_ENABLED = False
+    keys = {retrieval_cache_key(bot, 'all', 'how to pay?')}
+
+    settings.HYBRID_SEARCH_ENABLED = True
+    keys.add(retrieval_cache_key(bot, 'all', 'how to pay?'))
+    settings.HNSW_EF_SEARCH = 200
+    keys.add(retrieval_cache_key(bot, 'all', 'how to pay?'))
+    settings.VECTOR_SEARCH_QUANTIZATION = 'binary'
+    keys.add(retrieval_cache_key(bot, 'all', 'how to pay?'))
+    settings.EMBEDDING_AI_MODEL = 'text-embedding-3-small'
+    keys.add(retrieval_cache_key(bot, 'all', 'how to pay?'))
+
+    assert len(keys) == 5
+
+
+def _response_cache() -> TieredCache:
+    return TieredCache(
+        'ai_response', maxsize=10, shared_store=LocalStore(), dumps=_dumps_response, loads=_loads_response
+    )
+
+
+def test_cached_ai_provider_stores_accepted_responses_only():
+    fake_ai = FakeAIProvider([None, 'Payments', 'Other'])
+    ai = CachedAIProvider(fake_ai, 'fake', cache=_response_cache())
+    messages = [{'role': 'user', 'content': 'How do I pay?'}]
+
+    async def classify():
+        return await repeat_until(
+            ai.get_response, messages, json_format=True, condition=lambda response: response.result['topic']
+        )
+
+    first = async_to_sync(classify)()
+    second = async_to_sync(classify)()
+
+    assert first.result == second.result == {'topic': 'Payments'}
+    assert second.usage == {'model': 'fake', 'cached': True}
+    assert fake_ai.calls == 2
+
+
+def test_cached_ai_provider_drops_rejected_cached_response():
+    fake_ai = FakeAIProvider(['Payments', 'Other'])
+    ai = CachedAIProvider(fake_ai, 'fake', cache=_response_cache())
+    messages = [{'role': 'user', 'content': 'How do I pay?'}]
+
+    async def ask(condition):
+        return await repeat_until(ai.get_response, messages, max_attempts=2, condition=condition)
+
+    async_to_sync(ask)(lambda response: True)
+    response = async_to_sync(ask)(lambda response: response.result['topic'] == 'Other')
+
+    assert response.result == {'topic': 'Other'}
+    assert fake_ai.calls == 2
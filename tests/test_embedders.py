@@ -0,0 +1,272 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+from asgiref.sync import async_to_sync
+from ollama import ResponseError
+
+from assistant.ai.embedders import batching
+from assistant.ai.embedders.batching import BatchingEmbedder
+from assistant.ai.embedders.ollama import OllamaEmbedder
+from assistant.rag.services import embeddings_service
+from tests.test_cache import FakeEmbedder
+
+
+class FakeOllamaClient:
+
+    def __init__(self, batch_supported=True, failures=0):
+        self.batch_supported = batch_supported
+        self.failures = failures
+        self.embed_calls = []
+        self.embeddings_calls = []
+
+    async def embed(self, model, input):
+        if not self.batch_supported:
+            raise ResponseError('404 page not found', 404)
+        if self.failures:
+            self.failures -= 1
+            raise ResponseError('server busy', 503)
+        self.embed_calls.append(list(input))
+        return {'embeddings': [[float(len(text))] for text in input]}
+
+    async def embeddings(self, model, prompt):
+        self.embeddings_calls.append(prompt)
+        return {'embedding': [float(len(prompt))]}
+
+
+def _embedder(client, **kwargs) -> OllamaEmbedder:
+    embedder = OllamaEmbedder(host='http://ollama', model='nomic-embed-text', **kwargs)
+    embedder._client = client
+    return embedder
+
+
+def test_ollama_embedder_embeds_by_chunks_in_order():
+    client = FakeOllamaClient()
+    embedder = _embedder(client, batch_size=2)
+
+    result = async_to_sync(embedder.embeddings)(['a', 'bb', 'ccc', 'dddd', 'eeeee'])
+
+    assert result == [[1.0], [2.0], [3.0], [4.0], [5.0]]
+    assert sorted(map(len, client.embed_calls)) == [1, 2, 2]
+
+
+def test_ollama_embedder_falls_back_to_single_text_endpoint():
+    client = FakeOllamaClient(batch_supported=False)
+    embedder = _embedder(client, batch_size=2)
+
+    result = async_to_sync(embedder.embeddings)(['a', 'bb', 'ccc'])
+
+    assert result == [[1.0], [2.0], [3.0]]
+    assert sorted(client.embeddings_calls) == ['a', 'bb', 'ccc']
+    assert not embedder._batch_supported
+
+
+def test_ollama_embedder_retries_server_errors(monkeypatch):
+    async def no_sleep(delay):
+        pass
+
+    monkeypatch.setattr('assistant.ai.embedders.ollama.asyncio.sleep', no_sleep)
+    client = FakeOllamaClient(failures=2)
+    embedder = _embedder(client, retries=2)
+
+    assert async_to_sync(embedder.embeddings)(['a']) == [[1.0]]
+
+
+def test_stored_embedder_embeds_only_missing_texts(monkeypatch):
+    store = {}
+    monkeypatch.setattr(embeddings_service, 'get_stored_embeddings',
+                        lambda model, texts: [store.get((model, text)) for text in texts])
+    monkeypatch.setattr(embeddings_service, 'store_embeddings',
+                        lambda model, texts, embeddings: store.update(
+                            {(model, text): e for text, e in zip(texts, embeddings)}))
+    fake = FakeEmbedder()
+    embedder = embeddings_service.StoredEmbedder('model', embedder_factory=lambda model: fake)
+
+    first = async_to_sync(embedder.embeddings)(['a', 'bb', 'a'])
+    second = async_to_sync(embedder.embeddings)(['bb', 'ccc'])
+
+    assert first == [[1.0, 1.0], [2.0, 1.0], [1.0, 1.0]]
+    assert second == [[2.0, 1.0], [3.0, 1.0]]
+    assert fake.calls == [['a', 'bb'], ['ccc']]
+
+
+def test_processed_objects_are_embedded_by_building_models(settings, monkeypatch):
+    settings.EMBEDDING_STORE_ENABLED = False
+    saved = []
+    monkeypatch.setattr(embeddings_service, 'get_building_embedding_models', lambda: ['new-model'])
+    monkeypatch.setattr(embeddings_service, 'save_embeddings', lambda objects, embeddings, **kwargs: saved.append(
+        (objects, embeddings, kwargs)
+    ))
+    embedders = {}
+
+    def embedder_factory(model):
+        embedders[model] = FakeEmbedder()
+        return embedders[model]
+
+    async_to_sync(embeddings_service.save_building_embeddings)(
+        ['q1', 'q2'], ['a', 'bb'], embedder_factory=embedder_factory
+    )
+
+    assert embedders['new-model'].calls == [['a', 'bb']]
+    assert saved == [(
+        ['q1', 'q2'],
+        [[1.0, 1.0], [2.0, 1.0]],
+        {'field': 'embedding', 'model_name': 'new-model', 'side_tables': True},
+    )]
+
+
+def test_batching_embedder_coalesces_concurrent_requests():
+    fake = FakeEmbedder()
+    embedder = BatchingEmbedder(fake, max_delay=0.01, max_batch_size=10)
+
+    async def embed_concurrently():
+        return await asyncio.gather(
+            embedder.embeddings(['a']),
+            embedder.embeddings(['bb', 'a']),
+            embedder.embeddings(['ccc']),
+        )
+
+    result = async_to_sync(embed_concurrently)()
+
+    assert result == [[[1.0, 1.0]], [[2.0, 1.0], [1.0, 1.0]], [[3.0, 1.0]]]
+    assert fake.calls == [['a', 'bb', 'ccc']]
+
+
+def test_batching_embedder_splits_by_max_batch_size():
+    fake = FakeEmbedder()
+    embedder = BatchingEmbedder(fake, max_delay=10, max_batch_size=2)
+
+    result = async_to_sync(embedder.embeddings)(['a', 'bb', 'ccc'])
+
+    assert result == [[1.0, 1.0], [2.0, 1.0], [3.0, 1.0]]
+    assert fake.calls == [['a', 'bb'], ['ccc']]
+
+
+def test_batching_embedder_fails_callers_on_short_result():
+    class ShortEmbedder(FakeEmbedder):
+        async def embeddings(self, input):
+            return (await super().embeddings(input))[:-1]
+
+    embedder = BatchingEmbedder(ShortEmbedder(), max_delay=0.001, max_batch_size=10)
+
+    async def embed_concurrently():
+        return await asyncio.wait_for(
+            asyncio.gather(embedder.embeddings(['a']), embedder.embeddings(['bb']), return_exceptions=True),
+            timeout=1,
+        )
+
+    result = async_to_sync(embed_concurrently)()
+
+    assert all(isinstance(r, ValueError) for r in result)
+
+
+def test_batching_embedder_coalesces_requests_of_separate_event_loops(settings, monkeypatch):
+    from assistant.ai.services import ai_service
+
+    fake = FakeEmbedder()
+    settings.EMBEDDING_BATCH_DELAY_MS = 200
+    monkeypatch.setattr(batching, '_batching_embedders', {})
+    monkeypatch.setattr(ai_service, 'get_ai_embdedder', lambda model: fake)
+    results = {}
+    loops = set()
+
+    async def embed(text):
+        loops.add(id(asyncio.get_running_loop()))
+        return await batching.get_batching_embedder('model').embeddings([text])
+
+    def run(text):
+        # Every async_to_sync call of a thread without a loop runs in a new event loop, like the Celery tasks
+        results[text] = async_to_sync(embed)(text)
+
+    threads = [threading.Thread(target=run, args=(text,)) for text in ('a', 'bb')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert len(loops) == 2
+    assert results == {'a': [[1.0, 1.0]], 'bb': [[2.0, 1.0]]}
+    assert len(fake.calls) == 1
+    assert sorted(fake.calls[0]) == ['a', 'bb']
+
+
+class StubTokenizer:
+    """
+    One token per word with the id of its length, padded with 0.
+    """
+
+    def __call__(self, texts, truncation=True):
+        input_ids = [[len(word) for word in text.split()] for text in texts]
+        return {'input_ids': input_ids, 'attention_mask': [[1] * len(ids) for ids in input_ids]}
+
+    def pad(self, features, return_tensors='pt'):
+        import torch
+
+        length = max(len(ids) for ids in features['input_ids'])
+        return StubBatch(
+            input_ids=torch.tensor([ids + [0] * (length - len(ids)) for ids in features['input_ids']]),
+            attention_mask=torch.tensor([mask + [0] * (length - len(mask)) for mask in features['attention_mask']]),
+        )
+
+
+class StubBatch(dict):
+
+    def to(self, device):
+        return self
+
+
+class StubModel:
+    """
+    The hidden state of a token only depends on its id, the padding tokens get a large one.
+    """
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def __call__(self, input_ids, attention_mask):
+        import torch
+
+        self.batch_sizes.append(len(input_ids))
+        ids = input_ids.float()
+        hidden = torch.stack([ids, ids ** 2], dim=-1)
+        hidden[input_ids == 0] = 1000.
+        return SimpleNamespace(last_hidden_state=hidden)
+
+
+def _transformers_embedder(batch_size):
+    pytest.importorskip('torch')
+    pytest.importorskip('transformers')
+    from assistant.ai.embedders.transformers import TransformersEmbedder
+
+    embedder = TransformersEmbedder.__new__(TransformersEmbedder)
+    embedder._tokenizer = StubTokenizer()
+    embedder._model = StubModel()
+    embedder._device = 'cpu'
+    embedder._batch_size = batch_size
+    return embedder
+
+
+def test_transformers_embedder_returns_embeddings_in_input_order():
+    embedder = _transformers_embedder(batch_size=2)
+
+    result = async_to_sync(embedder.embeddings)(['aaa bb c dddd', 'a', 'bb ccc', 'dd'])
+
+    assert result == [
+        pytest.approx([2.5, 7.5]),
+        pytest.approx([1., 1.]),
+        pytest.approx([2.5, 6.5]),
+        pytest.approx([2., 4.]),
+    ]
+    # Sorted by length: ['a', 'dd'] and ['bb ccc', 'aaa bb c dddd']
+    assert embedder._model.batch_sizes == [2, 2]
+
+
+def test_transformers_embedder_ignores_padding():
+    embedder = _transformers_embedder(batch_size=8)
+
+    alone = async_to_sync(embedder.embeddings)(['bb ccc'])
+    batched = async_to_sync(embedder.embeddings)(['bb ccc', 'a bb ccc dddd eeeee ffffff'])
+
+    assert batched[0] == pytest.approx(alone[0])
+    assert embedder._model.batch_sizes == [1, 2]
@@ -0,0 +1,56 @@
+from asgiref.sync import async_to_sync
+
+from assistant.ai.utils.http import get_http_session, close_http_sessions, closing_http_sessions, get_loop_client
+
+
+def test_http_session_is_shared_in_event_loop():
+    async def sessions():
+        first, second = get_http_session(), get_http_session()
+        await close_http_sessions()
+        return first, second
+
+    first, second = async_to_sync(sessions)()
+
+    assert first is second
+    assert first.closed
+
+
+def test_closing_http_sessions_closes_sessions_of_coroutine():
+    @closing_http_sessions
+    async def use_session():
+        return get_http_session()
+
+    session = async_to_sync(use_session)()
+
+    assert session.closed
+
+
+class FakeClient:
+
+    def __init__(self):
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+def test_loop_clients_are_shared_by_key_in_event_loop():
+    @closing_http_sessions
+    async def clients():
+        return (
+            get_loop_client('a', FakeClient),
+            get_loop_client('a', FakeClient),
+            get_loop_client('b', FakeClient),
+        )
+
+    first, second, other = async_to_sync(clients)()
+    next_loop_client = async_to_sync(closing_http_sessions(clients))()[0]
+
+    assert first is second
+    assert first is not other
+    assert first is not next_loop_client
+    assert first.closed and other.closed
+
+
+def test_loop_client_outside_event_loop_is_not_cached():
+    assert get_loop_client('a', FakeClient) is not get_loop_client('a', FakeClient)
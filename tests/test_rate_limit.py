@@ -0,0 +1,50 @@
+from asgiref.sync import async_to_sync
+
+from assistant.utils.rate_limit import LocalRateLimitBackend, RateLimiter, RateLimitBackend, get_rate_limiter
+
+
+class FailingBackend(RateLimitBackend):
+
+    def reserve(self, key, capacity, rate, amount):
+        raise ConnectionError('Redis is down')
+
+
+def test_local_backend_queues_reservations_in_order(mocker):
+    mocker.patch('assistant.utils.rate_limit.time.monotonic', return_value=100)
+    backend = LocalRateLimitBackend()
+
+    delays = [backend.reserve('key', capacity=2, rate=1, amount=1) for _ in range(4)]
+
+    assert delays == [0, 0, 1, 2]
+
+
+def test_rate_limiter_waits_for_requests_and_tokens(mocker):
+    mocker.patch('assistant.utils.rate_limit.time.monotonic', return_value=100)
+    sleep = mocker.patch('assistant.utils.rate_limit.asyncio.sleep')
+    limiter = RateLimiter('model', rpm=60, tpm=600)
+
+    async def call(tokens, used_tokens):
+        async with limiter.limit(tokens) as usage:
+            usage.tokens = used_tokens
+
+    async_to_sync(call)(500, 300)
+    async_to_sync(call)(500, 500)
+
+    # 200 of the reserved tokens were given back, the second call is 200 tokens short at 10 tokens per second
+    sleep.assert_called_once_with(20.0)
+
+
+def test_rate_limiter_falls_back_to_process_limits():
+    limiter = RateLimiter('model', rpm=60, backend=FailingBackend())
+
+    async_to_sync(limiter.acquire)()
+
+
+def test_rate_limiter_by_model_prefix(settings):
+    settings.AI_RATE_LIMITS = {'groq:': {'rpm': 30}, 'groq:llama-3.1-70b': {'rpm': 10, 'tpm': 1000}}
+    get_rate_limiter.cache_clear()
+
+    assert get_rate_limiter('groq:llama-3.1-70b-versatile').rpm == 10
+    assert get_rate_limiter('groq:llama-3.1-8b-instant').rpm == 30
+    assert not get_rate_limiter('gpt-4o').enabled
+    get_rate_limiter.cache_clear()
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+from asgiref.sync import async_to_sync
+
+from assistant.ai.domain import AIResponse
+from assistant.ai.providers.base import AIProvider
+from assistant.ai.providers.routing import RoutingAIProvider, CircuitBreaker, get_model_route
+
+
+class FakeAIProvider(AIProvider):
+
+    context_size = 1024
+
+    def __init__(self, name, delay=0., error=None):
+        self.name = name
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+        self.cancelled = False
+
+    def calculate_tokens(self, text: str) -> int:
+        return len(text)
+
+    async def get_response(self, messages, max_tokens=1024, json_format=False) -> AIResponse:
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.error:
+            raise self.error
+        return AIResponse(result=self.name, usage={'model': self.name})
+
+
+def _router(*providers, **kwargs) -> RoutingAIProvider:
+    return RoutingAIProvider(
+        models=[p.name for p in providers], providers={p.name: p for p in providers}, **kwargs
+    )
+
+
+def test_routing_provider_hedges_slow_primary(settings):
+    settings.AI_ROUTING_HEDGE_DELAY = 0.01
+    slow = FakeAIProvider('hedge-slow', delay=1)
+    fast = FakeAIProvider('hedge-fast')
+
+    response = async_to_sync(_router(slow, fast).get_response)([])
+
+    assert response.result == 'hedge-fast'
+    assert slow.cancelled
+
+
+def test_routing_provider_does_not_hedge_fast_primary(settings):
+    settings.AI_ROUTING_HEDGE_DELAY = 1
+    primary = FakeAIProvider('fast-primary')
+    secondary = FakeAIProvider('fast-secondary')
+
+    response = async_to_sync(_router(primary, secondary).get_response)([])
+
+    assert response.result == 'fast-primary'
+    assert secondary.calls == 0
+
+
+def test_routing_provider_fails_over_and_opens_circuit(settings):
+    settings.AI_ROUTING_FAILURE_THRESHOLD = 2
+    broken = FakeAIProvider('failover-broken', error=ConnectionError('down'))
+    backup = FakeAIProvider('failover-backup')
+    router = _router(broken, backup, hedging=False)
+
+    for _ in range(3):
+        assert async_to_sync(router.get_response)([]).result == 'failover-backup'
+
+    assert broken.calls == 2
+    assert get_model_route('failover-broken').circuit_breaker.is_open
+
+
+def test_routing_provider_raises_when_all_fail():
+    router = _router(FakeAIProvider('all-fail', error=ValueError('bad')), hedging=False)
+
+    with pytest.raises(ValueError):
+        async_to_sync(router.get_response)([])
+
+
+def test_circuit_breaker_lets_trial_request_after_timeout(mocker):
+    monotonic = mocker.patch('assistant.ai.providers.routing.time.monotonic', return_value=100)
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+
+    assert not breaker.allow()
+    monotonic.return_value = 130
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.allow()
+
+
+def test_routing_provider_keeps_trial_request_of_unused_models(settings):
+    settings.AI_ROUTING_HEDGE_DELAY = 1
+    primary = FakeAIProvider('trial-primary')
+    secondary = FakeAIProvider('trial-secondary')
+    circuit_breaker = get_model_route('trial-secondary').circuit_breaker
+    for _ in range(circuit_breaker.failure_threshold):
+        circuit_breaker.record_failure()
+    circuit_breaker._opened_at -= circuit_breaker.reset_timeout
+
+    assert async_to_sync(_router(primary, secondary).get_response)([]).result == 'trial-primary'
+
+    # The half-open circuit still lets the trial request through
+    assert circuit_breaker.allow()
@@ -0,0 +1,84 @@
+import asyncio
+
+from asgiref.sync import async_to_sync
+
+from assistant.bot.models import Bot
+from assistant.bot.services.context_service.state import ContextProcessingState
+from assistant.bot.services.context_service.steps.embeddings import ScopedEmbeddingsStep
+from assistant.rag.services.search_service import scope_queryset
+from assistant.storage.models import WikiDocument, Question
+
+
+class FakeScopedEmbeddingsStep(ScopedEmbeddingsStep):
+
+    def __init__(self, results, **kwargs):
+        super().__init__(**kwargs)
+        self.results = results
+        self.searches = []
+
+    async def _cached_search(self, search_query, qs, scope, debug_info=None):
+        self.searches.append(scope)
+        return self.results[scope]
+
+
+def make_topic(**kwargs) -> WikiDocument:
+    topic = WikiDocument(**kwargs)
+    topic._state.adding = False
+    return topic
+
+
+def make_step(settings, results):
+    settings.TOPIC_SCOPED_SEARCH = True
+    settings.TOPIC_SEARCH_MIN_HITS = 2
+    settings.OLLAMA_ENDPOINT = 'http://localhost:11434'
+    state = ContextProcessingState()
+    state.messages = [{'role': 'user', 'content': 'How to install?'}]
+    state.query_embedding = [1.0, 0.0]
+    step = FakeScopedEmbeddingsStep(
+        results, bot=Bot(id=1), state=state, fast_ai_model='llama3.1', strong_ai_model='llama3.1', debug_info={},
+    )
+    return step, state
+
+
+async def classify(state, topic):
+    state.topic = topic
+    state.classified.set()
+
+
+def test_scoped_search_skips_whole_bot_search(settings):
+    topic = make_topic(id=7, tree_id=3, lft=1, rght=10)
+    step, state = make_step(settings, {'all': (['q0'], ['d0']), 'topic:7': (['q1', 'q2'], ['d1'])})
+
+    async def run():
+        await asyncio.gather(classify(state, topic), step.run())
+
+    async_to_sync(run)()
+
+    assert state.related_questions == ['q1', 'q2']
+    assert state.documents == ['d1']
+    assert step.searches == ['topic:7']
+
+
+def test_whole_bot_search_is_used_without_topic_or_hits(settings):
+    topic = make_topic(id=7, tree_id=3, lft=1, rght=10)
+    for classified_topic in (None, topic):
+        step, state = make_step(settings, {'all': (['q0'], ['d0']), 'topic:7': (['q1'], ['d1'])})
+
+        async def run():
+            await asyncio.gather(classify(state, classified_topic), step.run())
+
+        async_to_sync(run)()
+
+        assert state.related_questions == ['q0']
+        assert step.searches == (['topic:7', 'all'] if classified_topic else ['all'])
+
+
+def test_scope_queryset_by_stable_wiki_ids():
+    qs = Question.objects.values('id')
+
+    node = make_topic(id=2, tree_id=3, lft=2, rght=5, parent_id=1)
+    where = str(scope_queryset(qs, node).query)
+
+    # The subtree comes from the wikis themselves, the questions only keep their wiki id
+    assert '"wiki_id" IN (SELECT' in where
+    assert '"tree_id" = 3' in where and '"lft" >= 2' in where and '"lft" <= 5' in where
@@ -0,0 +1,110 @@
+from types import SimpleNamespace
+
+import pytest
+from asgiref.sync import async_to_sync
+
+from assistant.ai.domain import AIResponse, AIResponseDelta, collect_response
+from assistant.ai.providers.base import AIProvider
+from assistant.ai.providers.cached import CachedAIProvider
+from assistant.bot.chat_completion import ChatCompletion
+from assistant.bot.domain import SingleAnswer
+from assistant.bot.platforms.telegram.stream import TelegramAnswerStream
+from assistant.utils.bulkhead import Bulkhead
+
+
+class FakeProvider(AIProvider):
+
+    context_size = 1024
+
+    def calculate_tokens(self, text: str) -> int:
+        return len(text)
+
+    async def get_response(self, messages, max_tokens=1024, json_format=False) -> AIResponse:
+        return AIResponse(result='Hello', usage={'model': 'fake'}, length_limited=True)
+
+
+class FakeTelegramBot:
+
+    def __init__(self):
+        self.sent = []
+        self.edited = []
+        self.deleted = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append(text)
+        return SimpleNamespace(message_id=1)
+
+    async def edit_message_text(self, chat_id, message_id, text, **kwargs):
+        self.edited.append((text, kwargs.get('parse_mode')))
+
+    async def delete_message(self, chat_id, message_id):
+        self.deleted.append(message_id)
+
+
+def test_collect_response_joins_deltas():
+    async def deltas():
+        yield AIResponseDelta(text=' Hel')
+        yield AIResponseDelta(text='lo ')
+        yield AIResponseDelta(usage={'model': 'fake'}, length_limited=True, done=True)
+
+    response = async_to_sync(collect_response)(deltas())
+
+    assert response == AIResponse(result='Hello', usage={'model': 'fake'}, length_limited=True)
+
+
+def test_provider_without_streaming_yields_single_delta():
+    response = async_to_sync(collect_response)(FakeProvider().get_response_stream([]))
+
+    assert response == AIResponse(result='Hello', usage={'model': 'fake'}, length_limited=True)
+
+
+def test_telegram_answer_stream_edits_draft_into_answer():
+    bot = FakeTelegramBot()
+    stream = TelegramAnswerStream(bot, '1', edit_interval=0, min_length=3)
+
+    async def run():
+        await stream.update('He')
+        await stream.update('Hello')
+        await stream._wait_update()
+        await stream.update('Hello, world')
+        return await stream.finish(SingleAnswer('Hello, world!'))
+
+    assert async_to_sync(run)()
+    assert bot.sent == ['Hello']
+    assert bot.edited[0] == ('Hello, world', None)
+    assert bot.edited[-1][1] == 'MarkdownV2'
+    assert not bot.deleted
+
+
+def test_telegram_answer_stream_removes_draft_of_unsupported_answer():
+    bot = FakeTelegramBot()
+    stream = TelegramAnswerStream(bot, '1', edit_interval=0, min_length=0)
+
+    async def run():
+        await stream.update('Hello')
+        return await stream.finish(SingleAnswer('Hello', reply_keyboard=[[]]))
+
+    assert not async_to_sync(run)()
+    assert bot.deleted == [1]
+
+
+def test_abandoned_stream_releases_concurrency_slot():
+    bulkhead = Bulkhead('test:stream', limit=1)
+
+    class StreamingProvider(FakeProvider):
+
+        async def get_response_stream(self, messages, max_tokens=1024):
+            async with bulkhead:
+                yield AIResponseDelta(text='Hel')
+                yield AIResponseDelta(text='lo', done=True)
+
+    async def on_delta(text):
+        raise ConnectionError('Client is gone')
+
+    async def run():
+        with pytest.raises(ConnectionError):
+            await ChatCompletion._stream_response(CachedAIProvider(StreamingProvider(), 'fake'), [], on_delta)
+        # Released by closing the streams, not by their garbage collection
+        return bulkhead.stats.in_flight
+
+    assert async_to_sync(run)() == 0
@@ -0,0 +1,74 @@
+import pytest
+from asgiref.sync import async_to_sync
+
+from assistant.ai.providers.ollama import OllamaAIProvider
+from assistant.ai.services import token_service
+from assistant.ai.services.token_service import EstimatingTokenCounter, ModelLimits, get_model_limits
+
+
+def test_model_limits_by_longest_prefix(settings):
+    settings.AI_MODEL_LIMITS = {'llama3.1:70b': (32000, 2048)}
+    token_service.get_model_limits_table.cache_clear()
+
+    assert get_model_limits('gpt-4o-mini') == ModelLimits(128000, 16384)
+    assert get_model_limits('gpt-4-0613') == ModelLimits(8192, 4096)
+    assert get_model_limits('groq:llama3-70b-8192') == ModelLimits(8192, 8192)
+    assert get_model_limits('ollama:llama3.1:8b') == ModelLimits(131072, 8192)
+    assert get_model_limits('llama3.1:70b') == ModelLimits(32000, 2048)
+    assert get_model_limits('unknown') == token_service.DEFAULT_MODEL_LIMITS
+
+
+def test_estimating_counter_counts_cyrillic_denser():
+    counter = EstimatingTokenCounter()
+
+    assert counter.count('Hello, world!') == 6
+    assert counter.count('Привет, мир!') == 5
+    assert counter.count('Документация по установке') > len('Документация по установке'.split())
+    assert counter.count_batch(['', 'a b']) == [0, 2]
+
+
+def test_unknown_tokenizer_falls_back_to_estimation(settings):
+    settings.AI_MODEL_TOKENIZERS = {'custom': 'unknown:tokenizer'}
+    token_service.get_token_counter.cache_clear()
+
+    assert isinstance(token_service.get_token_counter('custom-model'), EstimatingTokenCounter)
+    assert token_service.count_tokens_batch('custom-model', ['Hello world', 'Привет']) == [4, 2]
+
+
+def test_openai_models_are_counted_with_bundled_encodings(monkeypatch):
+    tiktoken = pytest.importorskip('tiktoken')
+    monkeypatch.delenv('TIKTOKEN_CACHE_DIR', raising=False)
+    token_service.get_token_counter.cache_clear()
+
+    def offline(*args, **kwargs):
+        raise AssertionError('The encodings must not be downloaded')
+
+    monkeypatch.setattr('tiktoken.load.read_file', offline)
+    counter = token_service.get_token_counter('gpt-4o-mini')
+
+    assert isinstance(counter, token_service.TiktokenCounter)
+    assert counter.count_batch(['Hello, world!']) == [len(tiktoken.get_encoding('o200k_base').encode('Hello, world!'))]
+    assert token_service.get_token_counter('gpt-4').count('Hello, world!') == 4
+
+
+class FakeOllamaClient:
+
+    def __init__(self):
+        self.options = None
+
+    async def chat(self, model, messages, options, **kwargs):
+        self.options = options
+        return {'model': model, 'message': {'content': 'Hello'}, 'done': True}
+
+
+def test_ollama_context_size_is_sent_as_num_ctx(settings):
+    settings.OLLAMA_NUM_CTX = 16384
+    token_service.get_model_limits_table.cache_clear()
+    client = FakeOllamaClient()
+    provider = OllamaAIProvider(model='llama3.1:8b', host='http://localhost:11434', client=client)
+
+    async_to_sync(provider.get_response)([{'role': 'user', 'content': 'Hi'}], max_tokens=100)
+
+    assert provider.context_size == 16384
+    assert client.options['num_ctx'] == 16384
+    assert client.options['num_predict'] == 100